@@ -0,0 +1,213 @@
+"""Throughput benchmarks for the lacrm client
+
+Starts a local stand-in for the LACRM API and times the client against it:
+
+    python -m benchmarks.run --contacts 20000 --latency 0.02 \\
+        --output bench_results.json
+
+The stand-in runs in a child process. Each scenario is run once for timing
+(records/sec, requests, p50/p99 request latency) and once more under
+tracemalloc for peak Python memory, since tracing slows the client down;
+``--no-memory`` skips the second pass. Results are written as JSON so
+releases can be compared; ``--compare previous.json`` exits non-zero when
+any scenario's records/sec dropped by more than ``--tolerance``.
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.server import StandInProcess
+from lacrm import Lacrm
+from lacrm._version import __version__
+from lacrm.ratelimit import RetryPolicy
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def make_client(url, concurrency, error_rate):
+    client = Lacrm(user_code='bench', api_token='bench',
+                   pool_maxsize=max(10, concurrency),
+                   retry=RetryPolicy(backoff=0.01) if error_rate else None)
+    client.endpoint_url = url
+    latencies = []
+    lock = threading.Lock()
+
+    def record(event):
+        with lock:
+            latencies.append(event.elapsed)
+
+    client.add_hook('after_response', record)
+    return client, latencies
+
+
+def peak_memory(url, args, concurrency, work):
+    """ Reruns a scenario under tracemalloc, returning peak bytes """
+
+    client, _ = make_client(url, concurrency, args.error_rate)
+    tracemalloc.start()
+    try:
+        work(client)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        client.close()
+
+
+def measure(name, url, args, concurrency, work):
+    """ Runs ``work(client)`` (which returns a record count) and times it """
+
+    client, latencies = make_client(url, concurrency, args.error_rate)
+    started = time.perf_counter()
+    try:
+        records = work(client)
+    finally:
+        elapsed = time.perf_counter() - started
+        client.close()
+
+    peak = 0 if args.no_memory else peak_memory(url, args, concurrency, work)
+
+    result = {'scenario': name,
+              'concurrency': concurrency,
+              'records': records,
+              'requests': len(latencies),
+              'seconds': round(elapsed, 4),
+              'records_per_sec': round(records / elapsed, 1) if elapsed else 0,
+              'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+              'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+              'peak_memory_kb': peak // 1024}
+    print('{scenario:<24} c={concurrency:<3} {records:>7} records '
+          '{records_per_sec:>10}/s  p50 {p50_ms}ms  p99 {p99_ms}ms  '
+          'peak {peak_memory_kb}KB'.format(**result))
+    return result
+
+
+def scenarios(args):
+    contact_ids = [str(100000 + i) for i in range(min(args.contacts, 1000))]
+
+    def get_all_contacts(concurrency):
+        return lambda client: len(client.get_all_contacts(
+            concurrency=concurrency))
+
+    def iter_contacts(concurrency):
+        return lambda client: sum(1 for _ in client.iter_contacts(
+            concurrency=concurrency))
+
+    def get_all_pipeline_report(concurrency):
+        return lambda client: len(client.get_all_pipeline_report(
+            'pipeline', status='all', concurrency=concurrency))
+
+    def single_reads(concurrency):
+        def work(client):
+            ids = [contact_ids[i % len(contact_ids)]
+                   for i in range(args.reads)]
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                return len(list(executor.map(client.get_contact, ids)))
+        return work
+
+    def bulk_writes(concurrency):
+        def work(client):
+            operations = [('create_note', contact_ids[i % len(contact_ids)],
+                           'Benchmark note {}'.format(i))
+                          for i in range(args.writes)]
+            report = client.bulk(operations, concurrency=concurrency)
+            return report.summary()['succeeded']
+        return work
+
+    for concurrency in args.concurrency:
+        yield 'get_all_contacts', concurrency, get_all_contacts(concurrency)
+        yield 'iter_contacts', concurrency, iter_contacts(concurrency)
+        if concurrency == 1:
+            yield 'stream_contacts', 1, lambda client: sum(
+                1 for _ in client.iter_contacts(stream=True))
+        yield ('get_all_pipeline_report', concurrency,
+               get_all_pipeline_report(concurrency))
+        yield 'get_contact', concurrency, single_reads(concurrency)
+        yield 'bulk_create_note', concurrency, bulk_writes(concurrency)
+
+
+def regressions(baseline, results, tolerance):
+    """ Lists scenarios whose throughput fell below the baseline's """
+
+    previous = dict(((r['scenario'], r['concurrency']), r['records_per_sec'])
+                    for r in baseline['results'])
+    slower = []
+    for result in results:
+        before = previous.get((result['scenario'], result['concurrency']))
+        if before and result['records_per_sec'] < before * (1 - tolerance):
+            slower.append('{} c={}: {} -> {} records/sec'.format(
+                result['scenario'], result['concurrency'], before,
+                result['records_per_sec']))
+    return slower
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--contacts', type=int, default=10000)
+    parser.add_argument('--pipeline-items', type=int, default=5000)
+    parser.add_argument('--reads', type=int, default=500)
+    parser.add_argument('--writes', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help='seconds added to every stand-in response')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--page-size', type=int, default=500,
+                        help='largest page the stand-in will serve')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 8])
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip the tracemalloc pass')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', metavar='RESULTS_JSON',
+                        help='earlier results to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed fractional drop in records/sec')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = StandInProcess(contacts=args.contacts,
+                            pipeline_items=args.pipeline_items,
+                            latency=args.latency, jitter=args.jitter,
+                            error_rate=args.error_rate,
+                            max_page_size=args.page_size)
+
+    with server:
+        results = [measure(name, server.url, args, concurrency, work)
+                   for name, concurrency, work in scenarios(args)]
+
+    report = {'lacrm_version': __version__,
+              'python': platform.python_version(),
+              'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'config': vars(args),
+              'results': results}
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+    print('Wrote {}'.format(args.output))
+
+    if args.compare:
+        with open(args.compare) as previous:
+            slower = regressions(json.load(previous), results, args.tolerance)
+        for line in slower:
+            print('REGRESSION ' + line)
+        if slower:
+            sys.exit(1)
+
+    return report
+
+
+if __name__ == '__main__':
+    main()
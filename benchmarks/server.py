@@ -0,0 +1,197 @@
+"Local stand-in for api.lessannoyingcrm.com used by the benchmarks"
+
+import json
+import multiprocessing
+import random
+import threading
+import time
+try:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs
+
+    class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+WRITE_RESPONSES = {'CreateContact': 'ContactId',
+                   'CreateNote': 'NoteId',
+                   'CreateTask': 'TaskId',
+                   'CreateEvent': 'EventId',
+                   'CreatePipeline': 'PipelineItemId'}
+
+
+def make_contact(index):
+    return {'ContactId': str(100000 + index),
+            'FirstName': 'First{}'.format(index),
+            'LastName': 'Last{}'.format(index),
+            'CompanyName': 'Company{}'.format(index % 250),
+            'DateEntered': '2017-01-01 00:00:{:02d}'.format(index % 60),
+            'Email': [{'Text': 'user{}@example.com'.format(index),
+                       'Type': 'Work'}],
+            'Phone': [{'Text': '555-{:04d}'.format(index % 10000),
+                       'Type': 'Work'}],
+            'Address': [{'Street': '{} Main St'.format(index),
+                         'City': 'Springfield', 'State': 'IL',
+                         'Zip': '62701', 'Country': 'United States',
+                         'Type': 'Work'}],
+            'CustomFields': {'Tier': ('gold', 'silver', 'bronze')[index % 3],
+                             'Score': str(index % 100)}}
+
+
+def make_pipeline_item(index):
+    return {'PipelineItemId': str(500000 + index),
+            'ContactId': str(100000 + index),
+            'Status': ('Lead', 'Qualified', 'Won', 'Lost')[index % 4],
+            'Priority': ('Low', 'Medium', 'High')[index % 3],
+            'LastUpdate': '2017-06-01 12:00:00',
+            'UserId': str(index % 7)}
+
+
+class StandInServer(object):
+    """Threaded HTTP server mimicking the LACRM API
+
+    ``latency`` (seconds, plus up to ``jitter``) is added to every request
+    and ``error_rate`` of them fail with a 500. ``max_page_size`` caps
+    ``NumRows`` the way the real API does.
+    """
+
+    def __init__(self, contacts=10000, pipeline_items=5000, latency=0.0,
+                 jitter=0.0, error_rate=0.0, max_page_size=500,
+                 host='127.0.0.1', port=0):
+        self.contacts = [make_contact(i) for i in range(contacts)]
+        self.contacts_by_id = dict((c['ContactId'], c) for c in self.contacts)
+        self.pipeline_items = [make_pipeline_item(i)
+                               for i in range(pipeline_items)]
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_page_size = max_page_size
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _page(self, records, parameters):
+        num_rows = min(int(parameters.get('NumRows', 25)),
+                       self.max_page_size)
+        page = int(parameters.get('Page', 1))
+        start = (page - 1) * num_rows
+        return records[start:start + num_rows]
+
+    def respond(self, function, parameters):
+        """ Returns ``(status, body)`` for one API call """
+
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            return 500, {}
+
+        if function == 'SearchContacts':
+            return 200, {'Success': True,
+                         'Result': self._page(self.contacts, parameters)}
+        if function == 'GetPipelineReport':
+            return 200, {'Success': True,
+                         'Result': self._page(self.pipeline_items,
+                                              parameters)}
+        if function == 'GetContact':
+            contact = self.contacts_by_id.get(str(parameters.get('ContactId')))
+            return 200, {'Success': True, 'Contact': contact}
+        if function in WRITE_RESPONSES:
+            with self._lock:
+                new_id = str(900000 + self.requests)
+            return 200, {'Success': True, WRITE_RESPONSES[function]: new_id}
+
+        return 200, {'Success': True}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                length = int(self.headers.get('Content-Length', 0))
+                form = parse_qs(self.rfile.read(length).decode('utf-8'))
+                parameters = json.loads(form.get('Parameters', ['{}'])[0])
+                status, body = server.respond(form.get('Function', [''])[0],
+                                              parameters)
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _serve(config, ready):
+    server = StandInServer(**config)
+    ready.put(server.url)
+    server._httpd.serve_forever()
+
+
+class StandInProcess(object):
+    """Runs a StandInServer in a child process
+
+    Keeps the server's CPU time and allocations out of the benchmarked
+    process. Usable as a context manager; ``url`` is set once started.
+    """
+
+    def __init__(self, **config):
+        self.config = config
+        self.url = None
+        self._process = None
+
+    def start(self):
+        ready = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target=_serve,
+                                                args=(self.config, ready))
+        self._process.daemon = True
+        self._process.start()
+        self.url = ready.get(timeout=60)
+        return self
+
+    def stop(self):
+        self._process.terminate()
+        self._process.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -1,3 +1,9 @@
 "lacrm package"
 
 from lacrm.api import Lacrm  # noqa
+from lacrm.pool import LacrmPool  # noqa
+
+try:
+    from lacrm.aio import AsyncLacrm  # noqa
+except SyntaxError:  # pragma: no cover - Python 2 has no async/await
+    pass
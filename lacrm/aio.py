@@ -0,0 +1,522 @@
+"Asyncio client for lacrm"
+
+import asyncio
+from lacrm.api import urlencode
+from lacrm.base import BaseLacrm, READ_METHODS, _merge_search_results
+from lacrm.bulk import BulkReport, BulkResult, prepare_operations
+from lacrm.metrics import CallEvent
+from lacrm.columnar import to_columnar
+from lacrm.pagination import PagePlan, MAX_PAGE_SIZE
+from lacrm.singleflight import SingleFlight
+from lacrm.utils import Deadline, LacrmTimeoutError, _clock
+
+try:
+    import aiohttp
+    CONNECTION_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+except ImportError:  # pragma: no cover - optional dependency
+    aiohttp = None
+    CONNECTION_ERRORS = (ConnectionError, asyncio.TimeoutError)
+
+try:
+    import contextvars
+except ImportError:  # Python 3.6
+    contextvars = None
+
+# Duration of the last successful request made in the current task, so that
+# a page's latency leaves out rate-limit waits and retries. Without
+# contextvars, pages are timed whole.
+if contextvars is not None:
+    _request_time = contextvars.ContextVar('lacrm_request_time',
+                                           default=None)
+else:  # pragma: no cover - Python 3.6
+    _request_time = None
+
+
+class AsyncLacrm(BaseLacrm):
+    """Less Annoying CRM Instance for asyncio
+
+    AsyncLacrm exposes the same methods as Lacrm, but every API method is a
+    coroutine. Requests go through a pooled ``aiohttp.ClientSession`` and,
+    when ``max_concurrency`` is set, a semaphore bounds how many requests
+    are in flight at once.
+
+    Both share BaseLacrm, so parameter validation and response mapping are
+    the same, and a given method accepts and returns exactly what its
+    blocking counterpart does. Client options are those of Lacrm.
+    """
+
+    def __init__(self, user_code=None, api_token=None, session=None,
+                 pool_maxsize=100, pool_maxsize_per_host=0, keep_alive=True,
+                 max_concurrency=None, **options):
+
+        super(AsyncLacrm, self).__init__(user_code, api_token, **options)
+
+        if session is None and aiohttp is None:
+            raise ImportError('AsyncLacrm requires aiohttp '
+                              '(pip install lacrm[async]).')
+
+        self._owns_session = session is None
+        self.session = session
+        self._connector_options = {'limit': pool_maxsize,
+                                   'limit_per_host': pool_maxsize_per_host,
+                                   'force_close': not keep_alive}
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._index_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def __enter__(self):
+        raise TypeError('Use "async with" with AsyncLacrm.')
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass  # pragma: no cover
+
+    def _get_session(self):
+        """ Lazily opens the aiohttp session inside the running loop """
+
+        if self.session is None:
+            connector = aiohttp.TCPConnector(**self._connector_options)
+            self.session = aiohttp.ClientSession(connector=connector)
+
+        return self.session
+
+    def _get_semaphore(self):
+        """ Lazily creates the concurrency semaphore inside the running loop """
+
+        if self._semaphore is None and self.max_concurrency:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        return self._semaphore
+
+    async def close(self):
+        """ Releases pooled connections held by this instance's session """
+
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _post(self, method_payload):
+        """ Posts a payload and returns the status code, raw body and
+        Retry-After header """
+
+        session = self._get_session()
+        async with session.post(self.endpoint_url,
+                                data=method_payload) as response:
+            status_code = response.status
+            content = await response.read()
+
+        return status_code, content, response.headers.get('Retry-After')
+
+    async def _limited_post(self, method_payload, timeout):
+        """ Posts a payload within the ``max_concurrency`` limit; the
+        timeout starts once the request is allowed to go out """
+
+        semaphore = self._get_semaphore()
+        if semaphore is None:
+            return await asyncio.wait_for(self._post(method_payload), timeout)
+        async with semaphore:
+            return await asyncio.wait_for(self._post(method_payload), timeout)
+
+    async def _hedged_post(self, api_method, method_payload, timeout):
+        """ Posts a read, sending a duplicate if the first is slow """
+
+        attempts = [asyncio.ensure_future(
+            self._limited_post(method_payload, timeout))]
+        done, _ = await asyncio.wait(attempts,
+                                     timeout=self.hedge.delay(api_method))
+        if not done:
+            attempts.append(asyncio.ensure_future(
+                self._limited_post(method_payload, timeout)))
+
+        pending = set(attempts)
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    if len(attempts) > 1:
+                        self.hedge.record_hedge(won=task is attempts[1])
+                    return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        if len(attempts) > 1:
+            self.hedge.record_hedge(won=False)
+        raise error
+
+    async def _send(self, api_method, method_payload, timeout=None,
+                    deadline=None):
+        """ Posts a payload, applying concurrency limits, rate limits,
+        retries and timeouts """
+
+        if timeout is None:
+            timeout = self.timeout
+
+        hedged = self.hedge is not None and api_method in READ_METHODS
+
+        attempt = 0
+        while True:
+            self._check_breaker(api_method)
+            # Anything raised before the breaker hears back counts as a
+            # failed attempt, so a half-open trial is always released
+            recorded = False
+            try:
+                if self.rate_limiter is not None:
+                    delay = self.rate_limiter.reserve()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+                request_timeout = timeout
+                if deadline is not None:
+                    request_timeout = deadline.clip(timeout)
+                if isinstance(request_timeout, tuple):
+                    request_timeout = sum(request_timeout)
+
+                hooks = self.hooks
+                if hooks:
+                    hooks.emit('before_request', api_method, method_payload)
+                started = _clock()
+
+                try:
+                    if hedged:
+                        status_code, content, retry_after = \
+                            await self._hedged_post(api_method, method_payload,
+                                                    request_timeout)
+                    else:
+                        status_code, content, retry_after = \
+                            await self._limited_post(method_payload,
+                                                     request_timeout)
+                except CONNECTION_ERRORS as error:
+                    recorded = True
+                    self._record_status(None)
+                    if hooks:
+                        hooks.emit('on_error', CallEvent(
+                            api_method, attempt, _clock() - started,
+                            len(urlencode(method_payload)), error=error))
+                    delay = self._next_retry_delay(api_method, attempt)
+                    if delay is None:
+                        if isinstance(error, asyncio.TimeoutError):
+                            raise LacrmTimeoutError(
+                                content='{} timed out'.format(api_method))
+                        raise
+                else:
+                    recorded = True
+                    self._record_status(status_code)
+                    if hooks:
+                        hooks.emit('after_response', CallEvent(
+                            api_method, attempt, _clock() - started,
+                            len(urlencode(method_payload)), status_code,
+                            len(content)))
+                    if status_code == 200:
+                        elapsed = _clock() - started
+                        if _request_time is not None:
+                            _request_time.set(elapsed)
+                        if hedged:
+                            self.hedge.observe(api_method, elapsed)
+                        return status_code, self.codec.loads(content)
+
+                    delay = self._next_retry_delay(api_method, attempt,
+                                                   status_code, retry_after)
+                    if delay is None:
+                        return status_code, None
+            except BaseException:
+                if not recorded:
+                    self._record_status(None)
+                raise
+
+            if deadline is not None and delay >= deadline.remaining():
+                raise LacrmTimeoutError(content='deadline exceeded while '
+                                        'retrying {}'.format(api_method))
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _call_api(self, api_method, parameters, raw_response=False,
+                        timeout=None, deadline=None, records=False,
+                        snapshot=None):
+        """ Posts a single API call and parses its response """
+
+        parameters, body = self._answer_locally(api_method, parameters,
+                                                snapshot)
+        if body is not None:
+            return self._parse_response(api_method, 200, body, raw_response,
+                                        records)
+
+        async def fetch():
+            method_payload = self._build_payload(api_method, parameters)
+            status_code, body = await self._send(api_method, method_payload,
+                                                 timeout, deadline)
+            if status_code == 200:
+                self._remember(api_method, parameters, body)
+            return status_code, body
+
+        if self.singleflight is None:
+            status_code, body = await fetch()
+        elif api_method in READ_METHODS:
+            status_code, body = await self._coalesce(api_method, parameters,
+                                                     fetch, deadline)
+        else:
+            try:
+                status_code, body = await fetch()
+            finally:
+                self.singleflight.invalidate()
+
+        return self._parse_response(api_method, status_code, body,
+                                    raw_response, records)
+
+    async def _coalesce(self, api_method, parameters, fetch, deadline):
+        """ Awaits ``fetch()``, or an identical read already in flight """
+
+        key = SingleFlight.key(api_method, parameters)
+        call, leader = self.singleflight.join(key, asyncio.Event)
+        if not leader:
+            if self.hooks:
+                self.hooks.emit('coalesced', api_method)
+            timeout = deadline.remaining() if deadline is not None else None
+            try:
+                await asyncio.wait_for(call.done.wait(), timeout)
+            except asyncio.TimeoutError:
+                raise LacrmTimeoutError(content='deadline exceeded waiting '
+                                        'for an identical {} call'.format(
+                                            api_method))
+            return self.singleflight.share(call)
+
+        try:
+            result = await fetch()
+        except BaseException as error:
+            self.singleflight.finish(key, call, error=error)
+            raise
+        else:
+            self.singleflight.finish(key, call, result)
+            return result
+        finally:
+            call.done.set()
+
+    async def _fetch_listing_page(self, method_name, args, plan, deadline,
+                                  records):
+        """ Fetches one page of a listing, noting any total on ``plan`` """
+
+        api_method, parameters = self.prepare_call(method_name, *args)
+        body = await self._call_api(api_method, parameters, raw_response=True,
+                                    deadline=deadline)
+        plan.observe_total(body)
+        return self._parse_response(api_method, 200, body, False, records)
+
+    async def _iter_pages(self, fetch_page, page_size, first_page, deadline,
+                          plan):
+        """ Yields pages one request at a time, as ``fetch_pages`` does """
+
+        plan.start(page_size, first_page)
+
+        while True:
+            if deadline is not None:
+                deadline.check()
+            if _request_time is not None:
+                _request_time.set(None)
+            started = _clock()
+            page = await fetch_page(plan.next_page, plan.page_size)
+            elapsed = None
+            if _request_time is not None:
+                elapsed = _request_time.get()
+            if elapsed is None:
+                elapsed = _clock() - started
+            done = plan.record(len(page), elapsed)
+            yield page
+            if done:
+                return
+
+    async def iter_contacts(self, params=None, pages=False, deadline=None,
+                            records=False, plan=None):
+        """ Lazily yields all LACRM contacts, one page request at a time """
+
+        deadline = Deadline.coerce(deadline)
+        if plan is None:
+            plan = PagePlan()
+
+        params = self._contact_listing_params(params)
+
+        def fetch_page(page, page_size):
+            return self._fetch_listing_page(
+                'search_contacts',
+                ("", dict(params, Page=page, NumRows=page_size)), plan,
+                deadline, records)
+
+        async for page_of_contacts in self._iter_pages(
+                fetch_page, params['NumRows'], params['Page'], deadline,
+                plan):
+            if pages:
+                yield page_of_contacts
+            else:
+                for contact in page_of_contacts:
+                    yield contact
+
+    async def get_all_contacts(self, params=None, deadline=None,
+                               records=False, plan=None, columnar=None):
+        """ Searches and returns all LACRM contacts """
+
+        if columnar:
+            return to_columnar([page async for page in self.iter_contacts(
+                params, pages=True, deadline=deadline, plan=plan)], columnar)
+
+        return [contact async for contact in
+                self.iter_contacts(params, deadline=deadline,
+                                   records=records, plan=plan)]
+
+    async def _search_pages(self, term, params, deadline, records,
+                            semaphore):
+        """ Returns every contact matching one search term """
+
+        plan = PagePlan()
+        params = dict({'NumRows': MAX_PAGE_SIZE, 'Page': 1}, **(params or {}))
+
+        def fetch_page(page, page_size):
+            return self._fetch_listing_page(
+                'search_contacts',
+                (term, dict(params, Page=page, NumRows=page_size)), plan,
+                deadline, records)
+
+        contacts = []
+        async with semaphore:
+            async for page in self._iter_pages(fetch_page, params['NumRows'],
+                                               params['Page'], deadline,
+                                               plan):
+                contacts.extend(page)
+        return contacts
+
+    async def search_contacts_many(self, terms, params=None, concurrency=8,
+                                   deadline=None, records=False):
+        """ Runs one search per term concurrently, as Lacrm does """
+
+        deadline = Deadline.coerce(deadline)
+        terms = list(dict.fromkeys(terms))
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        searches = [asyncio.ensure_future(
+            self._search_pages(term, params, deadline, records, semaphore))
+            for term in terms]
+        try:
+            results = await asyncio.gather(*searches)
+        finally:
+            for search in searches:
+                search.cancel()
+            await asyncio.gather(*searches, return_exceptions=True)
+
+        return _merge_search_results(terms, results)
+
+    async def bulk(self, operations, concurrency=8):
+        """ Runs many write operations concurrently, see ``Lacrm.bulk``
+
+        At most ``concurrency`` operations are in flight at once. Returns a
+        BulkReport in input order.
+        """
+
+        operations, results, prepared = prepare_operations(self, operations)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def send(index, api_method, parameters):
+            async with semaphore:
+                try:
+                    result = await self._call_api(api_method, parameters)
+                except Exception as error:  # pylint: disable=broad-except
+                    return BulkResult(index, operations[index], None, error)
+            return BulkResult(index, operations[index], result, None)
+
+        for result in await asyncio.gather(*[send(*item)
+                                             for item in prepared]):
+            results[result.index] = result
+
+        return BulkReport(results)
+
+    async def _load_index(self):
+        """ Indexes every contact in the account once, however many
+        tasks ask at the same time """
+
+        self._require_index()
+        if self._index_lock is None:
+            self._index_lock = asyncio.Lock()
+        async with self._index_lock:
+            if not self.index.loaded:
+                async for page in self.iter_contacts(pages=True):
+                    self.index.add_contacts(page)
+                self.index.loaded = True
+
+    async def upsert_contact(self, data, match_on=('Email',)):
+        """ Edits the contact matching ``data``, or creates one """
+
+        await self._load_index()
+        operation = self._upsert_operation(data, match_on)
+        if operation[0] == 'edit_contact':
+            await self.edit_contact(operation[1], data)
+            return operation[1], False
+        return await self.create_contact(data), True
+
+    async def upsert_contacts(self, rows, match_on=('Email',),
+                              concurrency=8):
+        """ Upserts many contacts concurrently, see
+        ``Lacrm.upsert_contacts`` """
+
+        await self._load_index()
+        rows = list(rows)
+        results = [None] * len(rows)
+        remaining = range(len(rows))
+
+        while remaining:
+            batch, remaining = self._upsert_round(rows, remaining, match_on,
+                                                  results)
+            report = await self.bulk([operation for _, operation in batch],
+                                     concurrency)
+            for (position, _), result in zip(batch, report):
+                results[position] = result._replace(index=position)
+
+        return BulkReport(results)
+
+    async def iter_pipeline_report(self, pipeline_id, status=None,
+                                   pages=False, deadline=None, records=False,
+                                   plan=None):
+        """ Lazily yields a pipeline_report in LACRM, page by page """
+
+        deadline = Deadline.coerce(deadline)
+        if plan is None:
+            plan = PagePlan()
+
+        self._check_pipeline_status(status)
+
+        def fetch_page(page, page_size):
+            params = self._pipeline_page_params(status, page, page_size)
+            return self._fetch_listing_page(
+                'get_pipeline_report', (pipeline_id, params), plan, deadline,
+                records)
+
+        async for respjson in self._iter_pages(fetch_page, MAX_PAGE_SIZE, 1,
+                                               deadline, plan):
+            if pages:
+                yield respjson
+            else:
+                for item in respjson:
+                    yield item
+
+    async def get_all_pipeline_report(self, pipeline_id, status=None,
+                                      deadline=None, records=False,
+                                      plan=None, columnar=None):
+        """ Grabs a pipeline_report in LACRM """
+
+        if columnar:
+            return to_columnar(
+                [page async for page in self.iter_pipeline_report(
+                    pipeline_id, status, pages=True, deadline=deadline,
+                    plan=plan)], columnar)
+
+        return [item async for item in
+                self.iter_pipeline_report(pipeline_id, status,
+                                          deadline=deadline,
+                                          records=records, plan=plan)]
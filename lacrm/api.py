@@ -1,361 +1,588 @@
 "Core classes and exceptions for lacrm"
 
-from __future__ import print_function
-import logging
+import functools
+import threading
+import time
+from collections import OrderedDict
 import requests
-import json
-from lacrm.utils import LacrmArgumentError, BaseLacrmError
-from os.path import expanduser
-
-LOGGER = logging.getLogger(__name__)
-
-
-class Lacrm(object):
+from concurrent import futures
+from requests.adapters import HTTPAdapter
+from lacrm.utils import LacrmTimeoutError, Deadline, _clock
+from lacrm.pagination import (fetch_pages, stream_pages, PagePlan,
+                              MAX_PAGE_SIZE, note_request_time)
+from lacrm.base import BaseLacrm, READ_METHODS, _merge_search_results
+from lacrm.bulk import run_bulk, BulkReport
+from lacrm.metrics import CallEvent
+from lacrm.codec import iter_json_array
+from lacrm.records import RECORD_TYPES
+from lacrm.singleflight import SingleFlight
+from lacrm.columnar import to_columnar
+try:
+    from urllib.parse import urlencode
+except ImportError:  # Python 2
+    from urllib import urlencode
+
+
+def _close_response(future):
+    """ Releases the connection of a hedged request that lost the race """
+
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class Lacrm(BaseLacrm):
     """Less Annoying CRM Instance
 
-    An instance of Lacrm wraps a LACRM REST API session.
+    An instance of Lacrm wraps a LACRM REST API session. Calls are made
+    through a pooled ``requests.Session`` so that consecutive requests reuse
+    warm keep-alive connections. Pass ``session`` to share one session (and
+    its connection pool) between several instances; a session passed in is
+    never closed by this instance.
+
+    The remaining keyword arguments are client options, collected into
+    ``self.options`` (a ``lacrm.options.ClientOptions``) and readable as
+    attributes of the same name.
+
+    Pass a ``lacrm.cache.ResponseCache`` as ``cache`` to serve repeated
+    GetContact, SearchContacts and GetPipelineReport calls from memory.
+    Writes made through the same instance invalidate the entries they
+    affect.
+
+    ``rate_limit`` caps requests per second across every thread using the
+    instance (a number, or a ``lacrm.ratelimit.TokenBucket`` to share one
+    limit between instances); it slows down by itself when the API
+    throttles. ``retry`` takes a ``lacrm.ratelimit.RetryPolicy`` to retry
+    failed requests with exponential backoff instead of raising at once.
+    ``hedge`` takes a ``lacrm.ratelimit.HedgePolicy``: a read that is
+    slower than usual is sent a second time and the first answer wins.
+    ``breaker`` takes a ``lacrm.ratelimit.CircuitBreaker`` that fails calls
+    fast with LacrmCircuitOpenError while the API keeps failing.
+
+    ``timeout`` is the default ``(connect, read)`` timeout in seconds for
+    each request; every API method also accepts ``timeout=`` to override it
+    for one call. The paginated helpers take a ``deadline`` in seconds that
+    bounds the whole operation, across every page request.
+
+    Every request is reported to ``self.hooks`` (see ``lacrm.metrics``);
+    pass a ``lacrm.metrics.Metrics`` as ``metrics`` to collect per-function
+    call counts, latencies, byte sizes, status codes, retries and cache
+    hits, readable through ``stats()``.
+
+    Identical reads issued while one is already in flight wait for it and
+    share its response instead of making their own request (see
+    ``lacrm.singleflight``); pass ``coalesce=False`` to turn this off.
+
+    Request parameters and responses are encoded with ``codec`` (see
+    ``lacrm.codec``); by default orjson is used when installed.
+
+    Listing and lookup methods accept ``records=True`` to return compact
+    ``lacrm.records.Contact``/``PipelineItem`` objects instead of dicts.
+
+    ``index`` takes a ``lacrm.index.ContactIndex`` for ``upsert_contact``;
+    contact writes made through the instance keep it current.
+
+    ``snapshots`` takes a ``lacrm.diff.SnapshotStore``. EditContact and
+    UpdatePipelineItem calls are then diffed against the record's last
+    known state: only changed fields are sent, and writes that change
+    nothing are skipped. ``edit_contact`` and ``update_pipeline`` also
+    accept ``snapshot=`` to diff one call against a record you supply.
+
+    Instances can be used as context managers, which closes the underlying
+    session on exit.
+
+    A single instance is safe to share between threads: every call builds
+    its own request payload, and the ``params``/``data`` dicts passed to a
+    method are never modified.
     """
 
-    def __init__(self, user_code=None, api_token=None):
+    def __init__(self, user_code=None, api_token=None, session=None,
+                 pool_connections=10, pool_maxsize=10, keep_alive=True,
+                 **options):
 
-        creds = self._parse_creds()
-        if user_code is None and api_token is None:
-            self.user_code = creds[0]
-            self.api_token = creds[1]
+        super(Lacrm, self).__init__(user_code, api_token, **options)
 
-        else:
-            self.user_code = user_code
-            self.api_token = api_token
+        # Each hedged read can hold two connections at once. Created on the
+        # first hedged read, since ``hedge`` can be set after construction
+        self._hedge_workers = 2 * pool_maxsize
+        self._hedge_executor = None
+        self._hedge_lock = threading.Lock()
 
-        self.payload = {'UserCode': self.user_code,
-                        'APIToken': self.api_token}
-        self.endpoint_url = 'https://api.lessannoyingcrm.com'
+        if session is None:
+            session = self._build_session(pool_connections, pool_maxsize,
+                                          keep_alive)
+            self._owns_session = True
+        else:
+            self._owns_session = False
+        self.session = session
 
-        # Mapping that allows us to parse different API methods' response
-        # meaningfully
-        self.api_method_responses = {'CreateContact': 'ContactId',
-                                     'CreateNote': 'NoteId',
-                                     'CreateTask': 'TaskId',
-                                     'CreateEvent': 'EventId',
-                                     'GetContact': 'Contact',
-                                     'CreatePipeline': 'PipelineItemId',
-                                     'SearchContacts': 'Result',
-                                     'GetPipelineReport': 'Result'}
+    def __enter__(self):
+        return self
 
-    def _parse_creds(self, filename='.lacrm'):
-        """ Parses dot file for lacrm credentials """
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-        creds = None
+    @staticmethod
+    def _build_session(pool_connections, pool_maxsize, keep_alive):
+        """ Builds a requests session backed by a sized connection pool """
 
-        try:
-            file_path = expanduser('~') + '/' + filename
-            with open(file_path, 'r') as credfile:
-                for line in credfile:
-                    if line.strip()[0] == '#':
-                        pass
-                    elif ':' in line:
-                        user_code = line.strip().split(':')[0]
-                        api_token = line.strip().split(':')[1]
-                        creds = user_code, api_token
-                        break
-            return creds
-
-        # Fail silently as most people will not have creds file
-        except IOError:
-            return None
-
-        except (UnboundLocalError, IndexError):
-            print('Attempted to use a credentials dotfile ({}) but '
-                    'it is either empty or malformed. Credentials should be in '
-                    'the form USER_CODE:API_TOKEN.'.format(file_path))
-            raise
-
-
-    def api_call(func):
-        """ Decorator calls out to the API for specifics API methods """
-
-        def make_api_call(self, *args, **kwargs):
-
-            api_method, data, expected_parameters = func(self, *args)
-
-            parameters = {}
-            for key, value in data.items():
-                parameters[key] = value
-
-            if expected_parameters:
-                self.__validator(parameters.keys(), expected_parameters)
-
-            method_payload = self.payload
-            method_payload['Function'] = api_method
-            method_payload['Parameters'] = json.dumps(parameters)
-
-            response = requests.post(self.endpoint_url, data=method_payload)
-
-            status_code = response.status_code
-            if status_code != 200:
-                raise BaseLacrmError(content='Unknown error occurred -- check'
-                                     'https://www.lessannoyingcrm.com/account/'
-                                     'api/ for more detailed information.')
-            elif kwargs.get('raw_response'):
-                return response.json()
-            else:
-                response = response.json()
-                return response.get(self.api_method_responses.get(api_method), status_code)
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not keep_alive:
+            session.headers['Connection'] = 'close'
 
-        return make_api_call
+        return session
 
-    @api_call
-    def search_contacts(self, term, params=None, raw_response=False):
-        """ Searches LACRM contacts for a given term """
+    def close(self):
+        """ Releases pooled connections held by this instance's session """
 
-        api_method = 'SearchContacts'
-        if not params:
-            params = {'SearchTerms': term}
-        else:
-            params.update({'SearchTerms': term})
+        if self._owns_session:
+            self.session.close()
+        if getattr(self, '_hedge_executor', None) is not None:
+            self._hedge_executor.shutdown(wait=False)
 
-        return api_method, params, None
+    def _send(self, api_method, method_payload, timeout=None, deadline=None,
+              stream=False):
+        """ Posts a payload, applying rate limits, retries and timeouts
 
-    def get_all_contacts(self, params=None):
-        """ Searches and returns all LACRM contacts """
+        Returns the final status code and decoded body. With ``stream``, a
+        successful call returns the unread response in place of the body.
+        """
 
-        defaults = {'NumRows': 500,
-                    'Page': 1,
-                    'Sort': 'DateEntered'}
+        if timeout is None:
+            timeout = self.timeout
 
-        if not params:
-            params = defaults
-        else:
-            params = defaults.update(params)
+        hedged = (self.hedge is not None and not stream and
+                  api_method in READ_METHODS)
 
-        all_contacts = []
+        attempt = 0
         while True:
-            page_of_contacts = self.search_contacts("", params)
-
-            all_contacts = all_contacts + page_of_contacts
-
-            if len(page_of_contacts) < 500:
-                break
-            else:
-                params['Page'] = params['Page'] + 1
-
-        return all_contacts
-
-    @api_call
-    def add_contact_to_group(self, contact_id, group_name, raw_response=False):
-        """ Adds a contact to a group in LACRM """
-
-        data = {}
-        data['ContactId'] = contact_id
-        data['GroupName'] = group_name
-
-        if group_name.find(' ') > 0:
-                raise LacrmArgumentError(
-                    content='The group name you passed "{0}" contains spaces. '
-                    'Spaces should be replaced them with underscores (eg "cool '
-                    'group" should be "cool_group"). See '
-                    'https://www.lessannoyingcrm.com/help/topic/API_Function_Definitions/8/AddContactToGroup+Function+Definition '
-                    'for more details.'.format(group_name))
-
-        api_method = 'AddContactToGroup'
-
-        return api_method, data, None
-
-    @api_call
-    def delete_contact(self, contact_id, raw_response=False):
-        """ Deletes a given contact from LACRM """
-
-        data = {}
-        data['ContactId'] = contact_id
-        api_method = 'DeleteContact'
-
-        return api_method, data, None
-
-    @api_call
-    def get_contact(self, contact_id, raw_response=False):
-        """ Get all information in LACRM for given contact """
-
-        data = {}
-        data['ContactId'] = contact_id
-        api_method = 'GetContact'
-
-        return api_method, data, None
-
-    @api_call
-    def create_contact(self, data):
-        """ Creates a new contact in LACRM """
-
-        api_method = 'CreateContact'
-        expected_parameters = ['FullName',
-                               'Salutation',
-                               'FirstName',
-                               'MiddleName',
-                               'LastName',
-                               'Suffix',
-                               'CompanyName',
-                               'CompanyId',
-                               'Title',
-                               'Industry',
-                               'NumEmployees',
-                               'BackgroundInfo',
-                               'Email',
-                               'Phone',
-                               'Address',
-                               'Website',
-                               'Birthday',
-                               'CustomFields',
-                               'assignedTo']
-
-        return api_method, data, expected_parameters
-
-    @api_call
-    def edit_contact(self, contact_id, data, raw_response=False):
-        """ Edits a contact in LACRM for given """
-
-        data['ContactId'] = contact_id
-        api_method = 'EditContact'
-        expected_parameters = ['FullName',
-                               'Salutation',
-                               'FirstName',
-                               'MiddleName',
-                               'LastName',
-                               'Suffix',
-                               'CompanyName',
-                               'ContactId',
-                               'CompanyId',
-                               'Title',
-                               'Industry',
-                               'NumEmployees',
-                               'BackgroundInfo',
-                               'Email',
-                               'Phone',
-                               'Address',
-                               'Website',
-                               'Birthday',
-                               'CustomFields',
-                               'assignedTo']
-
-        return api_method, data, expected_parameters
-
-    @api_call
-    def create_pipeline(self, contact_id, data, raw_response=False):
-        """ Creates a new pipeline in LACRM for given contactid """
-
-        data['ContactId'] = contact_id
-        api_method = 'CreatePipeline'
-        expected_parameters = ['ContactId',
-                               'Note',
-                               'PipelineId',
-                               'StatusId',
-                               'Priority',
-                               'CustomFields']
-
-        return api_method, data, expected_parameters
-
-    @api_call
-    def update_pipeline(self, pipeline_item_id, data, raw_response=False):
-        """ Update a pipeline in LACRM """
-
-        data['PipelineItemId'] = pipeline_item_id
-        api_method = 'UpdatePipelineItem'
-        expected_parameters = ['PipelineItemId',
-                               'Note',
-                               'StatusId',
-                               'Priority',
-                               'CustomFields']
-
-        return api_method, data, expected_parameters
-
-    @api_call
-    def create_note(self, contact_id, note, raw_response=False):
-        """ Creates a new note in LACRM for a given contactid """
-
-        data = {}
-        data['ContactId'] = contact_id
-        data['Note'] = note
-        api_method = 'CreateNote'
-        expected_parameters = ['ContactId', 'Note']
-
-        return api_method, data, expected_parameters
-
-    @api_call
-    def create_task(self, data, raw_response=False):
-        """ Creates a new task in LACRM """
-
-        api_method = 'CreateTask'
-        expected_parameters = ['ContactId',
-                               'DueDate',  # YYYY-MM-DD
-                               'Description',
-                               'ContactId',
-                               'AssignedTo']
-
-        return api_method, data, expected_parameters
-
-    @api_call
-    def create_event(self, data, raw_response=False):
-        """ Creates a new event in LACRM """
-
-        api_method = 'CreateEvent'
-        expected_parameters = ['Date',
-                               'StartTime',  # 24:00
-                               'EndTime',  # 24:00
-                               'Name',
-                               'Description',
-                               'Contacts',
-                               'Users']
-
-        return api_method, data, expected_parameters
-
-    @api_call
-    def get_pipeline_report(self, pipeline_id, data, raw_response=False):
-        """ Grabs a pipeline_report in LACRM """
-
-        data['PipelineId'] = pipeline_id
-        api_method = 'GetPipelineReport'
-        expected_parameters = ['PipelineId',
-                               'SortBy',
-                               'NumRows',
-                               'Page',
-                               'SortDirection',
-                               'UserFilter',
-                               'StatusFilter']
-
-        return api_method, data, expected_parameters
-
-    def get_all_pipeline_report(self, pipeline_id, status=None):
-        """ Grabs a pipeline_report in LACRM """
-
-        continue_flag = True
-        page = 1
-        output = []
-
-        while continue_flag:
-
-            params = {'NumRows': 500,
-                      'Page': page,
-                      'SortBy': 'Status'}
-
-            if status in ['all', 'closed']:
-                params['StatusFilter'] = status
+            self._check_breaker(api_method)
+            # Set once the breaker has been told how this attempt went;
+            # anything raised before then counts as a failed attempt, so
+            # a half-open breaker never waits on a trial that ended
+            recorded = False
+            response = None
+            try:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.acquire()
+
+                request_timeout = timeout
+                if deadline is not None:
+                    request_timeout = deadline.clip(timeout)
+
+                hooks = self.hooks
+                if hooks:
+                    hooks.emit('before_request', api_method, method_payload)
+                started = _clock()
+
+                try:
+                    if hedged:
+                        response = self._hedged_post(
+                            api_method, method_payload, request_timeout)
+                    else:
+                        response = self.session.post(
+                            self.endpoint_url, data=method_payload,
+                            timeout=request_timeout, stream=stream)
+                except (requests.ConnectionError, requests.Timeout) as error:
+                    recorded = True
+                    self._record_status(None)
+                    if hooks:
+                        hooks.emit('on_error', CallEvent(
+                            api_method, attempt, _clock() - started,
+                            len(urlencode(method_payload)), error=error))
+                    delay = self._next_retry_delay(api_method, attempt)
+                    if delay is None:
+                        if isinstance(error, requests.Timeout):
+                            raise LacrmTimeoutError(content=str(error))
+                        raise
+                else:
+                    status_code = response.status_code
+                    recorded = True
+                    self._record_status(status_code)
+                    if hooks:
+                        hooks.emit('after_response', CallEvent(
+                            api_method, attempt, _clock() - started,
+                            len(urlencode(method_payload)), status_code,
+                            int(response.headers.get('Content-Length', 0))
+                            if stream else len(response.content)))
+                    if status_code == 200:
+                        elapsed = _clock() - started
+                        note_request_time(elapsed)
+                        if hedged:
+                            self.hedge.observe(api_method, elapsed)
+                        if stream:
+                            return status_code, response
+                        return status_code, self.codec.loads(
+                            response.content)
+
+                    retry_after = response.headers.get('Retry-After')
+                    if stream:
+                        # Nothing is read from a failed streamed response,
+                        # so release its connection now
+                        response.close()
+                    delay = self._next_retry_delay(
+                        api_method, attempt, status_code, retry_after)
+                    if delay is None:
+                        return status_code, None
+            except BaseException:
+                if not recorded:
+                    self._record_status(None)
+                if stream and response is not None:
+                    response.close()
+                raise
+
+            if deadline is not None and delay >= deadline.remaining():
+                raise LacrmTimeoutError(content='deadline exceeded while '
+                                        'retrying {}'.format(api_method))
+            time.sleep(delay)
+            attempt += 1
+
+    def _hedged_post(self, api_method, method_payload, timeout):
+        """ Posts a read, sending a duplicate if the first is slow
+
+        Returns the first successful response; the other is closed when
+        it arrives. Raises the first error if both attempts fail.
+        """
+
+        with self._hedge_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = futures.ThreadPoolExecutor(
+                    max_workers=self._hedge_workers)
+            executor = self._hedge_executor
+
+        post = functools.partial(self.session.post, self.endpoint_url,
+                                 data=method_payload, timeout=timeout)
+        attempts = [executor.submit(post)]
+        done, _ = futures.wait(attempts, self.hedge.delay(api_method))
+        if not done:
+            attempts.append(executor.submit(post))
+
+        pending = set(attempts)
+        error = None
+        while pending:
+            done, pending = futures.wait(
+                pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                if len(attempts) > 1:
+                    self.hedge.record_hedge(won=future is attempts[1])
+                for other in attempts:
+                    if other is not future:
+                        other.add_done_callback(_close_response)
+                return future.result()
+
+        if len(attempts) > 1:
+            self.hedge.record_hedge(won=False)
+        raise error
+
+    def _call_api(self, api_method, parameters, raw_response=False,
+                  timeout=None, deadline=None, records=False,
+                  snapshot=None):
+        """ Posts a single API call and parses its response """
+
+        parameters, body = self._answer_locally(api_method, parameters,
+                                                snapshot)
+        if body is not None:
+            return self._parse_response(api_method, 200, body, raw_response,
+                                        records)
+
+        def fetch():
+            method_payload = self._build_payload(api_method, parameters)
+            status_code, body = self._send(api_method, method_payload,
+                                           timeout, deadline)
+            if status_code == 200:
+                self._remember(api_method, parameters, body)
+            return status_code, body
+
+        def waiting():
+            if self.hooks:
+                self.hooks.emit('coalesced', api_method)
+
+        if self.singleflight is None:
+            status_code, body = fetch()
+        elif api_method in READ_METHODS:
+            status_code, body = self.singleflight.do(
+                SingleFlight.key(api_method, parameters), fetch, deadline,
+                waiting)
+        else:
+            try:
+                status_code, body = fetch()
+            finally:
+                self.singleflight.invalidate()
+
+        return self._parse_response(api_method, status_code, body,
+                                    raw_response, records)
+
+    def _stream_results(self, method_name, args, deadline=None,
+                        records=False):
+        """ Calls a listing method, yielding its Result items as they arrive
+
+        The response body is parsed incrementally, so a page is never held
+        in memory whole. Bypasses the response cache.
+        """
+
+        api_method, parameters = self.prepare_call(method_name, *args)
+        method_payload = self._build_payload(api_method, parameters)
+        status_code, response = self._send(api_method, method_payload,
+                                           deadline=deadline, stream=True)
+        if status_code != 200:
+            self._parse_response(api_method, status_code, None, False)
+
+        key = self.api_method_responses[api_method]
+        record_type = RECORD_TYPES[api_method] if records else None
+        try:
+            for item in iter_json_array(response.iter_content(65536), key,
+                                        raw=records):
+                yield record_type(item) if records else item
+        finally:
+            response.close()
+
+    def _fetch_listing_page(self, method_name, args, plan, deadline,
+                            records):
+        """ Fetches one page of a listing, noting any total on ``plan`` """
+
+        api_method, parameters = self.prepare_call(method_name, *args)
+        body = self._call_api(api_method, parameters, raw_response=True,
+                              deadline=deadline)
+        plan.observe_total(body)
+        return self._parse_response(api_method, 200, body, False, records)
+
+    def iter_contacts(self, params=None, concurrency=1, pages=False,
+                      deadline=None, stream=False, records=False, plan=None):
+        """ Lazily yields all LACRM contacts, one page request at a time
+
+        Yields individual contacts, or whole pages when ``pages`` is true.
+        With ``concurrency`` above 1, that many pages are requested in
+        parallel ahead of the page currently being read. ``deadline`` bounds
+        the whole listing, in seconds. With ``stream``, each page is parsed
+        incrementally and contacts are yielded as they arrive. With
+        ``records``, contacts are yielded as ``lacrm.records.Contact``.
+        ``plan`` is a ``lacrm.pagination.PagePlan`` that sizes the pages and
+        reports progress.
+        """
+
+        deadline = Deadline.coerce(deadline)
+        if plan is None:
+            plan = PagePlan()
+
+        params = self._contact_listing_params(params)
+
+        if stream:
+            self._check_stream_args(concurrency, pages)
+
+            def stream_page(page):
+                page_params = dict(params, Page=page, NumRows=plan.page_size)
+                return self._stream_results(
+                    'search_contacts', ("", page_params), deadline, records)
+
+            for contact in stream_pages(stream_page, params['NumRows'],
+                                        params['Page'], deadline, plan):
+                yield contact
+            return
+
+        def fetch_page(page):
+            page_params = dict(params, Page=page, NumRows=plan.page_size)
+            return self._fetch_listing_page(
+                'search_contacts', ("", page_params), plan, deadline, records)
+
+        for page_of_contacts in fetch_pages(fetch_page, params['NumRows'],
+                                            concurrency,
+                                            first_page=params['Page'],
+                                            deadline=deadline, plan=plan):
+            if pages:
+                yield page_of_contacts
             else:
-                print('That status code is not recognized via the API.')
-
-            respjson = self.get_pipeline_report(pipeline_id, params)
-
-            for i in respjson:
-                output.append(i)
-
-            if len(respjson) == 500:
-                page += 1
+                for contact in page_of_contacts:
+                    yield contact
+
+    def get_all_contacts(self, params=None, concurrency=1, deadline=None,
+                         records=False, plan=None, columnar=None):
+        """ Searches and returns all LACRM contacts
+
+        With ``columnar='numpy'`` the contacts come back as a
+        ``lacrm.columnar.ColumnarListing``, and with ``'pandas'`` as a
+        DataFrame, built page by page.
+        """
+
+        if columnar:
+            return to_columnar(self.iter_contacts(
+                params, concurrency, pages=True, deadline=deadline,
+                plan=plan), columnar)
+
+        return list(self.iter_contacts(params, concurrency,
+                                       deadline=deadline, records=records,
+                                       plan=plan))
+
+    def _search_pages(self, term, params, deadline, records):
+        """ Returns every contact matching one search term """
+
+        plan = PagePlan()
+        params = dict({'NumRows': MAX_PAGE_SIZE, 'Page': 1}, **(params or {}))
+
+        def fetch_page(page):
+            page_params = dict(params, Page=page, NumRows=plan.page_size)
+            return self._fetch_listing_page(
+                'search_contacts', (term, page_params), plan, deadline,
+                records)
+
+        contacts = []
+        for page in fetch_pages(fetch_page, params['NumRows'],
+                                first_page=params['Page'], deadline=deadline,
+                                plan=plan):
+            contacts.extend(page)
+        return contacts
+
+    def search_contacts_many(self, terms, params=None, concurrency=8,
+                             deadline=None, records=False):
+        """ Runs one search per term in parallel
+
+        Returns an OrderedDict mapping each distinct term, in input order,
+        to every matching contact across all result pages. Each search is
+        ``search_contacts(term, params)``, and up to ``concurrency`` run at
+        once. Contacts are de-duplicated by ContactId; one found by several
+        terms is shared between them. The first failed search cancels those
+        not yet started and is raised.
+        """
+
+        deadline = Deadline.coerce(deadline)
+        terms = list(OrderedDict.fromkeys(terms))
+        if not terms:
+            return OrderedDict()
+
+        executor = futures.ThreadPoolExecutor(
+            max_workers=max(1, min(concurrency, len(terms))))
+        pending = [executor.submit(self._search_pages, term, params, deadline,
+                                   records)
+                   for term in terms]
+        try:
+            results = [future.result() for future in pending]
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+        return _merge_search_results(terms, results)
+
+    def iter_pipeline_report(self, pipeline_id, status=None,
+                             concurrency=1, pages=False, deadline=None,
+                             stream=False, records=False, first_page=1,
+                             plan=None):
+        """ Lazily yields a pipeline_report in LACRM, page by page
+
+        Yields individual pipeline items, or whole pages when ``pages`` is
+        true. ``deadline`` bounds the whole report, in seconds. With
+        ``stream``, each page is parsed incrementally. With ``records``,
+        items are yielded as ``lacrm.records.PipelineItem``. ``first_page``
+        resumes the report part way through. ``plan`` is a
+        ``lacrm.pagination.PagePlan``, as for ``iter_contacts``.
+        """
+
+        deadline = Deadline.coerce(deadline)
+        if plan is None:
+            plan = PagePlan()
+
+        self._check_pipeline_status(status)
+
+        def page_params(page):
+            return self._pipeline_page_params(status, page, plan.page_size)
+
+        if stream:
+            self._check_stream_args(concurrency, pages)
+
+            def stream_page(page):
+                return self._stream_results(
+                    'get_pipeline_report', (pipeline_id, page_params(page)),
+                    deadline, records)
+
+            for item in stream_pages(stream_page, MAX_PAGE_SIZE, first_page,
+                                     deadline, plan):
+                yield item
+            return
+
+        def fetch_page(page):
+            return self._fetch_listing_page(
+                'get_pipeline_report', (pipeline_id, page_params(page)), plan,
+                deadline, records)
+
+        for respjson in fetch_pages(fetch_page, MAX_PAGE_SIZE, concurrency,
+                                    first_page=first_page, deadline=deadline,
+                                    plan=plan):
+            if pages:
+                yield respjson
             else:
-                continue_flag = False
-
-        return output
-
-    def __validator(self, parameters, known_parameters):
-        for param in parameters:
-            if param not in known_parameters:
-                raise LacrmArgumentError(content='The provided parameter "{}" '
-                                         'cannot be recognized by the '
-                                         'API'.format(param))
-        return
+                for item in respjson:
+                    yield item
+
+    def get_all_pipeline_report(self, pipeline_id, status=None,
+                                concurrency=1, deadline=None, records=False,
+                                plan=None, columnar=None):
+        """ Grabs a pipeline_report in LACRM
+
+        ``columnar`` works as for ``get_all_contacts``.
+        """
+
+        if columnar:
+            return to_columnar(self.iter_pipeline_report(
+                pipeline_id, status, concurrency, pages=True,
+                deadline=deadline, plan=plan), columnar)
+
+        return list(self.iter_pipeline_report(pipeline_id, status,
+                                              concurrency,
+                                              deadline=deadline,
+                                              records=records, plan=plan))
+
+    def upsert_contact(self, data, match_on=('Email',)):
+        """ Edits the contact matching ``data``, or creates one
+
+        The match is looked up in ``self.index`` (loaded on first use) on
+        the fields in ``match_on``, tried in order; see
+        ``lacrm.index.MATCH_FIELDS``. Costs one request either way. Returns
+        ``(contact_id, created)``.
+        """
+
+        self._require_index()
+        self.index.load(self)
+        operation = self._upsert_operation(data, match_on)
+        if operation[0] == 'edit_contact':
+            self.edit_contact(operation[1], data)
+            return operation[1], False
+        return self.create_contact(data), True
+
+    def upsert_contacts(self, rows, match_on=('Email',), concurrency=8):
+        """ Upserts many contacts in parallel, see ``upsert_contact``
+
+        Rows that would create the same new contact are not sent together:
+        the first creates it and the rest edit it in a later round. Returns
+        a BulkReport in input order.
+        """
+
+        self._require_index()
+        self.index.load(self)
+        rows = list(rows)
+        results = [None] * len(rows)
+        remaining = range(len(rows))
+
+        while remaining:
+            batch, remaining = self._upsert_round(rows, remaining, match_on,
+                                                  results)
+            report = run_bulk(self, [operation for _, operation in batch],
+                              concurrency)
+            for (position, _), result in zip(batch, report):
+                results[position] = result._replace(index=position)
+
+        return BulkReport(results)
+
+    def bulk(self, operations, concurrency=8):
+        """ Runs many write operations in parallel
+
+        ``operations`` holds tuples such as ``('create_note', contact_id,
+        note)``. Returns a BulkReport with one result per operation, in input
+        order. See ``lacrm.bulk.run_bulk``.
+        """
+
+        return run_bulk(self, operations, concurrency)
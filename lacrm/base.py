@@ -0,0 +1,602 @@
+"Request building and response handling shared by Lacrm and AsyncLacrm"
+
+import logging
+from collections import OrderedDict
+from lacrm.utils import (LacrmArgumentError, BaseLacrmError,
+                         LacrmCircuitOpenError, Deadline)
+from lacrm.diff import DIFF_METHODS, diff_write
+from lacrm.ratelimit import TokenBucket, THROTTLE_STATUSES
+from lacrm.metrics import Hooks
+from lacrm.codec import default_codec
+from lacrm.records import to_records
+from lacrm.singleflight import SingleFlight
+from lacrm.credentials import CREDENTIALS, DOTFILE
+from lacrm.options import ClientOptions
+from lacrm.pagination import MAX_PAGE_SIZE
+from lacrm.bulk import BulkResult
+from lacrm.index import match_keys
+
+LOGGER = logging.getLogger('lacrm.api')
+
+# API functions that only read data and are therefore safe to repeat
+READ_METHODS = ('GetContact', 'SearchContacts', 'GetPipelineReport')
+
+# Response body returned in place of a write that would change nothing
+SKIPPED = {'Success': True, 'Skipped': True}
+
+
+def _merge_search_results(terms, results):
+    """ Maps each term to its contacts, de-duplicated by ContactId
+
+    A contact found by several terms is the same object under each of them.
+    """
+
+    merged = OrderedDict()
+    seen = {}
+    for term, contacts in zip(terms, results):
+        found = merged[term] = []
+        in_term = set()
+        for contact in contacts:
+            contact_id = contact.get('ContactId')
+            if contact_id is None:
+                found.append(contact)
+            elif contact_id not in in_term:
+                in_term.add(contact_id)
+                found.append(seen.setdefault(contact_id, contact))
+    return merged
+
+
+def _option(name, doc):
+    """ A client attribute stored on the client's ClientOptions """
+
+    def get(self):
+        return getattr(self.options, name)
+
+    def set_(self, value):
+        setattr(self.options, name, value)
+
+    return property(get, set_, doc=doc)
+
+
+class BaseLacrm(object):
+    """Credentials, request building and response handling for one account
+
+    BaseLacrm holds everything about a client that does not depend on how
+    requests are sent: argument validation, payloads, response mapping,
+    retry and circuit breaker decisions, and the caches, indexes and
+    snapshots fed by responses. ``Lacrm`` sends requests with ``requests``
+    and ``AsyncLacrm`` with ``aiohttp``.
+
+    Keyword ``options`` are collected into ``self.options``, a
+    ``lacrm.options.ClientOptions``; see ``Lacrm`` for what each does.
+    """
+
+    endpoint_url = 'https://api.lessannoyingcrm.com'
+
+    # Mapping that allows us to parse different API methods' response
+    # meaningfully
+    api_method_responses = {'CreateContact': 'ContactId',
+                            'CreateNote': 'NoteId',
+                            'CreateTask': 'TaskId',
+                            'CreateEvent': 'EventId',
+                            'GetContact': 'Contact',
+                            'CreatePipeline': 'PipelineItemId',
+                            'SearchContacts': 'Result',
+                            'GetPipelineReport': 'Result'}
+
+    cache = _option('cache', 'ResponseCache serving repeated reads')
+    timeout = _option('timeout', 'Default (connect, read) request timeout')
+    retry = _option('retry', 'RetryPolicy for failed requests')
+    hedge = _option('hedge', 'HedgePolicy for slow reads')
+    breaker = _option('breaker', 'CircuitBreaker failing calls fast')
+    metrics = _option('metrics', 'Metrics collected from the hooks')
+    codec = _option('codec', 'Codec encoding requests and responses')
+    index = _option('index', 'ContactIndex used by upsert_contact')
+    snapshots = _option('snapshots', 'SnapshotStore diffing writes')
+
+    def __init__(self, user_code=None, api_token=None, **options):
+        self.options = ClientOptions(**options)
+        self._configure(user_code, api_token)
+        self.options.codec = self.options.codec or default_codec()
+        self._configure_hooks()
+        self.singleflight = SingleFlight() if self.options.coalesce else None
+        self._configure_resilience(self.options.rate_limit)
+
+    def _configure(self, user_code, api_token):
+        """ Sets up credentials shared by every request """
+
+        if user_code is None and api_token is None:
+            creds = CREDENTIALS.environment() or self._parse_creds()
+            self.user_code = creds[0]
+            self.api_token = creds[1]
+
+        else:
+            self.user_code = user_code
+            self.api_token = api_token
+
+        self.payload = {'UserCode': self.user_code,
+                        'APIToken': self.api_token}
+
+    def _configure_hooks(self):
+        """ Sets up the instrumentation hooks and optional metrics """
+
+        self.hooks = Hooks()
+        if self.metrics is not None:
+            self.metrics.install(self.hooks)
+
+    def add_hook(self, event, callback):
+        """ Registers an instrumentation callback, see lacrm.metrics.EVENTS """
+
+        self.hooks.add(event, callback)
+
+    def stats(self):
+        """ Returns a snapshot of per-function metrics, if collected """
+
+        if self.metrics is None:
+            return {}
+        return self.metrics.snapshot()
+
+    def _configure_resilience(self, rate_limit):
+        """ Sets up the rate limiter """
+
+        if rate_limit is not None and not isinstance(rate_limit, TokenBucket):
+            rate_limit = TokenBucket(rate_limit)
+        self.rate_limiter = rate_limit
+
+    def _parse_creds(self, filename=DOTFILE):
+        """ Parses dot file for lacrm credentials """
+
+        return CREDENTIALS.dotfile(filename)
+
+    def _build_payload(self, api_method, parameters):
+        """ Builds the form payload for a single API call """
+
+        method_payload = dict(self.payload)
+        method_payload['Function'] = api_method
+        method_payload['Parameters'] = self.codec.dumps(parameters)
+
+        return method_payload
+
+    def _parse_response(self, api_method, status_code, body, raw_response,
+                        records=False):
+        """ Maps a decoded API response onto the value a method returns """
+
+        if status_code != 200:
+            raise BaseLacrmError(content='Unknown error occurred -- check'
+                                 'https://www.lessannoyingcrm.com/account/'
+                                 'api/ for more detailed information.')
+        if raw_response:
+            return body
+        value = body.get(self.api_method_responses.get(api_method),
+                         status_code)
+        if records:
+            return to_records(api_method, value)
+        return value
+
+    def _check_breaker(self, api_method):
+        """ Raises LacrmCircuitOpenError unless a request may be sent """
+
+        if self.breaker is not None and not self.breaker.allow():
+            raise LacrmCircuitOpenError(
+                content='{} not sent; retry in {:.1f}s'.format(
+                    api_method, self.breaker.retry_after()))
+
+    def _record_status(self, status_code):
+        """ Feeds a response status (None when the request failed) back
+        into the rate limiter and circuit breaker """
+
+        if self.breaker is not None:
+            self.breaker.record(status_code, error=status_code is None)
+        if self.rate_limiter is None:
+            return
+        if status_code in THROTTLE_STATUSES:
+            self.rate_limiter.throttled()
+        elif status_code == 200:
+            self.rate_limiter.succeeded()
+
+    def _next_retry_delay(self, api_method, attempt, status_code=None,
+                          retry_after=None):
+        """ Returns seconds to wait before retrying, or None to give up """
+
+        if self.retry is None or not self.retry.should_retry(
+                attempt, api_method in READ_METHODS, status_code):
+            return None
+
+        delay = self.retry.delay(attempt, retry_after)
+        if self.hooks:
+            self.hooks.emit('retry', api_method, attempt, status_code)
+        LOGGER.warning('Retrying %s in %.2fs after %s', api_method, delay,
+                       status_code or 'connection error')
+        return delay
+
+    def _remember(self, api_method, parameters, body):
+        """ Feeds a successful response to the cache and contact index """
+
+        if self.cache is not None:
+            self.cache.update(api_method, parameters, body,
+                              self.user_code)
+        if self.index is not None:
+            self.index.update(api_method, parameters, body)
+        if self.snapshots is not None:
+            self.snapshots.update(api_method, parameters, body)
+
+    def _diff_write(self, api_method, parameters, snapshot):
+        """ Drops the fields a write would not change; None if that is all
+        of them """
+
+        if self.snapshots is not None:
+            changed = self.snapshots.diff(api_method, parameters, snapshot)
+        elif snapshot is not None:
+            changed = diff_write(api_method, parameters, snapshot)
+        else:
+            return parameters
+
+        if changed is None and self.hooks:
+            self.hooks.emit('write_skipped', api_method)
+        return changed
+
+    def _answer_locally(self, api_method, parameters, snapshot):
+        """ Returns the parameters to send and, when no request is needed
+        (a write that changes nothing, or a cache hit), the body to answer
+        with instead of None """
+
+        if api_method in DIFF_METHODS:
+            parameters = self._diff_write(api_method, parameters, snapshot)
+            if parameters is None:
+                return None, dict(SKIPPED)
+
+        if self.cache is not None:
+            found, body = self.cache.get(api_method, parameters,
+                                         self.user_code)
+            if found:
+                if self.hooks:
+                    self.hooks.emit('cache_hit', api_method)
+                return parameters, body
+
+        return parameters, None
+
+    @staticmethod
+    def _contact_listing_params(params):
+        """ Parameters of a contact listing, with the defaults filled in """
+
+        defaults = {'NumRows': MAX_PAGE_SIZE,
+                    'Page': 1,
+                    'Sort': 'DateEntered'}
+
+        if params:
+            defaults.update(params)
+        return defaults
+
+    @staticmethod
+    def _pipeline_page_params(status, page, page_size):
+        """ Parameters of one page of a pipeline report """
+
+        params = {'NumRows': page_size,
+                  'Page': page,
+                  'SortBy': 'Status'}
+
+        if status in ['all', 'closed']:
+            params['StatusFilter'] = status
+
+        return params
+
+    @staticmethod
+    def _check_pipeline_status(status):
+        if status is not None and status not in ['all', 'closed']:
+            raise LacrmArgumentError(content='That status code is not '
+                                     'recognized via the API: {!r}'.format(
+                                         status))
+
+    @staticmethod
+    def _check_stream_args(concurrency, pages):
+        if concurrency > 1 or pages:
+            raise LacrmArgumentError(content='stream=True yields records one '
+                                     'at a time from one page request at a '
+                                     'time; it cannot be combined with '
+                                     'concurrency or pages')
+
+    def prepare_call(self, method_name, *args):
+        """ Validates a method's arguments without calling the API
+
+        Returns the ``(api_method, parameters)`` pair the method would send,
+        or raises LacrmArgumentError.
+        """
+
+        method = getattr(type(self), method_name, None)
+        build_request = getattr(method, 'build_request', None)
+        if build_request is None:
+            raise LacrmArgumentError(content='"{}" is not an API '
+                                     'method'.format(method_name))
+
+        return self._prepare(build_request, args)
+
+    def send_prepared(self, api_method, parameters, raw_response=False):
+        """ Sends an ``(api_method, parameters)`` pair from ``prepare_call``
+
+        Returns what the Lacrm method would have; a coroutine on AsyncLacrm.
+        """
+
+        return self._call_api(api_method, parameters,
+                              raw_response=raw_response)
+
+    def _prepare(self, build_request, args):
+        api_method, data, expected_parameters = build_request(self, *args)
+
+        parameters = {}
+        for key, value in data.items():
+            parameters[key] = value
+
+        if expected_parameters:
+            self.__validator(parameters.keys(), expected_parameters)
+
+        return api_method, parameters
+
+    def api_call(func):
+        """ Decorator calls out to the API for specifics API methods """
+
+        def make_api_call(self, *args, **kwargs):
+
+            api_method, parameters = self._prepare(func, args)
+
+            return self._call_api(api_method, parameters,
+                                  raw_response=kwargs.get('raw_response'),
+                                  timeout=kwargs.get('timeout'),
+                                  deadline=Deadline.coerce(
+                                      kwargs.get('deadline')),
+                                  records=kwargs.get('records'),
+                                  snapshot=kwargs.get('snapshot'))
+
+        make_api_call.build_request = func
+        make_api_call.__name__ = func.__name__
+        make_api_call.__doc__ = func.__doc__
+        return make_api_call
+
+    @api_call
+    def search_contacts(self, term, params=None, raw_response=False):
+        """ Searches LACRM contacts for a given term """
+
+        api_method = 'SearchContacts'
+        params = dict(params or {}, SearchTerms=term)
+
+        return api_method, params, None
+
+    @api_call
+    def add_contact_to_group(self, contact_id, group_name, raw_response=False):
+        """ Adds a contact to a group in LACRM """
+
+        data = {}
+        data['ContactId'] = contact_id
+        data['GroupName'] = group_name
+
+        if group_name.find(' ') > 0:
+                raise LacrmArgumentError(
+                    content='The group name you passed "{0}" contains spaces. '
+                    'Spaces should be replaced them with underscores (eg "cool '
+                    'group" should be "cool_group"). See '
+                    'https://www.lessannoyingcrm.com/help/topic/API_Function_Definitions/8/AddContactToGroup+Function+Definition '
+                    'for more details.'.format(group_name))
+
+        api_method = 'AddContactToGroup'
+
+        return api_method, data, None
+
+    @api_call
+    def delete_contact(self, contact_id, raw_response=False):
+        """ Deletes a given contact from LACRM """
+
+        data = {}
+        data['ContactId'] = contact_id
+        api_method = 'DeleteContact'
+
+        return api_method, data, None
+
+    @api_call
+    def get_contact(self, contact_id, raw_response=False):
+        """ Get all information in LACRM for given contact """
+
+        data = {}
+        data['ContactId'] = contact_id
+        api_method = 'GetContact'
+
+        return api_method, data, None
+
+    @api_call
+    def create_contact(self, data):
+        """ Creates a new contact in LACRM """
+
+        api_method = 'CreateContact'
+        expected_parameters = ['FullName',
+                               'Salutation',
+                               'FirstName',
+                               'MiddleName',
+                               'LastName',
+                               'Suffix',
+                               'CompanyName',
+                               'CompanyId',
+                               'Title',
+                               'Industry',
+                               'NumEmployees',
+                               'BackgroundInfo',
+                               'Email',
+                               'Phone',
+                               'Address',
+                               'Website',
+                               'Birthday',
+                               'CustomFields',
+                               'assignedTo']
+
+        return api_method, data, expected_parameters
+
+    @api_call
+    def edit_contact(self, contact_id, data, raw_response=False):
+        """ Edits a contact in LACRM for given
+
+        Pass ``snapshot=`` (e.g. an earlier ``get_contact`` result) to send
+        only the fields that differ from it.
+        """
+
+        data = dict(data, ContactId=contact_id)
+        api_method = 'EditContact'
+        expected_parameters = ['FullName',
+                               'Salutation',
+                               'FirstName',
+                               'MiddleName',
+                               'LastName',
+                               'Suffix',
+                               'CompanyName',
+                               'ContactId',
+                               'CompanyId',
+                               'Title',
+                               'Industry',
+                               'NumEmployees',
+                               'BackgroundInfo',
+                               'Email',
+                               'Phone',
+                               'Address',
+                               'Website',
+                               'Birthday',
+                               'CustomFields',
+                               'assignedTo']
+
+        return api_method, data, expected_parameters
+
+    @api_call
+    def create_pipeline(self, contact_id, data, raw_response=False):
+        """ Creates a new pipeline in LACRM for given contactid """
+
+        data = dict(data, ContactId=contact_id)
+        api_method = 'CreatePipeline'
+        expected_parameters = ['ContactId',
+                               'Note',
+                               'PipelineId',
+                               'StatusId',
+                               'Priority',
+                               'CustomFields']
+
+        return api_method, data, expected_parameters
+
+    @api_call
+    def update_pipeline(self, pipeline_item_id, data, raw_response=False):
+        """ Update a pipeline in LACRM
+
+        Accepts ``snapshot=`` as ``edit_contact`` does.
+        """
+
+        data = dict(data, PipelineItemId=pipeline_item_id)
+        api_method = 'UpdatePipelineItem'
+        expected_parameters = ['PipelineItemId',
+                               'Note',
+                               'StatusId',
+                               'Priority',
+                               'CustomFields']
+
+        return api_method, data, expected_parameters
+
+    @api_call
+    def create_note(self, contact_id, note, raw_response=False):
+        """ Creates a new note in LACRM for a given contactid """
+
+        data = {}
+        data['ContactId'] = contact_id
+        data['Note'] = note
+        api_method = 'CreateNote'
+        expected_parameters = ['ContactId', 'Note']
+
+        return api_method, data, expected_parameters
+
+    @api_call
+    def create_task(self, data, raw_response=False):
+        """ Creates a new task in LACRM """
+
+        api_method = 'CreateTask'
+        expected_parameters = ['ContactId',
+                               'DueDate',  # YYYY-MM-DD
+                               'Description',
+                               'ContactId',
+                               'AssignedTo']
+
+        return api_method, data, expected_parameters
+
+    @api_call
+    def create_event(self, data, raw_response=False):
+        """ Creates a new event in LACRM """
+
+        api_method = 'CreateEvent'
+        expected_parameters = ['Date',
+                               'StartTime',  # 24:00
+                               'EndTime',  # 24:00
+                               'Name',
+                               'Description',
+                               'Contacts',
+                               'Users']
+
+        return api_method, data, expected_parameters
+
+    @api_call
+    def get_pipeline_report(self, pipeline_id, data, raw_response=False):
+        """ Grabs a pipeline_report in LACRM """
+
+        data = dict(data, PipelineId=pipeline_id)
+        api_method = 'GetPipelineReport'
+        expected_parameters = ['PipelineId',
+                               'SortBy',
+                               'NumRows',
+                               'Page',
+                               'SortDirection',
+                               'UserFilter',
+                               'StatusFilter']
+
+        return api_method, data, expected_parameters
+
+    def _upsert_operation(self, data, match_on):
+        """ Returns the call that upserts ``data``, validated """
+
+        contact_id = self.index.find(data, match_on)
+        if contact_id is None:
+            operation = ('create_contact', data)
+        else:
+            operation = ('edit_contact', contact_id, data)
+        self.prepare_call(*operation)
+        return operation
+
+    def _upsert_round(self, rows, remaining, match_on, results):
+        """ Plans the upserts of ``rows`` at ``remaining`` positions that
+        can be sent together
+
+        Returns ``(batch, deferred)``: the ``(position, operation)`` pairs
+        to send now, and the positions of rows that would create the same
+        new contact as a row in the batch. Invalid rows get a failed
+        BulkResult in ``results``.
+        """
+
+        batch, deferred, claimed = [], [], set()
+        for position in remaining:
+            data = rows[position]
+            try:
+                operation = self._upsert_operation(data, match_on)
+            except LacrmArgumentError as error:
+                results[position] = BulkResult(position, ('upsert', data),
+                                               None, error)
+                continue
+            if operation[0] == 'create_contact':
+                keys = match_keys(data, match_on)
+                if keys & claimed:
+                    deferred.append(position)
+                    continue
+                claimed |= keys
+            batch.append((position, operation))
+
+        return batch, deferred
+
+    def _require_index(self):
+        if self.index is None:
+            raise LacrmArgumentError(content='upsert_contact needs a '
+                                     'lacrm.index.ContactIndex passed as '
+                                     'index=')
+
+    def __validator(self, parameters, known_parameters):
+        for param in parameters:
+            if param not in known_parameters:
+                raise LacrmArgumentError(content='The provided parameter "{}" '
+                                         'cannot be recognized by the '
+                                         'API'.format(param))
@@ -0,0 +1,95 @@
+"Bulk write executor for lacrm"
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from lacrm.utils import LacrmArgumentError
+
+# Outcome of one bulk operation. Exactly one of ``result`` and ``error`` is
+# set; ``result`` is what the matching Lacrm method would have returned.
+BulkResult = namedtuple('BulkResult', ['index', 'operation', 'result', 'error'])
+
+
+class BulkReport(object):
+    """Per-item results of a bulk run, in input order"""
+
+    def __init__(self, results):
+        self.results = results
+
+    @property
+    def succeeded(self):
+        return [result for result in self.results if result.error is None]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if result.error is not None]
+
+    def summary(self):
+        """ Returns counts of total, succeeded and failed operations """
+
+        failed = len(self.failed)
+        return {'total': len(self.results),
+                'succeeded': len(self.results) - failed,
+                'failed': failed}
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+
+def prepare_operations(lacrm, operations):
+    """ Validates bulk operations before any request is sent
+
+    Returns the operations as a list, a result slot per operation (filled
+    with a failed BulkResult where it could not be prepared) and the
+    ``(index, api_method, parameters)`` of those left to send.
+    """
+
+    operations = list(operations)
+    results = [None] * len(operations)
+    prepared = []
+
+    for index, operation in enumerate(operations):
+        try:
+            if not operation:
+                raise LacrmArgumentError(content='A bulk operation is a '
+                                         'tuple of a method name and its '
+                                         'arguments, not {!r}'.format(
+                                             operation))
+            api_method, parameters = lacrm.prepare_call(operation[0],
+                                                        *operation[1:])
+        # Malformed operations can fail in many ways inside a method's
+        # request builder; each only fails its own result
+        except Exception as error:  # pylint: disable=broad-except
+            results[index] = BulkResult(index, operation, None, error)
+        else:
+            prepared.append((index, api_method, parameters))
+
+    return operations, results, prepared
+
+
+def run_bulk(lacrm, operations, concurrency=8):
+    """ Runs many API method calls with bounded parallelism
+
+    Each operation is a tuple of a Lacrm method name followed by its
+    positional arguments, e.g. ``('create_note', contact_id, 'Called')``.
+    Every operation is validated before any request is sent; invalid ones
+    are reported as failed and never reach the API.
+    """
+
+    operations, results, prepared = prepare_operations(lacrm, operations)
+
+    def send(item):
+        index, api_method, parameters = item
+        try:
+            result = lacrm.send_prepared(api_method, parameters)
+        except Exception as error:  # pylint: disable=broad-except
+            return BulkResult(index, operations[index], None, error)
+        return BulkResult(index, operations[index], result, None)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for result in executor.map(send, prepared):
+            results[result.index] = result
+
+    return BulkReport(results)
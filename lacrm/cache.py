@@ -0,0 +1,198 @@
+"In-memory response cache for lacrm read methods"
+
+import copy
+import json
+import threading
+from collections import OrderedDict
+
+from lacrm.utils import _clock
+
+# Seconds a cached response stays fresh, per API function. Functions not
+# listed here are never cached.
+DEFAULT_TTL = {'GetContact': 60,
+               'SearchContacts': 30,
+               'GetPipelineReport': 30}
+
+# Writes that can change which records a cached listing returns. Any
+# successful call to the key drops every cached entry for the listed reads.
+LISTING_INVALIDATIONS = {'CreateContact': ('SearchContacts',),
+                         'EditContact': ('SearchContacts',),
+                         'DeleteContact': ('SearchContacts',),
+                         'AddContactToGroup': ('SearchContacts',),
+                         'CreatePipeline': ('GetPipelineReport',),
+                         'UpdatePipelineItem': ('GetPipelineReport',)}
+
+ID_FIELDS = ('ContactId', 'PipelineItemId')
+
+
+def _collect_ids(value, found):
+    """ Gathers the ContactId/PipelineItemId values found in a response """
+
+    if isinstance(value, dict):
+        for field in ID_FIELDS:
+            if field in value:
+                found.add((field, str(value[field])))
+        for item in value.values():
+            if isinstance(item, (dict, list)):
+                _collect_ids(item, found)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_ids(item, found)
+
+    return found
+
+
+class ResponseCache(object):
+    """Size-bounded LRU cache of decoded API responses
+
+    Responses from the read functions named in ``ttl`` are kept for that
+    many seconds, up to ``maxsize`` entries in total. Every entry is tagged
+    with the ContactId/PipelineItemId values in its parameters and body, so
+    a write touching one of those ids evicts it. Writes that can change a
+    listing (see ``LISTING_INVALIDATIONS``) evict that listing entirely.
+
+    A read that missed is not stored if, while it was in flight, a write
+    invalidated one of its tags: its response may predate that write.
+
+    Keys and tags include the ``account`` (user code) the client passes, so
+    the cache is thread safe and can be shared between clients, including
+    clients of different accounts.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, clock=_clock):
+        self.maxsize = maxsize
+        self.ttl = dict(DEFAULT_TTL)
+        if ttl:
+            self.ttl.update(ttl)
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._tags = {}
+        # Invalidations are numbered; each tag remembers the last one that
+        # hit it and each missed read the number current when it missed
+        self._sequence = 0
+        self._invalidated = {}
+        self._missed = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(api_method, parameters, account):
+        return account, api_method, json.dumps(parameters, sort_keys=True)
+
+    def get(self, api_method, parameters, account=None):
+        """ Returns a ``(found, body)`` pair for a read call """
+
+        if api_method not in self.ttl:
+            return False, None
+
+        key = self._key(api_method, parameters, account)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                self._discard(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                self._missed.setdefault(key, self._sequence)
+                while len(self._missed) > self.maxsize:
+                    self._missed.popitem(last=False)
+                return False, None
+
+            self._entries[key] = self._entries.pop(key)
+            self.hits += 1
+            body = entry[1]
+
+        return True, copy.deepcopy(body)
+
+    def update(self, api_method, parameters, body, account=None):
+        """ Stores a read's response, or invalidates what a write affects """
+
+        if api_method in self.ttl:
+            self._store(api_method, parameters, body, account)
+        else:
+            self._invalidate(api_method, parameters, account)
+
+    def _store(self, api_method, parameters, body, account):
+        key = self._key(api_method, parameters, account)
+        tags = _collect_ids(parameters, set())
+        _collect_ids(body, tags)
+        tags.add(api_method)
+        tags = set((account, tag) for tag in tags)
+        expires = self._clock() + self.ttl[api_method]
+
+        with self._lock:
+            missed_at = self._missed.pop(key, None)
+            if missed_at is not None and any(
+                    self._invalidated.get(tag, missed_at) > missed_at
+                    for tag in tags):
+                return
+            self._discard(key)
+            self._entries[key] = (expires, copy.deepcopy(body), tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+            while len(self._entries) > self.maxsize:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _invalidate(self, api_method, parameters, account):
+        tags = set((account, listing) for listing in
+                   LISTING_INVALIDATIONS.get(api_method, ()))
+        for field in ID_FIELDS:
+            if field in parameters:
+                tags.add((account, (field, str(parameters[field]))))
+
+        with self._lock:
+            self._sequence += 1
+            for tag in tags:
+                self._invalidated[tag] = self._sequence
+                for key in list(self._tags.get(tag, ())):
+                    self._discard(key)
+                    self.invalidations += 1
+            if len(self._invalidated) > self.maxsize:
+                self._forget_invalidations()
+
+    def _forget_invalidations(self):
+        """ Drops invalidations older than every read in flight; caller
+        holds the lock """
+
+        oldest = min(self._missed.values()) if self._missed else \
+            self._sequence
+        for tag, sequence in list(self._invalidated.items()):
+            if sequence <= oldest:
+                del self._invalidated[tag]
+
+    def _discard(self, key):
+        """ Removes an entry and its tag references; caller holds the lock """
+
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def clear(self):
+        """ Drops every cached response """
+
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._invalidated.clear()
+            self._missed.clear()
+
+    def stats(self):
+        """ Returns a snapshot of the cache counters """
+
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'invalidations': self.invalidations,
+                    'size': len(self._entries)}
@@ -0,0 +1,20 @@
+"Shared helpers for the lacrm console scripts"
+
+from lacrm.api import Lacrm
+
+
+def add_client_arguments(parser):
+    """ Adds the credential and connection options every script accepts """
+
+    parser.add_argument('--user-code', help='LACRM user code (defaults to '
+                        'the ~/.lacrm dotfile)')
+    parser.add_argument('--api-token', help='LACRM API token')
+    parser.add_argument('--rate-limit', type=float, default=None,
+                        help='maximum requests per second')
+
+
+def client_from_args(args, **kwargs):
+    """ Builds a Lacrm client from parsed command line options """
+
+    return Lacrm(user_code=args.user_code, api_token=args.api_token,
+                 rate_limit=args.rate_limit, **kwargs)
@@ -0,0 +1,170 @@
+"JSON codecs and incremental response parsing for lacrm"
+
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+_WHITESPACE = ' \t\n\r'
+
+# Characters that can follow the prefix of a JSON number within it
+_NUMBER_TAIL = '.eE+-0123456789'
+
+
+class JsonCodec(object):
+    """Standard library JSON encoder/decoder
+
+    A codec needs ``dumps(obj) -> str`` and ``loads(bytes_or_str) -> obj``;
+    subclass this (or duck-type it) to plug in another JSON library.
+    """
+
+    name = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj)
+
+    def loads(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """orjson-backed codec, several times faster on large pages"""
+
+    name = 'orjson'
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+def default_codec():
+    """ Returns the fastest codec available in this environment """
+
+    if orjson is not None:
+        return OrjsonCodec()
+    return JsonCodec()
+
+
+class _ChunkBuffer(object):
+    """Text buffer fed from an iterator of byte chunks"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self.text = ''
+        self.pos = 0
+        self.exhausted = False
+        self.value_start = 0
+        self._pending = b''
+
+    def more(self):
+        """ Appends the next chunk; returns False once the input is done """
+
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            data = self._pending + chunk
+            # Hold back an incomplete trailing UTF-8 sequence
+            try:
+                decoded = data.decode('utf-8')
+                self._pending = b''
+            except UnicodeDecodeError as error:
+                decoded = data[:error.start].decode('utf-8')
+                self._pending = data[error.start:]
+            # Drop what has been consumed so the buffer stays small
+            self.text = self.text[self.pos:] + decoded
+            self.pos = 0
+            return True
+
+        self.exhausted = True
+        return False
+
+    def peek(self):
+        """ Returns the next non-whitespace character, reading as needed """
+
+        while True:
+            while self.pos < len(self.text) and \
+                    self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.more():
+                raise ValueError('Unexpected end of JSON response')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Expected "{}" in JSON response at offset '
+                             '{}'.format(char, self.pos))
+        self.pos += 1
+
+    def decode_value(self, decoder):
+        """ Decodes one complete JSON value, reading more input as needed
+
+        Afterwards the value's text is ``text[value_start:pos]``.
+        """
+
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.text, self.pos)
+            except ValueError:
+                if not self.more():
+                    raise
+                continue
+            # A number ending at the buffer's end, or followed by what can
+            # only continue it (e.g. "1." then "5"), may still be growing
+            if (end == len(self.text) or self.text[end] in _NUMBER_TAIL) \
+                    and not self.exhausted and self.more():
+                continue
+            self.value_start = self.pos
+            self.pos = end
+            return value
+
+
+def iter_json_array(chunks, key='Result', raw=False):
+    """ Yields the items of ``obj[key]`` from a streamed JSON object
+
+    ``chunks`` is an iterable of bytes, e.g. ``response.iter_content()``.
+    Items are decoded one at a time as soon as they have fully arrived, so
+    a page never needs to be held in memory as a whole. Other top-level
+    members are decoded and discarded. With ``raw``, each item's JSON text
+    is yielded instead of the decoded value.
+    """
+
+    decoder = json.JSONDecoder()
+    buf = _ChunkBuffer(chunks)
+
+    buf.expect('{')
+    if buf.peek() == '}':
+        return
+
+    while True:
+        member = buf.decode_value(decoder)
+        buf.expect(':')
+
+        if member == key and buf.peek() == '[':
+            buf.pos += 1
+            if buf.peek() == ']':
+                buf.pos += 1
+            else:
+                while True:
+                    value = buf.decode_value(decoder)
+                    yield buf.text[buf.value_start:buf.pos] if raw else value
+                    if buf.peek() == ',':
+                        buf.pos += 1
+                        continue
+                    buf.expect(']')
+                    break
+        else:
+            buf.decode_value(decoder)
+
+        if buf.peek() == ',':
+            buf.pos += 1
+            continue
+        buf.expect('}')
+        return
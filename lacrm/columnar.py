@@ -0,0 +1,329 @@
+"""Columnar views of LACRM listings, with vectorized aggregations
+
+``ColumnarListing`` holds a contact list or pipeline report as one NumPy
+array per field instead of one dict per record. Low-cardinality fields
+such as Status, Priority and the assigned user are dictionary-encoded:
+each row stores a small integer code into a shared table of values, so
+counting or grouping by them is a ``bincount`` rather than a Python loop.
+Date fields are ``datetime64`` arrays; everything else is an object array.
+
+NumPy is required (``pip install lacrm[columnar]``); pandas is only needed
+for ``to_pandas``.
+"""
+
+import time
+from array import array
+from collections import OrderedDict
+
+from lacrm.utils import LacrmArgumentError
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+try:
+    import pandas as pd
+except ImportError:  # pragma: no cover - optional dependency
+    pd = None
+
+# Fields stored as categoricals (integer codes into a table of values)
+CATEGORY_FIELDS = ('Status', 'StatusId', 'Priority', 'PipelineId', 'UserId',
+                   'AssignedTo', 'assignedTo', 'CompanyName', 'Title')
+
+# Fields stored as datetime64, parsed from LACRM's "YYYY-MM-DD HH:MM:SS"
+DATE_FIELDS = ('DateEntered', 'LastUpdate', 'LastUpdated', 'DateUpdated',
+               'LastNoteDate')
+
+# Candidates, in order, for the field ``age_days`` measures from
+LAST_UPDATE_FIELDS = ('LastUpdate', 'LastUpdated', 'DateUpdated',
+                      'LastNoteDate', 'DateEntered')
+
+_SECONDS_PER_DAY = 86400.0
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('Columnar listings require numpy '
+                          '(pip install lacrm[columnar]).')
+
+
+class Categorical(object):
+    """A dictionary-encoded column
+
+    ``codes`` is an int32 array indexing ``categories``; missing values
+    are coded -1.
+    """
+
+    __slots__ = ('codes', 'categories')
+
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.codes)
+
+    def values(self):
+        """ Decodes the column into an object array, None where missing """
+
+        # Code -1 picks the None appended at the end
+        table = np.append(self.categories, None)
+        return table[self.codes]
+
+    def counts(self):
+        """ Returns how many rows hold each category, as an int array """
+
+        present = self.codes[self.codes >= 0]
+        return np.bincount(present, minlength=len(self.categories))
+
+
+class _CategoryBuilder(object):
+
+    def __init__(self, rows=0):
+        self.codes = array('i', [-1] * rows)
+        self.lookup = {}
+
+    def append(self, value):
+        if value is None or value == '':
+            self.codes.append(-1)
+            return
+        code = self.lookup.get(value)
+        if code is None:
+            code = self.lookup[value] = len(self.lookup)
+        self.codes.append(code)
+
+    def finish(self):
+        categories = np.empty(len(self.lookup), dtype=object)
+        for value, code in self.lookup.items():
+            categories[code] = value
+        return Categorical(np.asarray(self.codes, dtype=np.int32),
+                           categories)
+
+
+class _ValueBuilder(object):
+
+    def __init__(self, rows=0):
+        self.values = [None] * rows
+
+    def append(self, value):
+        self.values.append(value)
+
+    def finish(self):
+        column = np.empty(len(self.values), dtype=object)
+        column[:] = self.values
+        return column
+
+
+class _DateBuilder(_ValueBuilder):
+
+    def finish(self):
+        try:
+            return np.array([str(value).replace(' ', 'T') if value else 'NaT'
+                             for value in self.values], dtype='datetime64[s]')
+        except ValueError:
+            # Not a date LACRM normally sends; keep the text
+            return super(_DateBuilder, self).finish()
+
+
+def _builder_for(field, rows):
+    if field in CATEGORY_FIELDS:
+        return _CategoryBuilder(rows)
+    if field in DATE_FIELDS:
+        return _DateBuilder(rows)
+    return _ValueBuilder(rows)
+
+
+class ColumnarBuilder(object):
+    """Accumulates records page by page into columns
+
+    Records are consumed as they are added, so a listing never has to be
+    held as a list of dicts. Fields are discovered as they appear; records
+    that lack a field get a missing value.
+    """
+
+    def __init__(self):
+        self._builders = OrderedDict()
+        self.rows = 0
+
+    def add(self, records):
+        for record in records:
+            for field in record:
+                if field not in self._builders:
+                    self._builders[field] = _builder_for(field, self.rows)
+            for field, builder in self._builders.items():
+                builder.append(record.get(field))
+            self.rows += 1
+        return self
+
+    def finish(self):
+        """ Returns the ColumnarListing built so far """
+
+        _require_numpy()
+        return ColumnarListing(OrderedDict(
+            (field, builder.finish())
+            for field, builder in self._builders.items()))
+
+
+class ColumnarListing(object):
+    """Records of one listing held column by column
+
+    ``listing['Status']`` returns the decoded column as an array; use
+    ``column`` to get a ``Categorical`` itself.
+    """
+
+    def __init__(self, columns):
+        _require_numpy()
+        self.columns = columns
+
+    @classmethod
+    def from_records(cls, records):
+        """ Builds a listing from an iterable of dicts or records """
+
+        return ColumnarBuilder().add(records).finish()
+
+    @classmethod
+    def from_pages(cls, pages):
+        """ Builds a listing from an iterable of pages of records """
+
+        builder = ColumnarBuilder()
+        for page in pages:
+            builder.add(page)
+        return builder.finish()
+
+    def __len__(self):
+        for column in self.columns.values():
+            return len(column)
+        return 0
+
+    def __contains__(self, field):
+        return field in self.columns
+
+    @property
+    def fields(self):
+        return list(self.columns)
+
+    def column(self, field):
+        """ Returns a field's stored column, Categorical or array """
+
+        return self.columns[field]
+
+    def __getitem__(self, field):
+        column = self.columns[field]
+        if isinstance(column, Categorical):
+            return column.values()
+        return column
+
+    def count_by(self, field):
+        """ Returns ``{value: rows}`` for a categorical field, largest first
+
+        Rows missing the field are not counted.
+        """
+
+        column = self._categorical(field)
+        counts = column.counts()
+        order = np.argsort(-counts, kind='stable')
+        return OrderedDict((column.categories[code], int(counts[code]))
+                           for code in order if counts[code])
+
+    def counts_by_status(self):
+        return self.count_by('Status')
+
+    def priority_histogram(self):
+        return self.count_by('Priority')
+
+    def crosstab(self, row_field, column_field):
+        """ Counts rows for every pair of values of two categorical fields
+
+        Returns ``(counts, row_values, column_values)`` where ``counts`` is
+        a 2-D int array.
+        """
+
+        rows = self._categorical(row_field)
+        columns = self._categorical(column_field)
+        present = (rows.codes >= 0) & (columns.codes >= 0)
+        flat = (rows.codes[present].astype(np.int64) * len(columns.categories)
+                + columns.codes[present])
+        counts = np.bincount(
+            flat, minlength=len(rows.categories) * len(columns.categories))
+        return (counts.reshape(len(rows.categories), len(columns.categories)),
+                rows.categories, columns.categories)
+
+    def age_days(self, field=None, now=None):
+        """ Days elapsed since a date field, NaN where it is missing
+
+        ``field`` defaults to the first of LAST_UPDATE_FIELDS present, and
+        ``now`` (a Unix timestamp) to the current time.
+        """
+
+        if field is None:
+            field = next((name for name in LAST_UPDATE_FIELDS
+                          if name in self.columns), None)
+            if field is None:
+                raise KeyError('no last-update field in this listing')
+
+        dates = self.columns[field]
+        if now is None:
+            now = time.time()
+        now = np.datetime64(int(now), 's')
+        age = (now - dates).astype('timedelta64[s]').astype(np.float64)
+        age[np.isnat(dates)] = np.nan
+        return age / _SECONDS_PER_DAY
+
+    def mean_age_by(self, field, date_field=None, now=None):
+        """ Returns ``{value: mean age in days}`` for a categorical field """
+
+        column = self._categorical(field)
+        age = self.age_days(date_field, now)
+        present = (column.codes >= 0) & ~np.isnan(age)
+        codes = column.codes[present]
+        totals = np.bincount(codes, weights=age[present],
+                             minlength=len(column.categories))
+        counts = np.bincount(codes, minlength=len(column.categories))
+        return OrderedDict((column.categories[code],
+                            float(totals[code] / counts[code]))
+                           for code in range(len(column.categories))
+                           if counts[code])
+
+    def _categorical(self, field):
+        column = self.columns[field]
+        if not isinstance(column, Categorical):
+            raise TypeError('"{}" is not a categorical field'.format(field))
+        return column
+
+    def to_pandas(self):
+        """ Returns a DataFrame with pandas categoricals and datetimes """
+
+        if pd is None:
+            raise ImportError('to_pandas requires pandas '
+                              '(pip install lacrm[columnar]).')
+
+        data = OrderedDict()
+        for field, column in self.columns.items():
+            if isinstance(column, Categorical):
+                data[field] = pd.Categorical.from_codes(column.codes,
+                                                        column.categories)
+            else:
+                data[field] = column
+        return pd.DataFrame(data)
+
+
+def to_columnar(pages, columnar):
+    """ Builds what ``columnar=`` asks for from an iterable of pages
+
+    ``columnar`` is ``'numpy'`` (or True) for a ColumnarListing, or
+    ``'pandas'`` for a DataFrame.
+    """
+
+    if columnar not in (True, 'numpy', 'pandas'):
+        raise LacrmArgumentError(content='columnar must be "numpy" or '
+                                 '"pandas", not {!r}'.format(columnar))
+    _require_numpy()
+    if columnar == 'pandas' and pd is None:
+        raise ImportError('columnar="pandas" requires pandas '
+                          '(pip install lacrm[columnar]).')
+
+    listing = ColumnarListing.from_pages(pages)
+    if columnar == 'pandas':
+        return listing.to_pandas()
+    return listing
@@ -0,0 +1,168 @@
+"Credential sources and a process-wide credential cache for lacrm"
+
+import os
+import threading
+from collections import namedtuple
+from os.path import expanduser
+
+try:
+    from configparser import RawConfigParser, NoOptionError
+except ImportError:  # Python 2
+    from ConfigParser import RawConfigParser, NoOptionError
+
+from lacrm.utils import LacrmArgumentError
+
+# Single-account dotfile in the home directory, holding USER_CODE:API_TOKEN
+DOTFILE = '.lacrm'
+
+# Multi-account file in the home directory, one INI section per account:
+#
+#     [acme]
+#     user_code = ABC12
+#     api_token = ...
+#     rate_limit = 5
+ACCOUNTS_FILE = '.lacrm_accounts'
+
+ENV_USER_CODE = 'LACRM_USER_CODE'
+ENV_API_TOKEN = 'LACRM_API_TOKEN'
+ENV_ACCOUNTS_FILE = 'LACRM_ACCOUNTS_FILE'
+
+# Credentials for one LACRM account; ``rate_limit`` (requests per second)
+# is None when the account does not set one
+Account = namedtuple('Account', ['name', 'user_code', 'api_token',
+                                 'rate_limit'])
+
+
+def parse_dotfile(file_path):
+    """ Reads USER_CODE:API_TOKEN from a dotfile, or returns None
+
+    Raises LacrmArgumentError if the file exists but is malformed.
+    """
+
+    creds = None
+
+    try:
+        with open(file_path, 'r') as credfile:
+            for line in credfile:
+                if line.strip()[0] == '#':
+                    pass
+                elif ':' in line:
+                    user_code = line.strip().split(':')[0]
+                    api_token = line.strip().split(':')[1]
+                    creds = user_code, api_token
+                    break
+        return creds
+
+    # Fail silently as most people will not have creds file
+    except IOError:
+        return None
+
+    except (UnboundLocalError, IndexError):
+        raise LacrmArgumentError(
+            content='Attempted to use a credentials dotfile ({}) but it is '
+            'either empty or malformed. Credentials should be in the form '
+            'USER_CODE:API_TOKEN.'.format(file_path))
+
+
+def parse_accounts_file(file_path):
+    """ Reads every account from a multi-account INI file """
+
+    # Raw, so a "%" in a token is not taken as an interpolation
+    parser = RawConfigParser()
+    if not parser.read(file_path):
+        return {}
+
+    accounts = {}
+    for name in parser.sections():
+        try:
+            user_code = parser.get(name, 'user_code')
+            api_token = parser.get(name, 'api_token')
+        except NoOptionError:
+            raise LacrmArgumentError(content='Account "{}" in {} needs both '
+                                     'user_code and api_token'.format(
+                                         name, file_path))
+        rate_limit = None
+        if parser.has_option(name, 'rate_limit'):
+            rate_limit = parser.getfloat(name, 'rate_limit')
+        accounts[name] = Account(name, user_code, api_token, rate_limit)
+
+    return accounts
+
+
+class CredentialStore(object):
+    """Thread-safe cache of credentials read from disk and the environment
+
+    Files are parsed once and re-read only when their modification time
+    changes, so creating many clients costs a ``stat`` rather than a parse
+    each. ``lacrm.credentials.CREDENTIALS`` is the process-wide instance
+    every client uses.
+    """
+
+    def __init__(self, environ=None):
+        self._environ = os.environ if environ is None else environ
+        self._lock = threading.Lock()
+        self._files = {}
+
+    def _cached(self, file_path, parse, missing=None):
+        try:
+            mtime = os.stat(file_path).st_mtime
+        except OSError:
+            mtime = None
+
+        with self._lock:
+            cached = self._files.get(file_path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+
+        value = parse(file_path) if mtime is not None else missing
+        with self._lock:
+            self._files[file_path] = (mtime, value)
+        return value
+
+    def dotfile(self, filename=DOTFILE):
+        """ Returns ``(user_code, api_token)`` from ``~/filename``, or None """
+
+        return self._cached(expanduser('~') + '/' + filename, parse_dotfile)
+
+    def environment(self):
+        """ Returns credentials from LACRM_USER_CODE/LACRM_API_TOKEN """
+
+        user_code = self._environ.get(ENV_USER_CODE)
+        api_token = self._environ.get(ENV_API_TOKEN)
+        if user_code and api_token:
+            return user_code, api_token
+        return None
+
+    def default(self):
+        """ Credentials from the environment, else the dotfile, else None """
+
+        return self.environment() or self.dotfile()
+
+    def accounts(self, file_path=None):
+        """ Returns every account in the multi-account file, by name
+
+        The file defaults to $LACRM_ACCOUNTS_FILE or ``~/.lacrm_accounts``.
+        """
+
+        if file_path is None:
+            file_path = self._environ.get(ENV_ACCOUNTS_FILE) or \
+                expanduser('~') + '/' + ACCOUNTS_FILE
+        return self._cached(file_path, parse_accounts_file, {})
+
+    def account(self, name, file_path=None):
+        """ Returns one named account or raises LacrmArgumentError """
+
+        account = self.accounts(file_path).get(name)
+        if account is None:
+            raise LacrmArgumentError(content='No credentials found for '
+                                     'account "{}"'.format(name))
+        return account
+
+    def clear(self):
+        """ Forgets every cached file """
+
+        with self._lock:
+            self._files.clear()
+
+
+CREDENTIALS = CredentialStore()
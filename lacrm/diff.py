@@ -0,0 +1,203 @@
+"""Diffing of outgoing writes against known record snapshots
+
+EditContact and UpdatePipelineItem replace only the fields they are sent,
+so a write can be reduced to the fields that differ from what the record
+already holds, and skipped entirely when nothing does. The record's
+current state comes from a snapshot: one passed to the call, or one kept
+in a ``SnapshotStore`` that the client fills from its own reads and
+writes.
+"""
+
+import copy
+import io
+import json
+import os
+import threading
+
+from lacrm.utils import _replace
+
+try:
+    text_type = unicode  # noqa: F821 - Python 2
+except NameError:
+    text_type = str
+
+# Writes that can be diffed: the field naming the record, and fields that
+# are actions rather than state and are therefore always sent
+DIFF_METHODS = {'EditContact': ('ContactId', ('Note',)),
+                'UpdatePipelineItem': ('PipelineItemId', ('Note',))}
+
+# Responses whose records are kept as snapshots, by the field naming them
+SNAPSHOT_SOURCES = {'GetContact': ('Contact', 'ContactId'),
+                    'SearchContacts': ('Result', 'ContactId'),
+                    'GetPipelineReport': ('Result', 'PipelineItemId')}
+
+
+def custom_fields_dict(value):
+    """ CustomFields as a name to value dict, from either API shape """
+
+    if isinstance(value, list):
+        return dict((field.get('Name'), field.get('Value'))
+                    for field in value if isinstance(field, dict))
+    return dict(value or {})
+
+
+def same_value(old, new):
+    """ Compares API values loosely: 5 matches "5" and None matches "" """
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        return (set(old) == set(new) and
+                all(same_value(old[key], new[key]) for key in new))
+    if isinstance(old, list) and isinstance(new, list):
+        return (len(old) == len(new) and
+                all(same_value(a, b) for a, b in zip(old, new)))
+    if isinstance(old, (dict, list)) or isinstance(new, (dict, list)):
+        return False
+    if old is None or new is None:
+        return old in (None, '') and new in (None, '')
+    return text_type(old) == text_type(new)
+
+
+def diff_write(api_method, parameters, snapshot):
+    """ Returns the parameters that change ``snapshot``, or None
+
+    The record's id is always kept. CustomFields are compared field by
+    field and only changed ones are sent. None means nothing changed.
+    """
+
+    id_field, always_sent = DIFF_METHODS[api_method]
+    changed = {}
+    for field, value in parameters.items():
+        if field == id_field:
+            continue
+        if field in always_sent:
+            changed[field] = value
+        elif field == 'CustomFields':
+            old = custom_fields_dict(snapshot.get(field))
+            fields = dict((name, new) for name, new in
+                          custom_fields_dict(value).items()
+                          if not same_value(old.get(name), new))
+            if fields:
+                changed[field] = fields
+        elif field not in snapshot or not same_value(snapshot[field], value):
+            changed[field] = value
+
+    if not changed:
+        return None
+    changed[id_field] = parameters[id_field]
+    return changed
+
+
+class SnapshotStore(object):
+    """Thread-safe store of the last known state of contacts and pipeline
+    items
+
+    A client given a store keeps it current: records it reads are saved,
+    and fields it writes are merged in. With a ``path`` the store is loaded
+    from that JSON file and ``save()`` writes it back, so snapshots outlive
+    the process; without one, ``save()`` does nothing. ``skipped`` counts
+    writes found to change nothing.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._records = {}
+        self.skipped = 0
+        self.sent = 0
+        if path is not None and os.path.exists(path):
+            with io.open(path, encoding='utf-8') as stored:
+                for key, record in json.load(stored).items():
+                    id_field, record_id = key.split(':', 1)
+                    self._records[(id_field, record_id)] = record
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, id_field, record_id):
+        """ Returns a copy of a record's snapshot, or None """
+
+        with self._lock:
+            record = self._records.get((id_field, str(record_id)))
+            return copy.deepcopy(record)
+
+    def put(self, id_field, record_id, record):
+        with self._lock:
+            self._records[(id_field, str(record_id))] = copy.deepcopy(record)
+
+    def merge(self, id_field, record_id, fields):
+        """ Applies written fields to a snapshot, creating it if needed """
+
+        with self._lock:
+            record = self._records.setdefault((id_field, str(record_id)), {})
+            for field, value in fields.items():
+                if field == 'CustomFields':
+                    merged = custom_fields_dict(record.get(field))
+                    merged.update(custom_fields_dict(value))
+                    value = merged
+                record[field] = copy.deepcopy(value)
+
+    def remove(self, id_field, record_id):
+        with self._lock:
+            self._records.pop((id_field, str(record_id)), None)
+
+    def diff(self, api_method, parameters, snapshot=None):
+        """ Reduces a write to its changed fields; None if it changes
+        nothing
+
+        ``snapshot`` overrides the stored one. Without either, the write is
+        returned whole.
+        """
+
+        id_field = DIFF_METHODS[api_method][0]
+        if snapshot is None:
+            snapshot = self.get(id_field, parameters[id_field])
+        changed = parameters if snapshot is None else \
+            diff_write(api_method, parameters, snapshot)
+        with self._lock:
+            if changed is None:
+                self.skipped += 1
+            else:
+                self.sent += 1
+        return changed
+
+    def update(self, api_method, parameters, body):
+        """ Records what a successful response says about records """
+
+        source = SNAPSHOT_SOURCES.get(api_method)
+        if source is not None:
+            key, id_field = source
+            found = body.get(key)
+            for record in found if isinstance(found, list) else [found]:
+                if isinstance(record, dict) and record.get(id_field):
+                    self.put(id_field, record[id_field], record)
+        elif api_method in DIFF_METHODS:
+            id_field = DIFF_METHODS[api_method][0]
+            fields = dict((field, value) for field, value in parameters.items()
+                          if field not in DIFF_METHODS[api_method][1])
+            self.merge(id_field, parameters[id_field], fields)
+        elif api_method == 'CreateContact' and body.get('ContactId'):
+            self.put('ContactId', body['ContactId'],
+                     dict(parameters, ContactId=body['ContactId']))
+        elif api_method == 'DeleteContact':
+            self.remove('ContactId', parameters['ContactId'])
+
+    def stats(self):
+        """ Returns counts of stored records and of sent and skipped
+        writes """
+
+        with self._lock:
+            return {'records': len(self._records), 'sent': self.sent,
+                    'skipped': self.skipped}
+
+    def save(self):
+        """ Writes the store to ``path`` atomically, if set """
+
+        if not self.path:
+            return
+        with self._lock:
+            stored = dict(('{}:{}'.format(*key), record)
+                          for key, record in self._records.items())
+        temp_path = self.path + '.tmp'
+        with io.open(temp_path, 'w', encoding='utf-8') as out:
+            out.write(text_type(json.dumps(stored)))
+        _replace(temp_path, self.path)
@@ -0,0 +1,325 @@
+"""Resumable streaming export of LACRM contacts and pipeline reports
+
+Pages are written as they arrive, so memory use is bounded by the page
+window rather than the size of the account. After each page is flushed to
+disk a checkpoint records how many records have been written; rerunning an
+interrupted export with the same checkpoint resumes after them. A
+checkpoint of a finished export is ignored, and the export starts over.
+
+    lacrm-export contacts contacts.ndjson --checkpoint contacts.ckpt
+    lacrm-export pipeline 3848 pipeline.csv --concurrency 4
+"""
+
+from __future__ import print_function
+import argparse
+import csv
+import io
+import json
+import os
+
+from lacrm.cli import add_client_arguments, client_from_args
+from lacrm.codec import default_codec
+from lacrm.pagination import PagePlan
+from lacrm.utils import LacrmArgumentError, _replace
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+try:
+    text_type = unicode  # noqa: F821 - Python 2
+except NameError:
+    text_type = str
+
+FORMATS = ('ndjson', 'csv', 'parquet')
+
+# Column holding any field that was not present on the first page
+EXTRA_COLUMN = '_extra'
+
+
+def guess_format(path):
+    """ Infers an export format from a file name """
+
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension in ('ndjson', 'jsonl', 'json'):
+        return 'ndjson'
+    if extension in ('csv', 'parquet'):
+        return extension
+    raise LacrmArgumentError(content='Cannot infer an export format from '
+                             '"{}"; pass one of {}'.format(path, FORMATS))
+
+
+class Checkpoint(object):
+    """Progress of one export, persisted as JSON after every page"""
+
+    def __init__(self, path, state):
+        self.path = path
+        self.state = state
+
+    @classmethod
+    def load(cls, path, source, fmt):
+        """ Loads an unfinished checkpoint, or starts a fresh one for this
+        export """
+
+        state = {'source': source, 'format': fmt, 'records': 0,
+                 'offset': None, 'columns': None, 'done': False}
+        if path and os.path.exists(path):
+            with open(path) as checkpoint_file:
+                saved = json.load(checkpoint_file)
+            if saved.get('done'):
+                return cls(path, state)
+            if (saved.get('source'), saved.get('format')) != (source, fmt):
+                raise LacrmArgumentError(
+                    content='Checkpoint {} belongs to a different export '
+                    '({} as {})'.format(path, saved.get('source'),
+                                        saved.get('format')))
+            state.update(saved)
+
+        return cls(path, state)
+
+    @property
+    def resuming(self):
+        return self.state['records'] > 0
+
+    def save(self):
+        if not self.path:
+            return
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as checkpoint_file:
+            json.dump(self.state, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        _replace(temp_path, self.path)
+
+
+def _flatten(record, columns, codec):
+    """ Maps a record onto ``columns``, JSON-encoding nested values """
+
+    row = []
+    for column in columns:
+        value = record.get(column)
+        if isinstance(value, (dict, list)):
+            value = codec.dumps(value)
+        row.append(value)
+
+    extra = dict((key, value) for key, value in record.items()
+                 if key not in columns)
+    row.append(codec.dumps(extra) if extra else None)
+    return row
+
+
+def _csv_row(values):
+    """ Encodes text values to UTF-8 on Python 2, where csv needs bytes """
+
+    if text_type is str:
+        return values
+    return [value.encode('utf-8') if isinstance(value, text_type) else value
+            for value in values]
+
+
+class NdjsonWriter(object):
+    """Writes one JSON document per line"""
+
+    def __init__(self, path, checkpoint, codec):
+        self.codec = codec
+        self._file = io.open(path, 'ab' if checkpoint.resuming else 'wb')
+        if checkpoint.resuming:
+            # Drop anything written after the last checkpointed page
+            self._file.truncate(checkpoint.state['offset'])
+            self._file.seek(checkpoint.state['offset'])
+
+    def write_page(self, page):
+        self._file.write(b''.join(
+            self.codec.dumps(record).encode('utf-8') + b'\n'
+            for record in page))
+
+    def flush(self):
+        """ Makes written pages durable and returns the resume offset """
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+class CsvWriter(NdjsonWriter):
+    """Writes a header row followed by one row per record
+
+    Columns are taken from the first page; nested values are JSON-encoded
+    and fields first seen on later pages go to the ``_extra`` column.
+    """
+
+    def __init__(self, path, checkpoint, codec):
+        NdjsonWriter.__init__(self, path, checkpoint, codec)
+        self.checkpoint = checkpoint
+
+    def write_page(self, page):
+        columns = self.checkpoint.state['columns']
+        if text_type is str:
+            text = io.StringIO()
+        else:  # Python 2's csv module only writes bytes
+            text = io.BytesIO()
+        writer = csv.writer(text)
+        if columns is None:
+            columns = sorted(set(key for record in page for key in record))
+            self.checkpoint.state['columns'] = columns
+            writer.writerow(_csv_row(columns + [EXTRA_COLUMN]))
+        for record in page:
+            writer.writerow(_csv_row(_flatten(record, columns, self.codec)))
+        data = text.getvalue()
+        self._file.write(data.encode('utf-8') if text_type is str else data)
+
+
+class ParquetWriter(object):
+    """Writes each page as a part file in a Parquet dataset directory"""
+
+    def __init__(self, path, checkpoint, codec):
+        if pyarrow is None:
+            raise ImportError('Parquet export requires pyarrow '
+                              '(pip install lacrm[parquet]).')
+        self.path = path
+        self.checkpoint = checkpoint
+        self.codec = codec
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        elif not checkpoint.resuming:
+            for name in os.listdir(path):
+                if name.startswith('part-') and name.endswith('.parquet'):
+                    os.remove(os.path.join(path, name))
+
+    def write_page(self, page):
+        if not page:
+            return
+        columns = self.checkpoint.state['columns']
+        if columns is None:
+            columns = sorted(set(key for record in page for key in record))
+            self.checkpoint.state['columns'] = columns
+        names = columns + [EXTRA_COLUMN]
+        rows = [_flatten(record, columns, self.codec) for record in page]
+        arrays = [pyarrow.array([None if row[i] is None else str(row[i])
+                                 for row in rows], type=pyarrow.string())
+                  for i in range(len(names))]
+        # Named by the records before the page, so a rewritten page
+        # replaces its earlier attempt
+        part = os.path.join(self.path, 'part-{:09d}.parquet'.format(
+            self.checkpoint.state['records']))
+        pyarrow.parquet.write_table(
+            pyarrow.Table.from_arrays(arrays, names=names), part)
+
+    def flush(self):
+        return None
+
+    def close(self):
+        pass
+
+
+WRITERS = {'ndjson': NdjsonWriter, 'csv': CsvWriter, 'parquet': ParquetWriter}
+
+
+def _export(pages_from, source, path, fmt, checkpoint_path, codec):
+    fmt = fmt or guess_format(path)
+    if fmt not in WRITERS:
+        raise LacrmArgumentError(content='Unknown export format "{}"; use '
+                                 'one of {}'.format(fmt, FORMATS))
+
+    checkpoint = Checkpoint.load(checkpoint_path, source, fmt)
+    state = checkpoint.state
+    summary = {'path': path, 'format': fmt,
+               'resumed_after': state['records']}
+
+    writer = WRITERS[fmt](path, checkpoint, codec or default_codec())
+    # Resumes by record offset, which holds whatever page sizes were used
+    plan = PagePlan(adaptive=True, offset=state['records'])
+    try:
+        for page in pages_from(plan):
+            writer.write_page(page)
+            state['offset'] = writer.flush()
+            state['records'] += len(page)
+            checkpoint.save()
+        state['done'] = True
+        checkpoint.save()
+    finally:
+        writer.close()
+
+    summary['records'] = state['records']
+    return summary
+
+
+def export_contacts(lacrm, path, fmt=None, checkpoint=None, concurrency=1,
+                    params=None, codec=None):
+    """ Streams every contact to ``path`` as NDJSON, CSV or Parquet
+
+    ``checkpoint`` names a file recording progress; if it holds an
+    unfinished export, this one resumes after the records it recorded.
+    Pages fetched one at a time shrink while the API is slow (see
+    ``lacrm.pagination.PagePlan``). With ``concurrency`` above 1 pages are
+    fetched in parallel but still written in order. Returns a summary dict.
+    """
+
+    def pages_from(plan):
+        return lacrm.iter_contacts(dict(params or {}, Page=1),
+                                   concurrency=concurrency, pages=True,
+                                   plan=plan)
+
+    return _export(pages_from, 'contacts', path, fmt, checkpoint, codec)
+
+
+def export_pipeline(lacrm, pipeline_id, path, fmt=None, checkpoint=None,
+                    concurrency=1, status='all', codec=None):
+    """ Streams a pipeline report to ``path``, see ``export_contacts`` """
+
+    def pages_from(plan):
+        return lacrm.iter_pipeline_report(pipeline_id, status,
+                                          concurrency=concurrency, pages=True,
+                                          plan=plan)
+
+    return _export(pages_from, 'pipeline:{}'.format(pipeline_id), path, fmt,
+                   checkpoint, codec)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='lacrm-export',
+        description='Export LACRM contacts or a pipeline report.')
+    add_client_arguments(parser)
+    parser.add_argument('--format', choices=FORMATS,
+                        help='output format (default: from the extension)')
+    parser.add_argument('--checkpoint',
+                        help='progress file used to resume an export '
+                        '(default: OUTPUT.checkpoint)')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='pages to fetch in parallel')
+    subparsers = parser.add_subparsers(dest='kind')
+    subparsers.required = True
+
+    contacts = subparsers.add_parser('contacts', help='export all contacts')
+    contacts.add_argument('output')
+
+    pipeline = subparsers.add_parser('pipeline', help='export a pipeline')
+    pipeline.add_argument('pipeline_id')
+    pipeline.add_argument('output')
+    pipeline.add_argument('--status', default='all',
+                          choices=('all', 'closed'))
+
+    args = parser.parse_args(argv)
+    checkpoint = args.checkpoint or args.output + '.checkpoint'
+
+    with client_from_args(args) as lacrm:
+        if args.kind == 'contacts':
+            summary = export_contacts(lacrm, args.output, args.format,
+                                      checkpoint, args.concurrency)
+        else:
+            summary = export_pipeline(lacrm, args.pipeline_id, args.output,
+                                      args.format, checkpoint,
+                                      args.concurrency, args.status)
+
+    print('Exported {records} records to {path} ({format})'.format(**summary))
+    return summary
+
+
+if __name__ == '__main__':
+    main()
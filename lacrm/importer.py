@@ -0,0 +1,302 @@
+"""Streaming contact import from CSV or NDJSON
+
+Rows are read one at a time, mapped onto ``create_contact`` parameters and
+validated before anything is sent. Contacts are then created over a bounded
+worker pool and every outcome is appended to a results file, one JSON line
+per row. Rerunning an import with the same results file skips the rows
+that were already created.
+
+    lacrm-import contacts.csv --results contacts.results --concurrency 16
+"""
+
+from __future__ import print_function
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from concurrent import futures
+
+from lacrm.cli import add_client_arguments, client_from_args
+from lacrm.utils import BaseLacrmError, LacrmArgumentError
+
+try:
+    text_type = unicode  # noqa: F821 - Python 2
+except NameError:
+    text_type = str
+
+FORMATS = ('csv', 'ndjson')
+
+# Columns named "CustomFields.<name>" become entries of CustomFields
+CUSTOM_FIELD_PREFIX = 'CustomFields.'
+
+# Parameters LACRM expects as lists of {'Text': ..., 'Type': ...}
+TEXT_LIST_PARAMETERS = ('Email', 'Phone', 'Website')
+
+# Invalid rows listed in the error raised before an import starts
+MAX_REPORTED_ERRORS = 10
+
+
+def read_rows(path, fmt=None):
+    """ Yields ``(row_number, row)`` pairs from a CSV or NDJSON file
+
+    Row numbers start at 1 with the first record, so a CSV header is not
+    counted. Blank NDJSON lines are skipped but still counted; a line that
+    is not valid JSON is yielded as its text, which ``row_to_contact``
+    rejects.
+    """
+
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+    if fmt not in FORMATS:
+        raise LacrmArgumentError(content='Unknown import format "{}"; use '
+                                 'one of {}'.format(fmt, FORMATS))
+
+    if fmt == 'csv':
+        for number, row in enumerate(_read_csv(path), 1):
+            yield number, row
+        return
+
+    with io.open(path, encoding='utf-8', newline='') as source:
+        for number, line in enumerate(source, 1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                yield number, line.strip()
+
+
+def _read_csv(path):
+    """ Yields a UTF-8 CSV file's rows as dicts of text """
+
+    if text_type is str:
+        with io.open(path, encoding='utf-8', newline='') as source:
+            for row in csv.DictReader(source):
+                yield row
+        return
+
+    # Python 2's csv module only reads bytes
+    with io.open(path, 'rb') as source:
+        for row in csv.DictReader(source):
+            yield dict((_decode(key), _decode(value))
+                       for key, value in row.items())
+
+
+def _decode(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def row_to_contact(row, mapping=None):
+    """ Maps one input row onto ``create_contact`` parameters
+
+    ``mapping`` renames input columns, e.g. ``{'E-mail': 'Email'}``. Empty
+    cells are dropped, ``CustomFields.<name>`` columns are gathered into
+    ``CustomFields`` and plain Email, Phone and Website strings are wrapped
+    in the list form the API expects. Raises LacrmArgumentError for a row
+    that is not a JSON object or has more CSV cells than the header.
+    """
+
+    if not isinstance(row, dict):
+        raise LacrmArgumentError(content='Row is not a JSON object: '
+                                 '{}'.format(row))
+    if None in row:
+        raise LacrmArgumentError(content='Row has {} more cells than the '
+                                 'header'.format(len(row[None])))
+
+    mapping = mapping or {}
+    data = {}
+    custom_fields = {}
+
+    for column, value in row.items():
+        if value is None or value == '':
+            continue
+        name = mapping.get(column, column)
+        if name == 'CustomFields' and isinstance(value, dict):
+            custom_fields.update(value)
+        elif name.startswith(CUSTOM_FIELD_PREFIX):
+            custom_fields[name[len(CUSTOM_FIELD_PREFIX):]] = value
+        elif name in TEXT_LIST_PARAMETERS and not isinstance(value, list):
+            data[name] = [{'Text': value, 'Type': 'Work'}]
+        else:
+            data[name] = value
+
+    if custom_fields:
+        data['CustomFields'] = custom_fields
+
+    return data
+
+
+class ResultLog(object):
+    """Append-only record of which input rows became which contacts"""
+
+    def __init__(self, path):
+        self.path = path
+        self.created = {}
+        if os.path.exists(path):
+            with io.open(path, encoding='utf-8') as lines:
+                for line in lines:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line torn by a crash; that row is simply retried
+                        continue
+                    if entry.get('ContactId'):
+                        self.created[entry['row']] = entry['ContactId']
+        self._file = io.open(path, 'ab')
+
+    def write(self, row_number, contact_id=None, error=None):
+        entry = {'row': row_number}
+        if error is None:
+            entry['ContactId'] = contact_id
+            self.created[row_number] = contact_id
+        else:
+            entry['error'] = str(error)
+        self._file.write(json.dumps(entry).encode('utf-8') + b'\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def validate_rows(lacrm, rows, mapping=None):
+    """ Returns ``(row_number, error)`` for every row that would be rejected """
+
+    invalid = []
+    for number, row in rows:
+        try:
+            lacrm.prepare_call('create_contact', row_to_contact(row, mapping))
+        except BaseLacrmError as error:
+            invalid.append((number, error))
+    return invalid
+
+
+def import_contacts(lacrm, path, results_path, fmt=None, mapping=None,
+                    concurrency=8, skip_invalid=False):
+    """ Creates a contact for every row of a CSV or NDJSON file
+
+    The whole file is validated first; unless ``skip_invalid`` is set, any
+    invalid row raises LacrmArgumentError before a single contact is
+    created; otherwise invalid rows are logged as errors. Valid rows are
+    then sent over ``concurrency`` workers, reading the file as it goes.
+    Each outcome is appended to ``results_path`` as
+    ``{"row": n, "ContactId": ...}`` or ``{"row": n, "error": ...}``; rows
+    already created there are skipped. Returns a summary dict.
+    """
+
+    invalid = dict(validate_rows(lacrm, read_rows(path, fmt), mapping))
+    if invalid and not skip_invalid:
+        lines = ['row {}: {}'.format(number, error.content)
+                 for number, error in sorted(invalid.items())]
+        raise LacrmArgumentError(content='{} invalid rows in {}:\n{}'.format(
+            len(invalid), path, '\n'.join(lines[:MAX_REPORTED_ERRORS])))
+
+    summary = {'total': 0, 'created': 0, 'skipped': 0, 'failed': 0,
+               'invalid': len(invalid)}
+    log = ResultLog(results_path)
+
+    def create(row):
+        api_method, parameters = lacrm.prepare_call(
+            'create_contact', row_to_contact(row, mapping))
+        # The raw body, since the parsed value falls back to the status
+        # code when ContactId is missing
+        body = lacrm.send_prepared(api_method, parameters,
+                                   raw_response=True)
+        contact_id = body.get('ContactId') if isinstance(body, dict) else None
+        if not contact_id:
+            raise BaseLacrmError(content='No ContactId in the response: '
+                                 '{}'.format(body))
+        return contact_id
+
+    def record(future):
+        number = pending.pop(future)
+        try:
+            log.write(number, contact_id=future.result())
+            summary['created'] += 1
+        except Exception as error:  # pylint: disable=broad-except
+            log.write(number, error=error)
+            summary['failed'] += 1
+
+    concurrency = max(1, concurrency)
+    pending = {}
+    executor = futures.ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        for number, row in read_rows(path, fmt):
+            summary['total'] += 1
+            if number in invalid:
+                log.write(number, error=invalid[number])
+                continue
+            if number in log.created:
+                summary['skipped'] += 1
+                continue
+            # Keep the window of queued rows bounded however large the file
+            while len(pending) >= concurrency * 2:
+                done, _ = futures.wait(pending,
+                                       return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    record(future)
+            pending[executor.submit(create, row)] = number
+
+        for future in futures.as_completed(list(pending)):
+            record(future)
+    finally:
+        executor.shutdown(wait=True)
+        log.close()
+
+    return summary
+
+
+def parse_mapping(pairs):
+    mapping = {}
+    for pair in pairs or ():
+        column, sep, parameter = pair.partition('=')
+        if not sep:
+            raise LacrmArgumentError(content='--map expects COLUMN=PARAMETER, '
+                                     'got "{}"'.format(pair))
+        mapping[column] = parameter
+    return mapping
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='lacrm-import',
+        description='Create LACRM contacts from a CSV or NDJSON file.')
+    add_client_arguments(parser)
+    parser.add_argument('input')
+    parser.add_argument('--format', choices=FORMATS,
+                        help='input format (default: from the extension)')
+    parser.add_argument('--results',
+                        help='results file mapping rows to ContactIds, used '
+                        'to resume (default: INPUT.results)')
+    parser.add_argument('--map', action='append', metavar='COLUMN=PARAMETER',
+                        help='rename an input column, e.g. "E-mail=Email" '
+                        'or "Tier=CustomFields.Tier"')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='contacts to create in parallel')
+    parser.add_argument('--skip-invalid', action='store_true',
+                        help='import the valid rows even if some are invalid')
+
+    args = parser.parse_args(argv)
+    results = args.results or args.input + '.results'
+
+    with client_from_args(args) as lacrm:
+        try:
+            summary = import_contacts(lacrm, args.input, results, args.format,
+                                      parse_mapping(args.map),
+                                      args.concurrency, args.skip_invalid)
+        except LacrmArgumentError as error:
+            print(error, file=sys.stderr)
+            sys.exit(1)
+
+    print('Created {created}, skipped {skipped}, failed {failed}, invalid '
+          '{invalid} of {total} rows'.format(**summary))
+    return summary
+
+
+if __name__ == '__main__':
+    main()
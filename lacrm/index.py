@@ -0,0 +1,155 @@
+"""In-process index from contact details to ContactId
+
+``ContactIndex`` maps normalized emails, phone numbers and company names
+to the contacts holding them, so ``Lacrm.upsert_contact`` can decide
+between creating and editing a contact without a search request. It is
+loaded once from the contact listing and then kept current by the
+client's own CreateContact, EditContact and DeleteContact calls; changes
+made elsewhere (another process, the web app) are only seen after
+``reload``.
+"""
+
+import re
+import threading
+
+from lacrm.records import flatten_texts
+from lacrm.utils import LacrmArgumentError
+
+_NON_DIGITS = re.compile(r'\D+')
+
+
+def normalize_email(value):
+    return value.strip().lower()
+
+
+def normalize_phone(value):
+    """ Keeps only the digits, so "(555) 010-2000" matches "555.010.2000" """
+
+    return _NON_DIGITS.sub('', value)
+
+
+def normalize_company(value):
+    return ' '.join(value.lower().split())
+
+
+# Contact fields that can be matched on, with their normalizers
+MATCH_FIELDS = {'Email': normalize_email,
+                'Phone': normalize_phone,
+                'CompanyName': normalize_company}
+
+
+def match_keys(data, fields=tuple(MATCH_FIELDS)):
+    """ Returns the ``(field, normalized value)`` keys of a contact dict """
+
+    keys = set()
+    for field in fields:
+        normalize = MATCH_FIELDS.get(field)
+        if normalize is None:
+            raise LacrmArgumentError(content='Cannot match contacts on '
+                                     '"{}"; use one of {}'.format(
+                                         field, ', '.join(sorted(
+                                             MATCH_FIELDS))))
+        value = data.get(field)
+        texts = [value] if field == 'CompanyName' else flatten_texts(value)
+        for text in texts:
+            if text:
+                normalized = normalize(text)
+                if normalized:
+                    keys.add((field, normalized))
+    return keys
+
+
+class ContactIndex(object):
+    """Thread-safe map of normalized contact details to ContactIds
+
+    When several contacts share a detail, the one indexed last wins.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._ids = {}
+        self._keys = {}
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, contact_id):
+        return str(contact_id) in self._keys
+
+    def _set(self, contact_id, keys, fields):
+        """ Replaces a contact's keys for ``fields`` with ``keys`` """
+
+        with self._lock:
+            old = self._keys.get(contact_id, set())
+            for key in [key for key in old if key[0] in fields]:
+                old.discard(key)
+                if self._ids.get(key) == contact_id:
+                    del self._ids[key]
+            for key in keys:
+                self._ids[key] = contact_id
+            self._keys[contact_id] = old | keys
+
+    def add(self, contact):
+        """ Indexes (or re-indexes) one contact from a listing or GetContact """
+
+        self._set(str(contact['ContactId']), match_keys(contact),
+                  MATCH_FIELDS)
+
+    def add_contacts(self, contacts):
+        for contact in contacts:
+            self.add(contact)
+
+    def remove(self, contact_id):
+        contact_id = str(contact_id)
+        with self._lock:
+            for key in self._keys.pop(contact_id, ()):
+                if self._ids.get(key) == contact_id:
+                    del self._ids[key]
+
+    def find(self, data, match_on=('Email',)):
+        """ Returns the ContactId matching ``data``, or None
+
+        Fields in ``match_on`` are tried in order, and the first field with
+        a match decides.
+        """
+
+        for field in match_on:
+            keys = match_keys(data, (field,))
+            with self._lock:
+                for key in sorted(keys):
+                    contact_id = self._ids.get(key)
+                    if contact_id is not None:
+                        return contact_id
+        return None
+
+    def load(self, lacrm, concurrency=1):
+        """ Indexes every contact in the account, once """
+
+        with self._load_lock:
+            if not self.loaded:
+                self.reload(lacrm, concurrency)
+
+    def reload(self, lacrm, concurrency=1):
+        """ Rebuilds the index from the contact listing """
+
+        with self._lock:
+            self._ids.clear()
+            self._keys.clear()
+        for page in lacrm.iter_contacts(concurrency=concurrency, pages=True):
+            self.add_contacts(page)
+        self.loaded = True
+
+    def update(self, api_method, parameters, body):
+        """ Applies a successful contact write made through the client """
+
+        if api_method == 'CreateContact' and body.get('ContactId'):
+            self._set(str(body['ContactId']), match_keys(parameters),
+                      MATCH_FIELDS)
+        elif api_method == 'EditContact':
+            fields = [field for field in MATCH_FIELDS if field in parameters]
+            self._set(str(parameters['ContactId']),
+                      match_keys(parameters, fields), fields)
+        elif api_method == 'DeleteContact':
+            self.remove(parameters['ContactId'])
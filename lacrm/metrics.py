@@ -0,0 +1,182 @@
+"Instrumentation hooks and per-function metrics for lacrm"
+
+import threading
+from collections import defaultdict
+
+# Events a Lacrm instance emits through its Hooks, and their arguments:
+#   before_request(api_method, method_payload)
+#   after_response(CallEvent)
+#   on_error(CallEvent)
+#   retry(api_method, attempt, status_code)
+#   cache_hit(api_method)
+#   coalesced(api_method)
+#   write_skipped(api_method)
+EVENTS = ('before_request', 'after_response', 'on_error', 'retry',
+          'cache_hit', 'coalesced', 'write_skipped')
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+
+class CallEvent(object):
+    """Outcome of one HTTP attempt, passed to response and error hooks"""
+
+    __slots__ = ('api_method', 'attempt', 'status_code', 'elapsed',
+                 'request_bytes', 'response_bytes', 'error')
+
+    def __init__(self, api_method, attempt, elapsed, request_bytes,
+                 status_code=None, response_bytes=0, error=None):
+        self.api_method = api_method
+        self.attempt = attempt
+        self.elapsed = elapsed
+        self.request_bytes = request_bytes
+        self.status_code = status_code
+        self.response_bytes = response_bytes
+        self.error = error
+
+
+class Hooks(object):
+    """Registry of instrumentation callbacks
+
+    Callbacks run synchronously on the calling thread, so they should be
+    cheap; exceptions they raise propagate to the API caller.
+    """
+
+    def __init__(self):
+        self._callbacks = defaultdict(list)
+
+    def __bool__(self):
+        return bool(self._callbacks)
+
+    __nonzero__ = __bool__
+
+    def add(self, event, callback):
+        """ Registers ``callback`` for one of ``EVENTS`` """
+
+        if event not in EVENTS:
+            raise ValueError('Unknown hook event "{}"'.format(event))
+        self._callbacks[event].append(callback)
+
+    def remove(self, event, callback):
+        """ Unregisters a callback added with ``add`` """
+
+        self._callbacks[event].remove(callback)
+        if not self._callbacks[event]:
+            del self._callbacks[event]
+
+    def emit(self, event, *args):
+        for callback in self._callbacks.get(event, ()):
+            callback(*args)
+
+
+class _FunctionStats(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.skipped_writes = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+        self.status_codes = defaultdict(int)
+
+    def observe_latency(self, elapsed):
+        self.latency_total += elapsed
+        self.latency_max = max(self.latency_max, elapsed)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                self.latency_buckets[index] += 1
+                break
+
+    def snapshot(self):
+        timed = sum(self.latency_buckets)
+        return {'calls': self.calls,
+                'errors': self.errors,
+                'retries': self.retries,
+                'cache_hits': self.cache_hits,
+                'coalesced': self.coalesced,
+                'skipped_writes': self.skipped_writes,
+                'request_bytes': self.request_bytes,
+                'response_bytes': self.response_bytes,
+                'status_codes': dict(self.status_codes),
+                'latency': {
+                    'count': timed,
+                    'mean': self.latency_total / timed if timed else 0.0,
+                    'max': self.latency_max,
+                    'buckets': dict(zip(LATENCY_BUCKETS,
+                                        self.latency_buckets))}}
+
+
+class Metrics(object):
+    """Thread-safe per-Function call statistics
+
+    Attach to a client with ``Lacrm(metrics=Metrics())`` (or ``install``),
+    then read ``snapshot()``. One Metrics can be shared by several clients.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(_FunctionStats)
+
+    def install(self, hooks):
+        """ Registers this collector's callbacks on a Hooks registry """
+
+        hooks.add('after_response', self._after_response)
+        hooks.add('on_error', self._on_error)
+        hooks.add('retry', self._retry)
+        hooks.add('cache_hit', self._cache_hit)
+        hooks.add('coalesced', self._coalesced)
+        hooks.add('write_skipped', self._write_skipped)
+
+    def _after_response(self, event):
+        with self._lock:
+            stats = self._stats[event.api_method]
+            stats.calls += 1
+            stats.request_bytes += event.request_bytes
+            stats.response_bytes += event.response_bytes
+            stats.status_codes[event.status_code] += 1
+            if event.status_code != 200:
+                stats.errors += 1
+            stats.observe_latency(event.elapsed)
+
+    def _on_error(self, event):
+        with self._lock:
+            stats = self._stats[event.api_method]
+            stats.calls += 1
+            stats.errors += 1
+            stats.request_bytes += event.request_bytes
+            stats.observe_latency(event.elapsed)
+
+    def _retry(self, api_method, attempt, status_code):
+        with self._lock:
+            self._stats[api_method].retries += 1
+
+    def _cache_hit(self, api_method):
+        with self._lock:
+            self._stats[api_method].cache_hits += 1
+
+    def _coalesced(self, api_method):
+        with self._lock:
+            self._stats[api_method].coalesced += 1
+
+    def _write_skipped(self, api_method):
+        with self._lock:
+            self._stats[api_method].skipped_writes += 1
+
+    def snapshot(self):
+        """ Returns a dict of stats keyed by API function name """
+
+        with self._lock:
+            return dict((api_method, stats.snapshot())
+                        for api_method, stats in self._stats.items())
+
+    def reset(self):
+        """ Clears every counter """
+
+        with self._lock:
+            self._stats.clear()
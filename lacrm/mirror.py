@@ -0,0 +1,320 @@
+"Local SQLite mirror of LACRM contacts and pipeline items"
+
+import json
+import sqlite3
+import threading
+import time
+from lacrm.index import normalize_phone
+from lacrm.records import flatten_texts
+
+try:
+    text_type = unicode  # noqa: F821 - Python 2
+except NameError:
+    text_type = str
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS contacts (
+    contact_id TEXT PRIMARY KEY,
+    first_name TEXT,
+    last_name TEXT,
+    company_name TEXT,
+    date_entered TEXT,
+    raw TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contacts_company ON contacts (company_name);
+CREATE INDEX IF NOT EXISTS contacts_last_name ON contacts (last_name);
+
+CREATE TABLE IF NOT EXISTS contact_emails (
+    contact_id TEXT NOT NULL,
+    email TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contact_emails_email ON contact_emails (email);
+CREATE INDEX IF NOT EXISTS contact_emails_contact
+    ON contact_emails (contact_id);
+
+CREATE TABLE IF NOT EXISTS contact_phones (
+    contact_id TEXT NOT NULL,
+    phone TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contact_phones_phone ON contact_phones (phone);
+CREATE INDEX IF NOT EXISTS contact_phones_contact
+    ON contact_phones (contact_id);
+
+CREATE TABLE IF NOT EXISTS contact_custom_fields (
+    contact_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS contact_custom_fields_lookup
+    ON contact_custom_fields (name, value);
+CREATE INDEX IF NOT EXISTS contact_custom_fields_contact
+    ON contact_custom_fields (contact_id);
+
+CREATE TABLE IF NOT EXISTS pipeline_items (
+    pipeline_item_id TEXT PRIMARY KEY,
+    pipeline_id TEXT NOT NULL,
+    contact_id TEXT,
+    status TEXT,
+    priority TEXT,
+    raw TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pipeline_items_pipeline
+    ON pipeline_items (pipeline_id, status);
+CREATE INDEX IF NOT EXISTS pipeline_items_contact
+    ON pipeline_items (contact_id);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    value REAL
+);
+'''
+
+PAGE_SIZE = 500
+
+
+def _text(value):
+    return None if value is None else text_type(value)
+
+
+def _custom_fields(value):
+    """ Normalizes CustomFields into ``(name, value)`` pairs of text """
+
+    if isinstance(value, dict):
+        return [(_text(name), _text(field)) for name, field in value.items()]
+    if isinstance(value, list):
+        return [(_text(field.get('Name')), _text(field.get('Value')))
+                for field in value if isinstance(field, dict)]
+
+    return []
+
+
+def _phones(value):
+    """ Digits of every phone number, as ``lacrm.index`` matches them """
+
+    return [phone for phone in
+            (normalize_phone(text) for text in flatten_texts(value)) if phone]
+
+
+class ContactMirror(object):
+    """Local SQLite copy of an account's contacts and pipeline items
+
+    ``sync_contacts`` loads contacts through the paginated SearchContacts
+    listing. The first sync is a full load; later syncs walk the same
+    ``DateEntered`` ordering but start near the end of what is already
+    mirrored, so only newly entered contacts are fetched. The listing
+    cannot be filtered by date edited, so edits and deletions made in LACRM
+    are only picked up by a full sync: one runs instead whenever the last
+    finished more than ``full_sync_every`` seconds ago (None to never
+    schedule one), or when ``full=True`` is passed. A full sync also
+    removes contacts deleted in LACRM.
+
+    Lookups (``find_by_email``, ``find_by_company``, ...) only touch the
+    local database and return the contacts as LACRM returned them.
+    """
+
+    def __init__(self, lacrm, path=':memory:', full_sync_every=3600,
+                 clock=time.time):
+        self.lacrm = lacrm
+        self.full_sync_every = full_sync_every
+        # Wall-clock time, as it is compared across processes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._normalize_stored_phones()
+
+    def _normalize_stored_phones(self):
+        """ Reduces phones stored by older versions to their digits """
+
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT rowid, phone FROM contact_phones "
+                "WHERE phone GLOB '*[^0-9]*'").fetchall()
+            self._conn.executemany(
+                'UPDATE contact_phones SET phone = ? WHERE rowid = ?',
+                [(normalize_phone(phone), rowid) for rowid, phone in rows])
+
+    def close(self):
+        """ Closes the underlying database """
+
+        self._conn.close()
+
+    def _delete_contact_rows(self, contact_id):
+        for table in ('contacts', 'contact_emails', 'contact_phones',
+                      'contact_custom_fields'):
+            self._conn.execute(
+                'DELETE FROM {} WHERE contact_id = ?'.format(table),
+                (contact_id,))
+
+    def _upsert_contact(self, contact):
+        contact_id = str(contact['ContactId'])
+        self._delete_contact_rows(contact_id)
+        self._conn.execute(
+            'INSERT INTO contacts (contact_id, first_name, last_name, '
+            'company_name, date_entered, raw) VALUES (?, ?, ?, ?, ?, ?)',
+            (contact_id, contact.get('FirstName'), contact.get('LastName'),
+             contact.get('CompanyName'), contact.get('DateEntered'),
+             json.dumps(contact)))
+        self._conn.executemany(
+            'INSERT INTO contact_emails (contact_id, email) VALUES (?, ?)',
+            [(contact_id, email.lower())
+             for email in flatten_texts(contact.get('Email'))])
+        self._conn.executemany(
+            'INSERT INTO contact_phones (contact_id, phone) VALUES (?, ?)',
+            [(contact_id, phone) for phone in _phones(contact.get('Phone'))])
+        self._conn.executemany(
+            'INSERT INTO contact_custom_fields (contact_id, name, value) '
+            'VALUES (?, ?, ?)',
+            [(contact_id, name, value) for name, value in
+             _custom_fields(contact.get('CustomFields'))])
+
+    def sync_contacts(self, full=False, concurrency=1):
+        """ Loads new (or, with ``full`` or when a full sync is due, all)
+        contacts into the mirror
+
+        Returns the number of contacts written.
+        """
+
+        started = self._clock()
+        with self._lock:
+            mirrored = self._count_contacts()
+            last_full = self._conn.execute(
+                "SELECT value FROM sync_state WHERE name = 'contacts_full'"
+            ).fetchone()
+        if last_full is None or (self.full_sync_every is not None and
+                                 started - last_full[0] >=
+                                 self.full_sync_every):
+            full = True
+
+        if full or not mirrored:
+            first_page = 1
+        else:
+            # Start one page early so contacts deleted remotely (which
+            # shift later pages back) cannot make us skip new ones.
+            first_page = max(1, mirrored // PAGE_SIZE)
+
+        seen = set()
+        written = 0
+        pages = self.lacrm.iter_contacts({'Page': first_page},
+                                         concurrency=concurrency,
+                                         pages=True)
+        # The lock is only held while a page is written, so lookups keep
+        # working while a long sync is downloading.
+        for page_of_contacts in pages:
+            with self._lock:
+                for contact in page_of_contacts:
+                    self._upsert_contact(contact)
+                    seen.add(str(contact['ContactId']))
+                self._conn.commit()
+            written += len(page_of_contacts)
+
+        if full:
+            with self._lock:
+                stale = [row[0] for row in self._conn.execute(
+                    'SELECT contact_id FROM contacts')
+                         if row[0] not in seen]
+                for contact_id in stale:
+                    self._delete_contact_rows(contact_id)
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO sync_state (name, value) '
+                    "VALUES ('contacts_full', ?)", (started,))
+                self._conn.commit()
+
+        return written
+
+    def sync_pipeline(self, pipeline_id, concurrency=1):
+        """ Reloads every item of a pipeline into the mirror
+
+        Returns the number of pipeline items written.
+        """
+
+        pipeline_id = str(pipeline_id)
+        rows = [(str(item['PipelineItemId']), pipeline_id,
+                 item.get('ContactId'), item.get('Status'),
+                 item.get('Priority'), json.dumps(item))
+                for item in self.lacrm.iter_pipeline_report(
+                    pipeline_id, status='all', concurrency=concurrency)]
+
+        with self._lock:
+            self._conn.execute(
+                'DELETE FROM pipeline_items WHERE pipeline_id = ?',
+                (pipeline_id,))
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO pipeline_items '
+                '(pipeline_item_id, pipeline_id, contact_id, status, '
+                'priority, raw) VALUES (?, ?, ?, ?, ?, ?)', rows)
+            self._conn.commit()
+
+        return len(rows)
+
+    def _contacts(self, sql, args):
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def _count_contacts(self):
+        return self._conn.execute('SELECT COUNT(*) FROM contacts').fetchone()[0]
+
+    def count_contacts(self):
+        """ Returns the number of mirrored contacts """
+
+        with self._lock:
+            return self._count_contacts()
+
+    def get_contact(self, contact_id):
+        """ Returns a mirrored contact, or None """
+
+        contacts = self._contacts(
+            'SELECT raw FROM contacts WHERE contact_id = ?', (str(contact_id),))
+        return contacts[0] if contacts else None
+
+    def find_by_email(self, email):
+        """ Returns mirrored contacts with a given email (case insensitive) """
+
+        return self._contacts(
+            'SELECT DISTINCT c.raw FROM contacts c JOIN contact_emails e '
+            'ON e.contact_id = c.contact_id WHERE e.email = ?',
+            (email.strip().lower(),))
+
+    def find_by_phone(self, phone):
+        """ Returns mirrored contacts with a given phone number, compared
+        by its digits only """
+
+        phone = normalize_phone(phone)
+        if not phone:
+            return []
+        return self._contacts(
+            'SELECT DISTINCT c.raw FROM contacts c JOIN contact_phones p '
+            'ON p.contact_id = c.contact_id WHERE p.phone = ?', (phone,))
+
+    def find_by_company(self, company_name):
+        """ Returns mirrored contacts at a given company """
+
+        return self._contacts(
+            'SELECT raw FROM contacts WHERE company_name = ?', (company_name,))
+
+    def find_by_custom_field(self, name, value):
+        """ Returns mirrored contacts whose custom field equals a value """
+
+        return self._contacts(
+            'SELECT DISTINCT c.raw FROM contacts c JOIN contact_custom_fields f '
+            'ON f.contact_id = c.contact_id WHERE f.name = ? AND f.value = ?',
+            (_text(name), _text(value)))
+
+    def pipeline_items(self, pipeline_id=None, status=None, contact_id=None):
+        """ Returns mirrored pipeline items matching the given filters """
+
+        clauses = []
+        args = []
+        for column, value in (('pipeline_id', pipeline_id),
+                              ('status', status),
+                              ('contact_id', contact_id)):
+            if value is not None:
+                clauses.append('{} = ?'.format(column))
+                args.append(str(value))
+
+        sql = 'SELECT raw FROM pipeline_items'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+
+        return self._contacts(sql, args)
@@ -0,0 +1,48 @@
+"Client options shared by Lacrm, AsyncLacrm and LacrmPool"
+
+from collections import OrderedDict
+
+# Every option a client accepts as a keyword, with its default
+DEFAULTS = OrderedDict([
+    ('cache', None),
+    ('rate_limit', None),
+    ('retry', None),
+    ('timeout', (10, 60)),
+    ('metrics', None),
+    ('codec', None),
+    ('coalesce', True),
+    ('hedge', None),
+    ('breaker', None),
+    ('index', None),
+    ('snapshots', None),
+])
+
+
+class ClientOptions(object):
+    """The optional behaviour of one client, see ``DEFAULTS``
+
+    Clients collect their keyword arguments into a ClientOptions, so new
+    options do not widen every constructor. Unknown names raise TypeError,
+    as an unexpected keyword argument would.
+    """
+
+    __slots__ = tuple(DEFAULTS)
+
+    def __init__(self, **options):
+        unknown = sorted(set(options) - set(DEFAULTS))
+        if unknown:
+            raise TypeError('Unexpected client option(s): {}'.format(
+                ', '.join(unknown)))
+
+        for name, default in DEFAULTS.items():
+            setattr(self, name, options.get(name, default))
+
+    def __repr__(self):
+        return 'ClientOptions({})'.format(', '.join(
+            '{}={!r}'.format(name, getattr(self, name)) for name in DEFAULTS
+            if getattr(self, name) != DEFAULTS[name]))
+
+    def as_dict(self):
+        """ Returns every option as a dict, e.g. to build a similar client """
+
+        return dict((name, getattr(self, name)) for name in DEFAULTS)
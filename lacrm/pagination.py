@@ -0,0 +1,298 @@
+"Pagination helpers for lacrm"
+
+import threading
+from concurrent import futures
+from lacrm.utils import LacrmTimeoutError, _clock
+
+try:
+    from math import gcd as _gcd
+except ImportError:  # Python 2
+    from fractions import gcd as _gcd
+
+# Largest NumRows the LACRM API accepts
+MAX_PAGE_SIZE = 500
+
+# Response members that, when present, hold the total number of records a
+# listing will return. Only an explicit total counts: members such as
+# "Count" may hold the size of the page rather than of the listing.
+TOTAL_COUNT_FIELDS = ('TotalCount',)
+
+# Duration of the last successful request each thread made, noted by the
+# client so that a page's latency leaves out rate-limit waits and retries
+_request_time = threading.local()
+
+
+def note_request_time(seconds):
+    """ Records how long the current thread's successful request took """
+
+    _request_time.seconds = seconds
+
+
+def _size_ladder(page_size, min_page_size):
+    """ Page sizes from ``page_size`` down, each dividing the one above
+
+    Because every size divides the larger ones, a listing can switch to a
+    smaller size at any page boundary and back up at aligned offsets
+    without skipping or repeating records.
+    """
+
+    sizes = [page_size]
+    while True:
+        size = sizes[-1]
+        if size % 2 == 0 and size // 2 >= min_page_size:
+            sizes.append(size // 2)
+        elif size % 5 == 0 and size // 5 >= min_page_size:
+            sizes.append(size // 5)
+        else:
+            return sizes
+
+
+class PagePlan(object):
+    """Page sizes, progress and ETA of one paginated listing
+
+    Pass a PagePlan as ``plan`` to ``iter_contacts``/``iter_pipeline_report``
+    and read it from any thread while the listing runs: ``records``,
+    ``pages``, ``total`` (once known), ``fraction`` and ``eta``.
+
+    With ``adaptive=True``, sequential listings shrink the page size when a
+    page request takes longer than ``target_latency`` seconds, and grow it
+    back, up to the size they started with, when pages come back quickly.
+    Page sizes are fixed otherwise. When the API reports a total (see
+    ``TOTAL_COUNT_FIELDS``), or one is passed as ``total``, the listing
+    stops at the last page instead of requesting an empty one, and no page
+    past the end is prefetched.
+
+    ``offset`` resumes a listing after that many records, for example the
+    ``offset`` of a plan that was interrupted. Pages start at the largest
+    size that keeps page boundaries aligned with it.
+    """
+
+    def __init__(self, adaptive=False, target_latency=5.0, min_page_size=25,
+                 total=None, clock=_clock, offset=0):
+        self.adaptive = adaptive
+        self.target_latency = target_latency
+        self.min_page_size = min_page_size
+        self.total = total
+        self.start_offset = offset
+        self._given_total = total
+        self._clock = clock
+        self.page_size = None
+        self.pages = 0
+        self.records = 0
+        self.offset = 0
+        self.done = False
+        self.started = None
+        self._sizes = []
+
+    def start(self, page_size, first_page=1):
+        """ Begins a listing at ``first_page`` of ``page_size`` records,
+        after ``offset`` records; progress from any earlier run is reset """
+
+        self._sizes = _size_ladder(page_size, min(self.min_page_size,
+                                                  page_size))
+        self.offset = self.start_offset + (first_page - 1) * page_size
+        aligned = [size for size in self._sizes if self.offset % size == 0]
+        if not aligned:
+            # Not reachable through the ladder; fall back to a fixed size
+            aligned = self._sizes = [_gcd(self.offset, page_size)]
+        self.page_size = aligned[0]
+        self.total = self._given_total
+        self.pages = 0
+        self.records = 0
+        self.done = False
+        self.started = self._clock()
+        return self
+
+    @property
+    def next_page(self):
+        """ Page number to request next, at the current page size """
+
+        return self.offset // self.page_size + 1
+
+    @property
+    def last_page(self):
+        """ Number of the final page at the current size, if known """
+
+        if self.total is None:
+            return None
+        return max(1, -(-self.total // self.page_size))
+
+    def observe_total(self, body):
+        """ Picks up a total record count from a raw response, if any """
+
+        if self.total is None and isinstance(body, dict):
+            for field in TOTAL_COUNT_FIELDS:
+                if isinstance(body.get(field), int):
+                    self.total = body[field]
+                    return
+
+    def record(self, count, elapsed=None):
+        """ Accounts for a page of ``count`` records, in page order
+
+        ``elapsed`` is the page's request time, used to adapt the page size.
+        Returns True once the listing is complete.
+        """
+
+        requested = self.page_size
+        self.pages += 1
+        self.records += count
+        self.offset += count
+        self.done = count < requested or (self.total is not None and
+                                          self.offset >= self.total)
+        if not self.done and elapsed is not None and self.adaptive:
+            self._adapt(elapsed)
+        return self.done
+
+    def _adapt(self, elapsed):
+        index = self._sizes.index(self.page_size)
+        if elapsed > self.target_latency:
+            if index + 1 < len(self._sizes):
+                self.page_size = self._sizes[index + 1]
+        elif index > 0:
+            larger = self._sizes[index - 1]
+            per_record = elapsed / self.page_size
+            if per_record * larger <= self.target_latency / 2 and \
+                    self.offset % larger == 0:
+                self.page_size = larger
+
+    @property
+    def fraction(self):
+        """ Share of the total fetched so far, if the total is known """
+
+        if not self.total:
+            return None
+        return min(1.0, float(self.offset) / self.total)
+
+    @property
+    def records_per_second(self):
+        if self.started is None:
+            return 0.0
+        elapsed = self._clock() - self.started
+        return self.records / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """ Estimated seconds left, if the total is known """
+
+        if self.done:
+            return 0.0
+        rate = self.records_per_second
+        if self.total is None or not rate:
+            return None
+        return max(0, self.total - self.offset) / rate
+
+    def progress(self):
+        """ Returns a snapshot of the listing's progress """
+
+        return {'pages': self.pages, 'records': self.records,
+                'total': self.total, 'page_size': self.page_size,
+                'fraction': self.fraction, 'eta': self.eta,
+                'records_per_second': self.records_per_second,
+                'done': self.done}
+
+
+def _timed(fetch_page, page_number):
+    """ Fetches a page, returning it with its request time
+
+    The time is the one noted by the client's successful request, when it
+    made one; otherwise it is measured around ``fetch_page``.
+    """
+
+    _request_time.seconds = None
+    started = _clock()
+    page = fetch_page(page_number)
+    elapsed = _request_time.seconds
+    if elapsed is None:
+        elapsed = _clock() - started
+    return page, elapsed
+
+
+def fetch_pages(fetch_page, page_size, concurrency=1, first_page=1,
+                deadline=None, plan=None):
+    """ Yields pages from ``fetch_page(page_number)`` in page order
+
+    Pagination stops at the first page holding fewer than ``page_size``
+    records, or at the last page when the total is known. With
+    ``concurrency`` above 1, up to that many page requests are kept in
+    flight on a thread pool; pages fetched speculatively past the end are
+    discarded and never yielded.
+
+    ``plan`` is a PagePlan to report progress to; ``fetch_page`` should
+    request ``plan.page_size`` records. Page sizes only adapt when pages
+    are fetched one at a time.
+
+    When a ``lacrm.utils.Deadline`` is given, LacrmTimeoutError is raised
+    as soon as it passes and pages not yet started are cancelled.
+    """
+
+    if plan is None:
+        plan = PagePlan(adaptive=False)
+    plan.start(page_size, first_page)
+
+    if concurrency <= 1:
+        while True:
+            if deadline is not None:
+                deadline.check()
+            page, elapsed = _timed(fetch_page, plan.next_page)
+            done = plan.record(len(page), elapsed)
+            yield page
+            if done:
+                return
+
+    executor = futures.ThreadPoolExecutor(max_workers=concurrency)
+    in_flight = []
+    next_page = plan.next_page
+
+    def submit():
+        last_page = plan.last_page
+        if last_page is None or next_page <= last_page:
+            in_flight.append(executor.submit(fetch_page, next_page))
+            return next_page + 1
+        return next_page
+
+    try:
+        for _ in range(concurrency):
+            next_page = submit()
+
+        while in_flight:
+            future = in_flight.pop(0)
+            try:
+                page = future.result(
+                    None if deadline is None else deadline.remaining())
+            except futures.TimeoutError:
+                in_flight.insert(0, future)
+                raise LacrmTimeoutError(content='deadline exceeded')
+            done = plan.record(len(page))
+            yield page
+            if done:
+                return
+            next_page = submit()
+    finally:
+        for future in in_flight:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def stream_pages(stream_page, page_size, first_page=1, deadline=None,
+                 plan=None):
+    """ Yields the items of successive pages from ``stream_page(page_number)``
+
+    ``stream_page`` returns an iterator over one page's items; items are
+    passed through as they arrive, and pagination stops after the first
+    page yielding fewer than ``page_size`` items. ``plan`` is a PagePlan
+    to report progress to; streamed page sizes never adapt.
+    """
+
+    if plan is None:
+        plan = PagePlan(adaptive=False)
+    plan.start(page_size, first_page)
+
+    while True:
+        if deadline is not None:
+            deadline.check()
+        count = 0
+        for item in stream_page(plan.next_page):
+            count += 1
+            yield item
+        if plan.record(count):
+            return
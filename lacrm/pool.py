@@ -0,0 +1,145 @@
+"Per-account Lacrm clients sharing one connection pool"
+
+import threading
+
+from lacrm.api import Lacrm
+from lacrm.credentials import CREDENTIALS, Account
+from lacrm.options import ClientOptions
+from lacrm.ratelimit import TokenBucket
+
+# Client options holding per-account state, which a pool cannot share
+PER_ACCOUNT_OPTIONS = ('index', 'snapshots')
+
+
+class _GatedSession(object):
+    """Wraps a shared session, capping the requests in flight through it
+
+    With ``stream=True`` the gate is released once response headers have
+    arrived; reading the body is not counted.
+    """
+
+    def __init__(self, session, max_concurrency):
+        self._session = session
+        self._gate = threading.BoundedSemaphore(max_concurrency)
+
+    def post(self, *args, **kwargs):
+        with self._gate:
+            return self._session.post(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+class LacrmPool(object):
+    """Registry of Lacrm clients for many accounts
+
+    ``pool['acme']`` returns the client for account ``acme``, creating it on
+    first use from credentials registered with ``register`` or found in the
+    multi-account file (see ``lacrm.credentials``). Every client shares one
+    connection pool, and no more than ``max_concurrency`` requests are in
+    flight at once across all accounts. Each account gets its own rate
+    limiter: the account's ``rate_limit`` if it sets one, otherwise the
+    pool's ``rate_limit``, a number of requests per second or a function
+    returning a new ``TokenBucket`` for each account.
+
+    Other keyword arguments are client options (see ``Lacrm``) passed to
+    every client; a shared ``Metrics`` aggregates all accounts. Options in
+    ``PER_ACCOUNT_OPTIONS`` are refused, since one object would be shared
+    by every account.
+    """
+
+    def __init__(self, max_concurrency=32, rate_limit=None,
+                 accounts_file=None, credentials=CREDENTIALS, session=None,
+                 keep_alive=True, **client_options):
+
+        shared = sorted(set(PER_ACCOUNT_OPTIONS) & set(client_options))
+        if shared:
+            raise TypeError('LacrmPool cannot share {} between '
+                            'accounts'.format(', '.join(shared)))
+        ClientOptions(**client_options)  # rejects unknown options
+        if isinstance(rate_limit, TokenBucket):
+            raise TypeError('LacrmPool needs a rate, or a function building '
+                            'a TokenBucket, so that each account gets its '
+                            'own limiter')
+
+        self.max_concurrency = max_concurrency
+        self.rate_limit = rate_limit
+        self.accounts_file = accounts_file
+        self.credentials = credentials
+        self._client_options = client_options
+
+        if session is None:
+            # One host, so one connection pool sized to the concurrency cap
+            session = Lacrm._build_session(1, max_concurrency, keep_alive)
+            self._owns_session = True
+        else:
+            self._owns_session = False
+        self.session = _GatedSession(session, max_concurrency)
+
+        self._lock = threading.Lock()
+        self._registered = {}
+        self._clients = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def register(self, name, user_code, api_token, rate_limit=None):
+        """ Adds or replaces an account's credentials """
+
+        with self._lock:
+            self._registered[name] = Account(name, user_code, api_token,
+                                             rate_limit)
+            self._clients.pop(name, None)
+
+    def _account(self, name):
+        account = self._registered.get(name)
+        if account is None:
+            account = self.credentials.account(name, self.accounts_file)
+        return account
+
+    def client(self, name):
+        """ Returns the client for account ``name``, creating it if needed """
+
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                account = self._account(name)
+                rate_limit = account.rate_limit
+                if rate_limit is None:
+                    rate_limit = self.rate_limit
+                    if callable(rate_limit):
+                        rate_limit = rate_limit()
+                client = Lacrm(user_code=account.user_code,
+                               api_token=account.api_token,
+                               session=self.session, rate_limit=rate_limit,
+                               **self._client_options)
+                self._clients[name] = client
+
+        return client
+
+    __getitem__ = client
+
+    def accounts(self):
+        """ Names of every known account, registered or from the file """
+
+        with self._lock:
+            registered = set(self._registered)
+        return sorted(registered |
+                      set(self.credentials.accounts(self.accounts_file)))
+
+    def __len__(self):
+        return len(self._clients)
+
+    def close(self):
+        """ Closes every client, then the shared session if owned """
+
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+        if self._owns_session:
+            self.session.close()
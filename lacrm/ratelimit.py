@@ -0,0 +1,277 @@
+"Client-side rate limiting, retry, hedging and circuit breaking for lacrm"
+
+import math
+import random
+import threading
+import time
+
+from lacrm.utils import _clock
+
+# Statuses LACRM (or a proxy in front of it) uses to ask clients to slow down
+THROTTLE_STATUSES = (429, 503)
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket limiting requests per second
+
+    ``rate`` tokens are added per second, up to ``burst``. When throttled by
+    the API the current rate is halved (never below ``min_rate``); every
+    successful request then adds back a twentieth of the configured rate, so
+    the limiter settles just under what the API tolerates.
+    """
+
+    def __init__(self, rate, burst=None, min_rate=None, clock=_clock,
+                 sleep=time.sleep):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = float(min_rate) if min_rate else self.max_rate / 20
+        self.burst = float(burst) if burst else max(1.0, self.max_rate)
+        self._tokens = self.burst
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """ Takes a token and returns how many seconds to wait before using it """
+
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """ Blocks until a request may be sent """
+
+        delay = self.reserve()
+        if delay > 0:
+            self._sleep(delay)
+
+    def throttled(self):
+        """ Backs off after the API signals it is being overloaded """
+
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def succeeded(self):
+        """ Recovers toward the configured rate after a successful request """
+
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate,
+                                self.rate + self.max_rate / 20)
+
+
+class RetryPolicy(object):
+    """Bounded retries with exponential backoff and full jitter
+
+    Reads are retried on connection errors and on any status in
+    ``retry_statuses``. Writes are only retried when the API refused them
+    with a throttling status (so they cannot have been applied), unless
+    ``retry_writes`` is set.
+    """
+
+    def __init__(self, max_retries=3, backoff=0.5, max_backoff=30.0,
+                 retry_statuses=(429, 500, 502, 503, 504),
+                 retry_writes=False):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = tuple(retry_statuses)
+        self.retry_writes = retry_writes
+
+    def should_retry(self, attempt, is_read, status_code=None):
+        """ Whether to retry after ``attempt`` failed tries (0-based)
+
+        ``status_code`` is None when the request failed to connect.
+        """
+
+        if attempt >= self.max_retries:
+            return False
+        if status_code is not None and \
+                status_code not in self.retry_statuses:
+            return False
+        if is_read or self.retry_writes:
+            return True
+
+        return status_code in THROTTLE_STATUSES
+
+    def delay(self, attempt, retry_after=None):
+        """ Seconds to wait before retry number ``attempt + 1`` """
+
+        if retry_after is not None:
+            try:
+                retry_after = float(retry_after)
+            except ValueError:
+                retry_after = None
+            # NaN and infinity are not usable waits; fall back to backoff
+            if retry_after is not None and not math.isnan(retry_after) \
+                    and not math.isinf(retry_after):
+                return min(self.max_backoff, max(0.0, retry_after))
+
+        ceiling = min(self.max_backoff, self.backoff * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+
+class HedgePolicy(object):
+    """When to send a duplicate of a slow read
+
+    Latencies of recent successful reads are kept per API function, up to
+    ``window`` of them. Once ``min_samples`` have been seen, a read that
+    has not answered within the ``percentile`` latency (clamped to
+    ``min_delay``..``max_delay`` seconds) is sent again and whichever
+    response arrives first is used. Before that, ``max_delay`` applies.
+    """
+
+    def __init__(self, percentile=0.95, min_delay=0.05, max_delay=2.0,
+                 window=200, min_samples=20):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.window = window
+        self.min_samples = min_samples
+        self.hedged = 0
+        self.wins = 0
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def observe(self, api_method, elapsed):
+        """ Records the latency of a read that answered """
+
+        with self._lock:
+            samples = self._latencies.setdefault(api_method, [])
+            samples.append(elapsed)
+            if len(samples) > self.window:
+                del samples[0]
+
+    def delay(self, api_method):
+        """ Seconds to wait for the first attempt before hedging """
+
+        with self._lock:
+            samples = sorted(self._latencies.get(api_method, ()))
+        if len(samples) < self.min_samples:
+            return self.max_delay
+        index = min(len(samples) - 1, int(self.percentile * len(samples)))
+        return min(self.max_delay, max(self.min_delay, samples[index]))
+
+    def record_hedge(self, won):
+        """ Counts a duplicate sent, and whether it answered first """
+
+        with self._lock:
+            self.hedged += 1
+            if won:
+                self.wins += 1
+
+    def stats(self):
+        with self._lock:
+            return {'hedged': self.hedged, 'wins': self.wins}
+
+
+class CircuitBreaker(object):
+    """Fails calls fast while the API keeps failing
+
+    After ``failure_threshold`` consecutive failed attempts (connection
+    errors, timeouts or a status in ``failure_statuses``) the breaker opens
+    and every call fails at once with LacrmCircuitOpenError. After
+    ``cooldown`` seconds it lets a single trial request through
+    (half-open): success closes it again, failure re-opens it for another
+    cool-down.
+
+    The breaker is thread safe and can be shared between clients.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, cooldown=30.0,
+                 failure_statuses=(500, 502, 503, 504), clock=_clock):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failure_statuses = tuple(failure_statuses)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def _current_state(self):
+        """ Returns the state, moving open to half-open; caller locks """
+
+        if self._state == self.OPEN and \
+                self._clock() - self._opened_at >= self.cooldown:
+            self._state = self.HALF_OPEN
+            self._trial_running = False
+        return self._state
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def allow(self):
+        """ Whether a request may be sent now """
+
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_after(self):
+        """ Seconds until the breaker lets a request through, or 0 """
+
+        with self._lock:
+            if self._current_state() != self.OPEN:
+                return 0.0
+            return max(0.0, self.cooldown -
+                       (self._clock() - self._opened_at))
+
+    def record(self, status_code=None, error=False):
+        """ Feeds back the outcome of an attempt that ``allow`` let through """
+
+        failed = error or status_code in self.failure_statuses
+        with self._lock:
+            state = self._current_state()
+            self._trial_running = False
+            if not failed:
+                self._failures = 0
+                self._state = self.CLOSED
+                return
+
+            self._failures += 1
+            if state == self.HALF_OPEN or \
+                    self._failures >= self.failure_threshold:
+                if state != self.OPEN:
+                    self.times_opened += 1
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+
+    def reset(self):
+        """ Closes the breaker and forgets past failures """
+
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def stats(self):
+        """ Returns the state and counters """
+
+        with self._lock:
+            return {'state': self._current_state(),
+                    'consecutive_failures': self._failures,
+                    'times_opened': self.times_opened,
+                    'rejected': self.rejected}
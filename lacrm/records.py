@@ -0,0 +1,175 @@
+"Compact record types for LACRM contacts and pipeline items"
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
+
+from lacrm.codec import default_codec
+
+_CODEC = default_codec()
+
+
+def flatten_texts(value):
+    """ Flattens LACRM email/phone values (strings or Text dicts) """
+
+    if not value:
+        return []
+    if not isinstance(value, list):
+        value = [value]
+
+    texts = []
+    for item in value:
+        if isinstance(item, dict):
+            item = item.get('Text')
+        if item:
+            texts.append(str(item).strip())
+
+    return texts
+
+
+class Record(Mapping):
+    """Read-only, dict-like view over one record's raw JSON
+
+    Only the encoded JSON is kept until a field is first read; the record
+    is then decoded once, and the decoded fields replace the JSON. A cold
+    record therefore costs little more than its JSON text, several times
+    less than the equivalent dict of nested lists and dicts, and a decoded
+    one no more than that dict.
+    """
+
+    __slots__ = ('_raw', '_data')
+
+    def __init__(self, raw):
+        if not isinstance(raw, bytes):
+            raw = raw.encode('utf-8')
+        self._raw = raw
+        self._data = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """ Builds a record from an already decoded dict """
+
+        return cls(_CODEC.dumps(data))
+
+    @property
+    def raw(self):
+        """ The record's JSON, as bytes; re-encoded once decoded """
+
+        if self._raw is None:
+            return _CODEC.dumps(self._data).encode('utf-8')
+        return self._raw
+
+    def _fields(self):
+        if self._data is None:
+            self._data = _CODEC.loads(self._raw)
+            self._raw = None
+        return self._data
+
+    @property
+    def is_decoded(self):
+        return self._data is not None
+
+    def __getitem__(self, key):
+        return self._fields()[key]
+
+    def __iter__(self):
+        return iter(self._fields())
+
+    def __len__(self):
+        return len(self._fields())
+
+    def __getstate__(self):
+        return self.raw
+
+    def __setstate__(self, state):
+        self._raw = state
+        self._data = None
+
+    def to_dict(self):
+        """ Returns a fresh, mutable dict copy of the record """
+
+        return _CODEC.loads(self.raw)
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.raw)
+
+
+class Contact(Record):
+    """A LACRM contact"""
+
+    __slots__ = ()
+
+    @property
+    def contact_id(self):
+        return self.get('ContactId')
+
+    @property
+    def emails(self):
+        """ Email addresses as plain strings """
+
+        return flatten_texts(self.get('Email'))
+
+    @property
+    def phones(self):
+        """ Phone numbers as plain strings """
+
+        return flatten_texts(self.get('Phone'))
+
+    @property
+    def custom_fields(self):
+        """ Custom fields as a name to value dict """
+
+        fields = self.get('CustomFields') or {}
+        if isinstance(fields, list):
+            return dict((field.get('Name'), field.get('Value'))
+                        for field in fields)
+        return fields
+
+
+class PipelineItem(Record):
+    """An item in a LACRM pipeline report"""
+
+    __slots__ = ()
+
+    @property
+    def pipeline_item_id(self):
+        return self.get('PipelineItemId')
+
+    @property
+    def contact_id(self):
+        return self.get('ContactId')
+
+    @property
+    def status(self):
+        return self.get('Status')
+
+    @property
+    def priority(self):
+        return self.get('Priority')
+
+
+# Record type returned for each API function when records are requested
+RECORD_TYPES = {'GetContact': Contact,
+                'SearchContacts': Contact,
+                'GetPipelineReport': PipelineItem}
+
+
+def to_records(api_method, value):
+    """ Wraps a parsed response value in the function's record type
+
+    The response is already decoded to dicts, which are only released once
+    every record is built, so this shrinks what is retained, not the peak.
+    ``stream=True`` listings build records while parsing instead.
+    """
+
+    record_type = RECORD_TYPES.get(api_method)
+    if record_type is None:
+        return value
+    if isinstance(value, list):
+        return [record_type.from_dict(item) if isinstance(item, dict)
+                else item for item in value]
+    if isinstance(value, dict):
+        return record_type.from_dict(value)
+
+    return value
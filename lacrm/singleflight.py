@@ -0,0 +1,127 @@
+"Coalescing of identical in-flight read calls for lacrm"
+
+import copy
+import json
+import threading
+
+from lacrm.utils import LacrmTimeoutError
+
+
+class _Call(object):
+    """One in-flight call and the callers waiting on it"""
+
+    __slots__ = ('done', 'generation', 'result', 'error', 'waiters')
+
+    def __init__(self, done, generation):
+        self.done = done
+        self.generation = generation
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """Runs identical concurrent calls once and shares the outcome
+
+    Calls are identified by API function and canonical (key-sorted JSON)
+    parameters. The first caller for a key makes the request; callers that
+    arrive while it is in flight wait for it and receive a deep copy of
+    its result, or the same exception. Once the call finishes the key is
+    forgotten, so later calls go to the network again; this is not a cache.
+    Callers never join a call that started before the last ``invalidate``
+    (which the clients call after every write), so a read sent after a
+    write returned does not get a response that may predate it.
+
+    ``saved`` counts the requests avoided this way. Threads use ``do``;
+    the asyncio client builds on ``join``/``finish``/``share`` with
+    ``asyncio.Event`` in place of ``threading.Event``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._generation = 0
+        self.saved = 0
+
+    @staticmethod
+    def key(api_method, parameters):
+        return api_method, json.dumps(parameters, sort_keys=True,
+                                      default=str)
+
+    def join(self, key, make_done=threading.Event):
+        """ Returns ``(call, leader)``, registering a new call if needed """
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None or call.generation != self._generation:
+                call = self._calls[key] = _Call(make_done(), self._generation)
+                return call, True
+            call.waiters += 1
+            self.saved += 1
+            return call, False
+
+    def finish(self, key, call, result=None, error=None):
+        """ Records a leader's outcome and releases the key """
+
+        with self._lock:
+            # A call started after an invalidate may have taken the key
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            waiters = call.waiters
+        # Waiters copy from a snapshot, so the leader's caller may mutate
+        # its own result freely
+        call.result = copy.deepcopy(result) if waiters else result
+        call.error = error
+
+    @staticmethod
+    def share(call):
+        """ Returns a waiter's copy of the call's result, or raises """
+
+        if call.error is not None:
+            raise call.error
+        return copy.deepcopy(call.result)
+
+    def do(self, key, func, deadline=None, on_wait=None):
+        """ Returns ``func()``, or the result of an identical call in flight
+
+        ``on_wait()`` is called when this caller joins another's call. A
+        waiting caller gives up with LacrmTimeoutError once ``deadline`` (a
+        ``lacrm.utils.Deadline``) passes; the shared call carries on.
+        """
+
+        call, leader = self.join(key)
+        if not leader:
+            if on_wait is not None:
+                on_wait()
+            timeout = deadline.remaining() if deadline is not None else None
+            if not call.done.wait(timeout):
+                raise LacrmTimeoutError(content='deadline exceeded waiting '
+                                        'for an identical {} call'.format(
+                                            key[0]))
+            return self.share(call)
+
+        try:
+            result = func()
+        except BaseException as error:
+            self.finish(key, call, error=error)
+            raise
+        else:
+            self.finish(key, call, result)
+            return result
+        finally:
+            call.done.set()
+
+    def invalidate(self):
+        """ Stops later callers joining the calls now in flight """
+
+        with self._lock:
+            self._generation += 1
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        """ Returns the number of saved requests and calls in flight """
+
+        return {'saved': self.saved, 'in_flight': self.in_flight()}
@@ -1,5 +1,14 @@
 "Utilities classes for lacrm module"
 
+import os
+import time
+
+# Monotonic where available; Python 2 only has the wall clock
+_clock = getattr(time, 'monotonic', time.time)
+
+# os.replace is atomic on both POSIX and Windows; Python 2 only has rename
+_replace = getattr(os, 'replace', os.rename)
+
 
 class BaseLacrmError(Exception):
     """Base Lacrm API Exception"""
@@ -29,3 +38,55 @@ class LacrmArgumentError(BaseLacrmError):
 
     def __unicode__(self):
         return self.__str__()
+
+
+class LacrmTimeoutError(BaseLacrmError):
+    """Lacrm API call or paginated operation ran out of time"""
+
+    message = u'Request timed out. Response content: {content}.'
+
+
+class LacrmCircuitOpenError(BaseLacrmError):
+    """Lacrm API call refused because the circuit breaker is open"""
+
+    message = u'Circuit breaker open, not calling the API. Response ' \
+        u'content: {content}.'
+
+
+class Deadline(object):
+    """Time budget shared by every request of one operation"""
+
+    def __init__(self, seconds, clock=_clock):
+        self._clock = clock
+        self.expires = clock() + seconds
+
+    @classmethod
+    def coerce(cls, value):
+        """ Accepts a Deadline, a number of seconds or None """
+
+        if value is None or isinstance(value, Deadline):
+            return value
+        return cls(value)
+
+    def remaining(self):
+        """ Seconds left before the deadline (never negative) """
+
+        return max(0.0, self.expires - self._clock())
+
+    def check(self):
+        """ Raises LacrmTimeoutError once the deadline has passed """
+
+        if self.remaining() <= 0:
+            raise LacrmTimeoutError(content='deadline exceeded')
+
+    def clip(self, timeout):
+        """ Shrinks a requests-style timeout to fit in the remaining time """
+
+        self.check()
+        remaining = self.remaining()
+        if timeout is None:
+            return remaining
+        if isinstance(timeout, tuple):
+            return tuple(min(part, remaining) if part is not None
+                         else remaining for part in timeout)
+        return min(timeout, remaining)
@@ -0,0 +1,304 @@
+"""Write-behind queue for fire-and-forget LACRM writes
+
+``WriteBehind.submit`` validates a write and returns a future at once; the
+call itself runs later on a worker thread. Operations naming the same
+ContactId (or PipelineItemId) always go to the same worker, so they run in
+the order they were submitted.
+
+With a ``spool`` path every accepted operation is appended to a local file
+before ``submit`` returns, and marked done once it has run. Operations
+still pending when the process stops are replayed the next time a
+WriteBehind is opened on that spool. Delivery is therefore at least once:
+an operation that completed just before a crash, without its completion
+being recorded, is sent again. The spool is emptied whenever no operation
+is pending, so it only grows while the queue is busy.
+"""
+
+import atexit
+import io
+import json
+import os
+import threading
+from concurrent.futures import Future
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+from lacrm.utils import BaseLacrmError, _clock, _replace
+
+# Parameters whose value decides which worker runs an operation
+ORDERING_FIELDS = ('ContactId', 'PipelineItemId')
+
+
+
+class Spool(object):
+    """Append-only log of accepted and completed operations"""
+
+    def __init__(self, path, sync=True):
+        self.path = path
+        self.sync = sync
+        self._lock = threading.Lock()
+        self._file = None
+
+    def recover(self):
+        """ Returns ``[(op_id, api_method, parameters)]`` not yet done
+
+        The spool is then rewritten to hold only those operations.
+        """
+
+        added = {}
+        if os.path.exists(self.path):
+            with io.open(self.path, encoding='utf-8') as lines:
+                for line in lines:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The tail of a write interrupted by a crash
+                        continue
+                    if 'method' in entry:
+                        added[entry['id']] = (entry['method'],
+                                              entry['parameters'])
+                    else:
+                        added.pop(entry['id'], None)
+
+        pending = [(op_id,) + added[op_id] for op_id in sorted(added)]
+
+        temp_path = self.path + '.tmp'
+        with io.open(temp_path, 'wb') as compacted:
+            for op_id, api_method, parameters in pending:
+                compacted.write(self._line({'id': op_id,
+                                            'method': api_method,
+                                            'parameters': parameters}))
+            compacted.flush()
+            os.fsync(compacted.fileno())
+        _replace(temp_path, self.path)
+
+        self._file = io.open(self.path, 'ab')
+        return pending
+
+    @staticmethod
+    def _line(entry):
+        return json.dumps(entry).encode('utf-8') + b'\n'
+
+    def _append(self, entry, sync):
+        with self._lock:
+            if self._file is None:
+                # Closed while a call was still running; it is replayed
+                return
+            self._file.write(self._line(entry))
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+
+    def add(self, op_id, api_method, parameters):
+        self._append({'id': op_id, 'method': api_method,
+                      'parameters': parameters}, self.sync)
+
+    def done(self, op_id):
+        # Not fsynced: losing this line only means a replay
+        self._append({'id': op_id}, False)
+
+    def truncate(self):
+        """ Empties the spool; only safe when nothing is pending """
+
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.truncate(0)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class WriteBehind(object):
+    """Runs Lacrm write calls in the background
+
+    ``workers`` threads send operations through ``lacrm``; each returns
+    what the matching Lacrm method would. ``flush()`` waits until every
+    operation submitted so far has finished; ``close()`` (also run at
+    interpreter exit) stops accepting work and, by default, drains the
+    queue first. Operations replayed from the spool are available as
+    ``recovered`` futures.
+    """
+
+    def __init__(self, lacrm, spool=None, workers=4, sync=True):
+        self.lacrm = lacrm
+        self.spool = Spool(spool, sync) if spool else None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self._next_id = 0
+        self._closed = False
+        self.completed = 0
+        self.failed = 0
+
+        self._queues = [queue.Queue() for _ in range(max(1, workers))]
+        self._threads = [threading.Thread(target=self._work, args=(q,),
+                                          name='lacrm-write-behind-%d' % i)
+                         for i, q in enumerate(self._queues)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+        self.recovered = []
+        if self.spool is not None:
+            operations = self.spool.recover()
+            # All counted before any is queued, so the first to finish
+            # cannot find nothing pending and truncate the rest away
+            with self._lock:
+                for op_id, _, _ in operations:
+                    self._next_id = max(self._next_id, op_id + 1)
+                self._pending += len(operations)
+            for op_id, api_method, parameters in operations:
+                self.recovered.append(self._enqueue(op_id, api_method,
+                                                    parameters))
+
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _queue_for(self, parameters):
+        for field in ORDERING_FIELDS:
+            if parameters.get(field) is not None:
+                return self._queues[hash(str(parameters[field])) %
+                                    len(self._queues)]
+        # Unordered operations go to the shortest queue
+        return min(self._queues, key=lambda q: q.qsize())
+
+    def _enqueue(self, op_id, api_method, parameters):
+        """ Hands an operation to its worker; caller counted it pending """
+
+        future = Future()
+        self._queue_for(parameters).put((op_id, api_method, parameters,
+                                         future))
+        return future
+
+    def submit(self, method_name, *args):
+        """ Queues a Lacrm method call and returns its Future
+
+        The call is validated first, so a LacrmArgumentError is raised here
+        rather than through the future.
+        """
+
+        api_method, parameters = self.lacrm.prepare_call(method_name, *args)
+        with self._lock:
+            if self._closed:
+                raise BaseLacrmError(content='WriteBehind is closed')
+            op_id = self._next_id
+            self._next_id += 1
+            # Spooled under the lock so flush() cannot truncate it away
+            if self.spool is not None:
+                self.spool.add(op_id, api_method, parameters)
+            self._pending += 1
+
+        return self._enqueue(op_id, api_method, parameters)
+
+    def _work(self, work_queue):
+        while True:
+            item = work_queue.get()
+            if item is None:
+                return
+            op_id, api_method, parameters, future = item
+            if not future.set_running_or_notify_cancel():
+                error = None
+            else:
+                try:
+                    future.set_result(self.lacrm.send_prepared(api_method,
+                                                               parameters))
+                    error = None
+                except Exception as exc:  # pylint: disable=broad-except
+                    future.set_exception(exc)
+                    error = exc
+
+            if self.spool is not None:
+                self.spool.done(op_id)
+            with self._lock:
+                if error is None:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self._pending -= 1
+                if not self._pending:
+                    # Every spooled operation is done, so the spool can be
+                    # emptied; after close(drain=False) it holds work to
+                    # replay and is left alone
+                    if self.spool is not None and not self._closed:
+                        self.spool.truncate()
+                    self._idle.notify_all()
+
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def flush(self, timeout=None):
+        """ Waits for every queued operation; returns False on timeout """
+
+        end = None if timeout is None else _clock() + timeout
+        with self._lock:
+            while self._pending:
+                remaining = None if end is None else end - _clock()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+
+            if self.spool is not None:
+                self.spool.truncate()
+        return True
+
+    def close(self, drain=True, timeout=None):
+        """ Stops the workers, first finishing queued work if ``drain``
+
+        Without ``drain``, queued operations stay in the spool (if any) to
+        be replayed by the next WriteBehind opened on it.
+        """
+
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+
+        if drain:
+            self.flush(timeout)
+        else:
+            for work_queue in self._queues:
+                self._discard_queued(work_queue)
+
+        for work_queue in self._queues:
+            work_queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        if self.spool is not None:
+            self.spool.close()
+
+        unregister = getattr(atexit, 'unregister', None)
+        if unregister is not None:
+            unregister(self.close)
+
+    def _discard_queued(self, work_queue):
+        while True:
+            try:
+                item = work_queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                item[3].cancel()
+                with self._lock:
+                    self._pending -= 1
+
+    def stats(self):
+        """ Returns counts of pending, completed and failed operations """
+
+        with self._lock:
+            return {'pending': self._pending, 'completed': self.completed,
+                    'failed': self.failed}
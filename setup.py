@@ -31,6 +31,19 @@ setup(
     keywords="lacrm less annoying CRM lessannoyingcrm.com",
     install_requires=[
         'requests[security]',
+        'futures; python_version < "3"',
     ],
+    extras_require={
+        'async': ['aiohttp'],
+        'fast': ['orjson'],
+        'parquet': ['pyarrow'],
+        'columnar': ['numpy', 'pandas'],
+    },
+    entry_points={
+        'console_scripts': [
+            'lacrm-export = lacrm.export:main',
+            'lacrm-import = lacrm.importer:main',
+        ],
+    },
     license='MIT',
 )
@@ -0,0 +1,7 @@
+" Shared pytest configuration "
+import sys
+
+collect_ignore = []
+if sys.version_info < (3, 6):
+    # Async generators and comprehensions are 3.6+ syntax
+    collect_ignore.append('test_aio.py')
@@ -0,0 +1,232 @@
+" Tests for aio.py "
+import asyncio
+import json
+import pytest
+from lacrm.aio import AsyncLacrm
+
+
+class FakeResponse(object):
+
+    def __init__(self, status, body):
+        self.status = status
+        self._body = body
+        self.headers = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def read(self):
+        return self._body.encode('utf-8')
+
+
+class FakeSession(object):
+    """ Minimal stand-in for aiohttp.ClientSession """
+
+    def __init__(self, bodies, status=200):
+        self.bodies = list(bodies)
+        self.status = status
+        self.calls = []
+
+    def post(self, url, data=None):
+        self.calls.append(data)
+        body = self.bodies.pop(0)
+        if isinstance(body, int):
+            return FakeResponse(body, '')
+        return FakeResponse(self.status, body)
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def async_conn(bodies, **kwargs):
+    return AsyncLacrm(user_code="1234", api_token="abcdef",
+                      session=FakeSession(bodies), **kwargs)
+
+
+def test_get_contact():
+    conn = async_conn(['{"Contact":"Cool attributes"}'])
+    assert run(conn.get_contact("12345")) == "Cool attributes"
+    assert conn.session.calls[0]['Function'] == 'GetContact'
+
+
+def test_create_note_raw():
+    conn = async_conn(['{"NoteId": "32987108", "Success": true}'])
+    result = run(conn.create_note('12345', 'A nice note', raw_response=True))
+    assert result == {'NoteId': '32987108', 'Success': True}
+
+
+def test_validation_is_shared():
+    from lacrm.utils import LacrmArgumentError
+    conn = async_conn([])
+    with pytest.raises(LacrmArgumentError):
+        conn.create_contact({'NotAField': 'x'})
+
+
+def test_get_all_contacts():
+    rng = list(range(699))
+    conn = async_conn([json.dumps({'Result': rng[:500]}),
+                       json.dumps({'Result': rng[500:]})])
+    assert run(conn.get_all_contacts()) == rng
+
+
+def test_bounded_concurrency():
+    conn = async_conn(['{"Contact": %d}' % i for i in range(20)],
+                      max_concurrency=3)
+
+    async def gather():
+        return await asyncio.gather(
+            *[conn.get_contact(str(i)) for i in range(20)])
+
+    assert sorted(run(gather())) == list(range(20))
+    assert conn._semaphore._value == 3
+
+
+def test_iter_pipeline_report_pages():
+    rng = list(range(699))
+    conn = async_conn([json.dumps({'Result': rng[:500]}),
+                       json.dumps({'Result': rng[500:]})])
+
+    async def collect():
+        return [page async for page in
+                conn.iter_pipeline_report('pipeline_id', 'all', pages=True)]
+
+    assert run(collect()) == [rng[:500], rng[500:]]
+
+
+def test_unknown_pipeline_status_raises():
+    from lacrm.utils import LacrmArgumentError
+    conn = async_conn([])
+
+    async def collect():
+        return [page async for page in
+                conn.iter_pipeline_report('pipeline_id', 'opne')]
+
+    with pytest.raises(LacrmArgumentError):
+        run(collect())
+    assert not conn.session.calls
+
+
+def test_retries_server_errors():
+    from lacrm.ratelimit import RetryPolicy
+    conn = async_conn([503, 500, '{"Contact": "ok"}'],
+                      retry=RetryPolicy(backoff=0))
+    assert run(conn.get_contact('1')) == 'ok'
+    assert len(conn.session.calls) == 3
+
+
+def test_identical_reads_are_coalesced():
+    from lacrm.metrics import Metrics
+    conn = async_conn(['{"Contact": {"ContactId": "1"}}',
+                       '{"Contact": {"ContactId": "1"}}'], metrics=Metrics())
+
+    async def main():
+        return await asyncio.gather(*[conn.get_contact('1')
+                                      for _ in range(5)])
+
+    results = run(main())
+    assert results == [{'ContactId': '1'}] * 5
+    assert len(conn.session.calls) == 1
+    assert conn.singleflight.saved == 4
+    assert conn.stats()['GetContact']['coalesced'] == 4
+
+    results[0]['ContactId'] = 'changed'
+    assert results[1] == {'ContactId': '1'}
+    assert run(conn.get_contact('1')) == {'ContactId': '1'}
+    assert len(conn.session.calls) == 2
+
+
+def test_slow_reads_are_hedged():
+    from lacrm.ratelimit import HedgePolicy
+
+    class SlowResponse(FakeResponse):
+        async def read(self):
+            await asyncio.sleep(1)
+            return b'{"Contact": "slow"}'
+
+    class SlowFirstSession(FakeSession):
+        def post(self, url, data=None):
+            self.calls.append(data)
+            if len(self.calls) == 1:
+                return SlowResponse(200, '')
+            return FakeResponse(200, '{"Contact": "fast"}')
+
+    hedge = HedgePolicy(max_delay=0.05)
+    conn = AsyncLacrm(user_code="1234", api_token="abcdef",
+                      session=SlowFirstSession([]), hedge=hedge)
+
+    assert run(conn.get_contact('1')) == 'fast'
+    assert len(conn.session.calls) == 2
+    assert hedge.stats() == {'hedged': 1, 'wins': 1}
+
+
+def test_search_contacts_many():
+    conn = async_conn([json.dumps({'Result': [{'ContactId': '1'},
+                                              {'ContactId': '2'}]}),
+                       json.dumps({'Result': [{'ContactId': '2'}]})])
+
+    found = run(conn.search_contacts_many(['a', 'b', 'a'], concurrency=1))
+    assert list(found) == ['a', 'b']
+    assert found['b'][0] is found['a'][1]
+    assert [json.loads(call['Parameters'])['SearchTerms']
+            for call in conn.session.calls] == ['a', 'b']
+
+
+def test_bulk():
+    conn = async_conn(['{"NoteId": "n1"}', 500, '{"NoteId": "n3"}'])
+    report = run(conn.bulk([('create_note', '1', 'a'), ('not_a_method',),
+                            ('create_note', '2', 'b'),
+                            ('create_note', '3', 'c')], concurrency=1))
+
+    assert [r.result for r in report] == ['n1', None, None, 'n3']
+    assert report.summary() == {'total': 4, 'succeeded': 2, 'failed': 2}
+    assert len(conn.session.calls) == 3
+
+
+LISTING = json.dumps({'Result': [{'ContactId': '1',
+                                  'Email': [{'Text': 'ann@example.com'}]}]})
+WRITTEN = '{"ContactId": "101", "Success": true}'
+
+
+def test_concurrent_upserts_load_the_index_once(monkeypatch):
+    from lacrm.index import ContactIndex
+    conn = async_conn([LISTING] + [WRITTEN] * 3, index=ContactIndex(),
+                      coalesce=False)
+    read = FakeResponse.read
+
+    async def slow_read(self):
+        await asyncio.sleep(0.01)
+        return await read(self)
+    monkeypatch.setattr(FakeResponse, 'read', slow_read)
+
+    async def main():
+        return await asyncio.gather(*[
+            conn.upsert_contact({'Email': email}) for email in
+            ('ann@example.com', 'bob@example.com', 'cy@example.com')])
+
+    results = run(main())
+    assert results[0] == ('1', False)
+    assert [call['Function'] for call in conn.session.calls] == [
+        'SearchContacts', 'EditContact', 'CreateContact', 'CreateContact']
+
+
+def test_upsert_contacts():
+    from lacrm.index import ContactIndex
+    conn = async_conn([LISTING] + [WRITTEN] * 3, index=ContactIndex())
+
+    report = run(conn.upsert_contacts([{'Email': 'new@example.com'},
+                                       {'Email': 'ann@example.com'},
+                                       {'Email': 'New@example.com'},
+                                       {'NotAField': 'x'}]))
+
+    assert report.summary() == {'total': 4, 'succeeded': 3, 'failed': 1}
+    assert [result.operation[0] for result in report] == [
+        'create_contact', 'edit_contact', 'edit_contact', 'upsert']
+    assert report.results[2].operation[1] == '101'
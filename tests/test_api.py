@@ -268,3 +268,382 @@ def test_get_all_pipeline_report(lacrm_conn):
         )
 
         assert lacrm_conn.get_all_pipeline_report('pipeline_id', status='all') == rng
+
+
+def test_shared_session_is_not_closed():
+    import requests
+    try:
+        from unittest import mock
+    except ImportError:
+        import mock
+    session = requests.Session()
+    session.close = mock.Mock()
+    with Lacrm(user_code="1234", api_token="abcdef", session=session) as conn:
+        assert conn.session is session
+    session.close.assert_not_called()
+
+    own = Lacrm(user_code="1234", api_token="abcdef")
+    own.session.close = mock.Mock()
+    own.close()
+    own.session.close.assert_called_once_with()
+
+
+def test_client_options():
+    conn = Lacrm(user_code="1234", api_token="abcdef", timeout=(1, 2),
+                 coalesce=False)
+    assert conn.timeout == conn.options.timeout == (1, 2)
+    assert conn.singleflight is None
+    assert conn.cache is None
+
+    with pytest.raises(TypeError):
+        Lacrm(user_code="1234", api_token="abcdef", timout=5)
+
+
+@responses.activate
+def test_calls_reuse_session(lacrm_conn):
+    responses.add(
+        responses.POST,
+        re.compile('^https://api.lessannoyingcrm.com.*$'),
+        body='{"Contact":"Cool attributes"}',
+        status=http.OK
+    )
+
+    session = lacrm_conn.session
+    lacrm_conn.get_contact("1")
+    lacrm_conn.get_contact("2")
+    assert lacrm_conn.session is session
+    assert len(responses.calls) == 2
+
+
+def paged_callback(records, page_size=500):
+    """ Serves the page of ``records`` named in the request's parameters """
+    import json
+    try:
+        from urllib.parse import parse_qs
+    except ImportError:
+        from urlparse import parse_qs
+
+    def callback(request):
+        parameters = json.loads(parse_qs(request.body)['Parameters'][0])
+        start = (parameters['Page'] - 1) * page_size
+        body = {'Result': records[start:start + page_size], 'Success': True}
+        return (http.OK, {}, json.dumps(body))
+
+    return callback
+
+
+@pytest.mark.parametrize('concurrency', [1, 4])
+@responses.activate
+def test_get_all_contacts_concurrent(lacrm_conn, concurrency):
+    rng = [i for i in range(0, 1699)]
+    responses.add_callback(
+        responses.POST,
+        re.compile('^https://api.lessannoyingcrm.com.*$'),
+        callback=paged_callback(rng)
+    )
+
+    assert lacrm_conn.get_all_contacts(concurrency=concurrency) == rng
+
+
+@responses.activate
+def test_get_all_contacts_keeps_params(lacrm_conn):
+    responses.add(
+        responses.POST,
+        re.compile('^https://api.lessannoyingcrm.com.*$'),
+        json={'Result': [1, 2], 'Success': True},
+        status=http.OK
+    )
+
+    params = {'Sort': 'LastName'}
+    assert lacrm_conn.get_all_contacts(params) == [1, 2]
+    assert params == {'Sort': 'LastName'}
+
+
+@responses.activate
+def test_iter_contacts_is_lazy(lacrm_conn):
+    rng = [i for i in range(0, 1200)]
+    responses.add_callback(
+        responses.POST,
+        re.compile('^https://api.lessannoyingcrm.com.*$'),
+        callback=paged_callback(rng)
+    )
+
+    contacts = lacrm_conn.iter_contacts()
+    assert next(contacts) == 0
+    assert len(responses.calls) == 1
+    assert list(contacts) == rng[1:]
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_iter_pipeline_report_pages(lacrm_conn):
+    rng = [i for i in range(0, 699)]
+    responses.add_callback(
+        responses.POST,
+        re.compile('^https://api.lessannoyingcrm.com.*$'),
+        callback=paged_callback(rng)
+    )
+
+    pages = list(lacrm_conn.iter_pipeline_report('pipeline_id', status='all',
+                                                 pages=True))
+    assert pages == [rng[:500], rng[500:]]
+
+
+def test_unknown_pipeline_status_raises(lacrm_conn):
+    from lacrm.utils import LacrmArgumentError
+    with pytest.raises(LacrmArgumentError):
+        list(lacrm_conn.iter_pipeline_report('pipeline_id', status='opne'))
+
+
+@responses.activate
+def test_caller_dicts_are_not_mutated(lacrm_conn):
+    responses.add(
+        responses.POST,
+        re.compile('^https://api.lessannoyingcrm.com.*$'),
+        body='{"Result": []}',
+        status=http.OK
+    )
+
+    params = {'NumRows': 10}
+    data = {'FirstName': 'Bob'}
+    pipeline_data = {'Note': 'Called'}
+    lacrm_conn.search_contacts('term', params)
+    lacrm_conn.edit_contact('12345', data)
+    lacrm_conn.create_pipeline('12345', pipeline_data)
+    lacrm_conn.update_pipeline('6789', pipeline_data)
+    lacrm_conn.get_pipeline_report('pipeline_id', params)
+    assert params == {'NumRows': 10}
+    assert data == {'FirstName': 'Bob'}
+    assert pipeline_data == {'Note': 'Called'}
+
+
+@responses.activate
+def test_threads_share_instance(lacrm_conn):
+    import json
+    from concurrent.futures import ThreadPoolExecutor
+    try:
+        from urllib.parse import parse_qs
+    except ImportError:
+        from urlparse import parse_qs
+
+    def callback(request):
+        form = parse_qs(request.body)
+        parameters = json.loads(form['Parameters'][0])
+        body = {'Function': form['Function'][0],
+                'ContactId': parameters['ContactId']}
+        return (http.OK, {}, json.dumps({'Contact': body}))
+
+    responses.add_callback(
+        responses.POST,
+        re.compile('^https://api.lessannoyingcrm.com.*$'),
+        callback=callback
+    )
+
+    def call(i):
+        if i % 2:
+            return lacrm_conn.get_contact(str(i))
+        return lacrm_conn.delete_contact(str(i), raw_response=True)['Contact']
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(call, range(200)))
+
+    for i, result in enumerate(results):
+        assert result['ContactId'] == str(i)
+        assert result['Function'] == ('GetContact' if i % 2 else
+                                      'DeleteContact')
+    assert 'Function' not in lacrm_conn.payload
+
+
+def test_timeouts_are_passed_to_requests(lacrm_conn):
+    from mock import patch, Mock
+    response = Mock(status_code=http.OK, content=b'{"Contact": "x"}')
+    with patch.object(lacrm_conn.session, 'post',
+                      return_value=response) as post:
+        lacrm_conn.get_contact('1')
+        assert post.call_args[1]['timeout'] == (10, 60)
+        lacrm_conn.get_contact('1', timeout=2)
+        assert post.call_args[1]['timeout'] == 2
+        lacrm_conn.get_contact('1', timeout=(3, 30), deadline=5)
+        connect, read = post.call_args[1]['timeout']
+        assert connect == 3
+        assert read <= 5
+
+
+@responses.activate
+def test_request_timeout_raises(lacrm_conn):
+    import requests
+    from lacrm.utils import LacrmTimeoutError
+    responses.add(
+        responses.POST,
+        re.compile('^https://api.lessannoyingcrm.com.*$'),
+        body=requests.ReadTimeout('slow')
+    )
+
+    with pytest.raises(LacrmTimeoutError):
+        lacrm_conn.get_contact('1')
+
+
+def test_deadline_clip():
+    from lacrm.utils import Deadline, LacrmTimeoutError
+    now = [0.0]
+    deadline = Deadline(5, clock=lambda: now[0])
+    assert deadline.clip((3, 30)) == (3, 5)
+    assert deadline.clip(None) == 5
+    now[0] = 6
+    with pytest.raises(LacrmTimeoutError):
+        deadline.clip(1)
+
+
+@responses.activate
+def test_iter_contacts_honours_num_rows(lacrm_conn):
+    rng = list(range(250))
+    responses.add_callback(
+        responses.POST, re.compile('^https://api.lessannoyingcrm.com.*$'),
+        callback=paged_callback(rng, page_size=100))
+
+    assert lacrm_conn.get_all_contacts({'NumRows': 100}) == rng
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_total_count_avoids_empty_page(lacrm_conn):
+    from lacrm.pagination import PagePlan
+    url = re.compile('^https://api.lessannoyingcrm.com.*$')
+    responses.add(responses.POST, url, json={'Result': list(range(500)),
+                                             'TotalCount': 1000})
+    responses.add(responses.POST, url, json={'Result': list(range(500, 1000)),
+                                             'TotalCount': 1000})
+    plan = PagePlan()
+
+    assert lacrm_conn.get_all_contacts(plan=plan) == list(range(1000))
+    assert len(responses.calls) == 2
+    assert plan.progress()['records'] == 1000
+    assert plan.eta == 0.0
+
+
+def test_slow_reads_are_hedged():
+    import threading
+    import time
+    from lacrm.ratelimit import HedgePolicy
+
+    class Response(object):
+        status_code = 200
+        headers = {}
+        closed = False
+
+        def __init__(self, content):
+            self.content = content
+
+        def close(self):
+            self.closed = True
+
+    class SlowFirstSession(object):
+        def __init__(self):
+            self.calls = 0
+            self.responses = []
+            self.lock = threading.Lock()
+
+        def post(self, url, data=None, timeout=None, stream=False):
+            with self.lock:
+                self.calls += 1
+                first = self.calls == 1
+            time.sleep(0.5 if first else 0.01)
+            response = Response(b'{"Contact": "slow"}' if first
+                                else b'{"Contact": "fast"}')
+            self.responses.append(response)
+            return response
+
+    hedge = HedgePolicy(max_delay=0.05)
+    session = SlowFirstSession()
+    conn = Lacrm(user_code='1234', api_token='abcdef', session=session,
+                 hedge=hedge, coalesce=False)
+
+    started = time.time()
+    assert conn.get_contact('1') == 'fast'
+    assert time.time() - started < 0.4
+    assert hedge.stats() == {'hedged': 1, 'wins': 1}
+
+    conn.create_note('1', 'writes are never hedged')
+    assert session.calls == 3
+    time.sleep(0.6)
+    assert session.responses[-1].closed
+    conn.close()
+
+
+@responses.activate
+def test_hedge_can_be_enabled_after_construction(lacrm_conn):
+    from lacrm.ratelimit import HedgePolicy
+    responses.add(
+        responses.POST,
+        re.compile('^https://api.lessannoyingcrm.com.*$'),
+        body='{"Contact": "ok"}',
+        status=http.OK
+    )
+
+    lacrm_conn.hedge = HedgePolicy(max_delay=1)
+    assert lacrm_conn.get_contact('1') == 'ok'
+    lacrm_conn.close()
+
+
+@responses.activate
+def test_search_contacts_many(lacrm_conn):
+    import json
+    try:
+        from urllib.parse import parse_qs
+    except ImportError:
+        from urlparse import parse_qs
+
+    matches = {'a@x.com': [{'ContactId': str(i)} for i in range(600)],
+               'b@x.com': [{'ContactId': '7'}, {'ContactId': '7'}],
+               'nobody': []}
+
+    def callback(request):
+        parameters = json.loads(parse_qs(request.body)['Parameters'][0])
+        assert parameters['Sort'] == 'LastName'
+        start = (parameters['Page'] - 1) * parameters['NumRows']
+        result = matches[parameters['SearchTerms']]
+        return (http.OK, {}, json.dumps(
+            {'Result': result[start:start + parameters['NumRows']]}))
+
+    responses.add_callback(
+        responses.POST, re.compile('^https://api.lessannoyingcrm.com.*$'),
+        callback=callback)
+
+    found = lacrm_conn.search_contacts_many(
+        ['b@x.com', 'a@x.com', 'nobody', 'a@x.com'], {'Sort': 'LastName'},
+        concurrency=3)
+
+    assert list(found) == ['b@x.com', 'a@x.com', 'nobody']
+    assert len(found['a@x.com']) == 600
+    assert found['b@x.com'] == [{'ContactId': '7'}]
+    assert found['b@x.com'][0] is found['a@x.com'][7]
+    assert found['nobody'] == []
+    assert len(responses.calls) == 4
+
+
+def test_reads_after_a_write_do_not_join_older_reads(lacrm_conn):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    started, release = threading.Event(), threading.Event()
+    versions = []
+
+    def send(api_method, method_payload, timeout=None, deadline=None,
+             stream=False):
+        if api_method != 'GetContact':
+            return 200, {'Success': True}
+        version = len(versions)
+        versions.append(version)
+        if version == 0:
+            started.set()
+            release.wait(5)
+        return 200, {'Contact': {'ContactId': '1', 'Version': version}}
+
+    lacrm_conn._send = send
+    with ThreadPoolExecutor(2) as executor:
+        before = executor.submit(lacrm_conn.get_contact, '1')
+        started.wait(5)
+        lacrm_conn.edit_contact('1', {'FirstName': 'New'})
+        after = executor.submit(lacrm_conn.get_contact, '1')
+        assert after.result(5) == {'ContactId': '1', 'Version': 1}
+        release.set()
+        assert before.result(5) == {'ContactId': '1', 'Version': 0}
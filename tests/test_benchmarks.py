@@ -0,0 +1,50 @@
+" Tests for the benchmark stand-in server "
+import pytest
+pytest.importorskip('tracemalloc')  # benchmarks.run needs Python 3.4+
+from benchmarks.run import regressions  # noqa: E402
+from benchmarks.server import StandInServer
+from lacrm.api import Lacrm
+from lacrm.utils import BaseLacrmError
+
+
+@pytest.fixture(scope='module')
+def server():
+    with StandInServer(contacts=1203, pipeline_items=500) as server:
+        yield server
+
+
+@pytest.fixture
+def client(server):
+    client = Lacrm(user_code='bench', api_token='bench')
+    client.endpoint_url = server.url
+    yield client
+    client.close()
+
+
+def test_stand_in_pagination(client):
+    contacts = client.get_all_contacts(concurrency=3)
+    assert len(contacts) == 1203
+    assert len(set(c['ContactId'] for c in contacts)) == 1203
+    assert len(client.get_all_pipeline_report('p', status='all')) == 500
+
+
+def test_stand_in_reads_and_writes(client):
+    assert client.get_contact('100005')['FirstName'] == 'First5'
+    assert client.create_note('100005', 'hello')
+
+
+def test_stand_in_errors():
+    with StandInServer(contacts=1, error_rate=1.0) as server:
+        client = Lacrm(user_code='bench', api_token='bench')
+        client.endpoint_url = server.url
+        with pytest.raises(BaseLacrmError):
+            client.get_contact('100000')
+
+
+def test_regressions():
+    baseline = {'results': [{'scenario': 'a', 'concurrency': 1,
+                             'records_per_sec': 100.0}]}
+    assert regressions(baseline, [{'scenario': 'a', 'concurrency': 1,
+                                   'records_per_sec': 90.0}], 0.2) == []
+    assert len(regressions(baseline, [{'scenario': 'a', 'concurrency': 1,
+                                       'records_per_sec': 70.0}], 0.2)) == 1
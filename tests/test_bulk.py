@@ -0,0 +1,96 @@
+" Tests for bulk.py "
+import json
+import re
+import pytest
+import responses
+from lacrm.api import Lacrm
+from lacrm.utils import LacrmArgumentError
+try:
+    from urllib.parse import parse_qs
+except ImportError:
+    from urlparse import parse_qs
+
+
+@pytest.fixture
+def lacrm_conn():
+    return Lacrm(user_code="1234", api_token="abcdef")
+
+
+def echo_note(request):
+    form = parse_qs(request.body)
+    parameters = json.loads(form['Parameters'][0])
+    if parameters.get('Note') == 'fail':
+        return (500, {}, '')
+    body = {'NoteId': 'note-' + parameters.get('ContactId', ''),
+            'TaskId': 'task-1', 'Success': True}
+    return (200, {}, json.dumps(body))
+
+
+@responses.activate
+def test_bulk_results_in_order(lacrm_conn):
+    responses.add_callback(
+        responses.POST,
+        re.compile('^https://api.lessannoyingcrm.com.*$'),
+        callback=echo_note
+    )
+
+    operations = [('create_note', str(i), 'Hello') for i in range(50)]
+    operations.append(('create_task', {'DueDate': '2017-12-01',
+                                       'Description': 'Call'}))
+    report = lacrm_conn.bulk(operations, concurrency=8)
+    assert [r.result for r in report][:50] == \
+        ['note-%d' % i for i in range(50)]
+    assert report.results[50].result == 'task-1'
+    assert report.summary() == {'total': 51, 'succeeded': 51, 'failed': 0}
+
+
+@responses.activate
+def test_invalid_items_fail_before_io(lacrm_conn):
+    responses.add_callback(
+        responses.POST,
+        re.compile('^https://api.lessannoyingcrm.com.*$'),
+        callback=echo_note
+    )
+
+    report = lacrm_conn.bulk([
+        ('create_task', {'Bogus': 1}),
+        ('add_contact_to_group', '1', 'has spaces'),
+        ('not_a_method', 1),
+        ('create_note', '2', 'fail'),
+        ('create_note', '3', 'ok'),
+    ])
+    errors = [r.error for r in report]
+    assert isinstance(errors[0], LacrmArgumentError)
+    assert isinstance(errors[1], LacrmArgumentError)
+    assert isinstance(errors[2], LacrmArgumentError)
+    assert errors[3] is not None
+    assert report.results[4].result == 'note-3'
+    assert len(responses.calls) == 2
+    assert report.summary()['failed'] == 4
+
+
+def test_prepare_call_validates(lacrm_conn):
+    assert lacrm_conn.prepare_call('create_note', '1', 'x') == \
+        ('CreateNote', {'ContactId': '1', 'Note': 'x'})
+    with pytest.raises(LacrmArgumentError):
+        lacrm_conn.prepare_call('create_event', {'Nope': 1})
+
+
+@responses.activate
+def test_send_prepared(lacrm_conn):
+    responses.add_callback(
+        responses.POST, re.compile('^https://api.lessannoyingcrm.com.*$'),
+        callback=echo_note)
+    api_method, parameters = lacrm_conn.prepare_call('create_note', '1', 'x')
+    assert lacrm_conn.send_prepared(api_method, parameters) == 'note-1'
+    assert lacrm_conn.send_prepared(api_method, parameters,
+                                    raw_response=True)['NoteId'] == 'note-1'
+
+
+def test_malformed_operations_fail_alone(lacrm_conn):
+    report = lacrm_conn.bulk([(), ('create_note', '1'), ('create_task', None),
+                              None])
+    assert all(r.error is not None for r in report)
+    assert isinstance(report.results[0].error, LacrmArgumentError)
+    assert isinstance(report.results[1].error, TypeError)
+    assert report.summary() == {'total': 4, 'succeeded': 0, 'failed': 4}
@@ -0,0 +1,118 @@
+" Tests for cache.py "
+import re
+import responses
+from lacrm.api import Lacrm
+from lacrm.cache import ResponseCache
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_hit_and_miss():
+    cache = ResponseCache()
+    assert cache.get('GetContact', {'ContactId': '1'}) == (False, None)
+    cache.update('GetContact', {'ContactId': '1'}, {'Contact': {'a': 1}})
+    assert cache.get('GetContact', {'ContactId': '1'}) == \
+        (True, {'Contact': {'a': 1}})
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_writes_are_not_cached():
+    cache = ResponseCache()
+    cache.update('CreateNote', {'ContactId': '1', 'Note': 'x'}, {})
+    assert cache.get('CreateNote', {'ContactId': '1', 'Note': 'x'}) == \
+        (False, None)
+
+
+def test_ttl_expiry():
+    clock = FakeClock()
+    cache = ResponseCache(ttl={'GetContact': 10}, clock=clock)
+    cache.update('GetContact', {'ContactId': '1'}, {'Contact': 1})
+    clock.now = 11
+    assert cache.get('GetContact', {'ContactId': '1'}) == (False, None)
+
+
+def test_lru_eviction():
+    cache = ResponseCache(maxsize=2)
+    for contact_id in ('1', '2'):
+        cache.update('GetContact', {'ContactId': contact_id}, {})
+    cache.get('GetContact', {'ContactId': '1'})
+    cache.update('GetContact', {'ContactId': '3'}, {})
+    assert cache.get('GetContact', {'ContactId': '2'}) == (False, None)
+    assert cache.get('GetContact', {'ContactId': '1'})[0]
+    assert cache.stats()['evictions'] == 1
+
+
+def test_write_invalidates_tagged_entries():
+    cache = ResponseCache()
+    cache.update('GetContact', {'ContactId': '1'}, {})
+    cache.update('GetContact', {'ContactId': '2'}, {})
+    cache.update('GetPipelineReport', {'PipelineId': 'p'},
+                 {'Result': [{'PipelineItemId': '9', 'ContactId': '2'}]})
+    cache.update('CreateNote', {'ContactId': '2', 'Note': 'x'}, {})
+    assert cache.get('GetContact', {'ContactId': '1'})[0]
+    assert not cache.get('GetContact', {'ContactId': '2'})[0]
+    assert not cache.get('GetPipelineReport', {'PipelineId': 'p'})[0]
+
+
+def test_contact_edit_drops_searches():
+    cache = ResponseCache()
+    cache.update('SearchContacts', {'SearchTerms': 'bob'}, {'Result': []})
+    cache.update('EditContact', {'ContactId': '5', 'FirstName': 'Bob'}, {})
+    assert not cache.get('SearchContacts', {'SearchTerms': 'bob'})[0]
+
+
+@responses.activate
+def test_client_serves_reads_from_cache():
+    responses.add(
+        responses.POST,
+        re.compile('^https://api.lessannoyingcrm.com.*$'),
+        json={'Contact': {'ContactId': '12345'}, 'Success': True}
+    )
+
+    conn = Lacrm(user_code="1234", api_token="abcdef", cache=ResponseCache())
+    assert conn.get_contact('12345') == {'ContactId': '12345'}
+    assert conn.get_contact('12345') == {'ContactId': '12345'}
+    assert len(responses.calls) == 1
+
+    conn.edit_contact('12345', {'FirstName': 'Bob'})
+    conn.get_contact('12345')
+    assert len(responses.calls) == 3
+
+
+def test_accounts_are_kept_apart():
+    cache = ResponseCache()
+    cache.update('GetContact', {'ContactId': '1'}, {'Contact': 'a'}, 'ACME1')
+    cache.update('GetContact', {'ContactId': '1'}, {'Contact': 'g'},
+                 'GLOBEX1')
+    assert cache.get('GetContact', {'ContactId': '1'}, 'ACME1') == \
+        (True, {'Contact': 'a'})
+
+    cache.update('EditContact', {'ContactId': '1'}, {}, 'GLOBEX1')
+    assert cache.get('GetContact', {'ContactId': '1'}, 'ACME1')[0]
+    assert not cache.get('GetContact', {'ContactId': '1'}, 'GLOBEX1')[0]
+
+
+def test_reads_racing_a_write_are_not_stored():
+    cache = ResponseCache()
+    # A read misses, an edit of the same contact lands, then the read's
+    # (possibly older) response arrives
+    assert not cache.get('GetContact', {'ContactId': '1'})[0]
+    assert not cache.get('GetContact', {'ContactId': '2'})[0]
+    cache.update('EditContact', {'ContactId': '1', 'FirstName': 'New'}, {})
+    cache.update('GetContact', {'ContactId': '1'}, {'Contact': 'old'})
+    cache.update('GetContact', {'ContactId': '2'}, {'Contact': 'two'})
+
+    assert not cache.get('GetContact', {'ContactId': '1'})[0]
+    assert cache.get('GetContact', {'ContactId': '2'})[0]
+
+    cache.update('GetContact', {'ContactId': '1'}, {'Contact': 'new'})
+    assert cache.get('GetContact', {'ContactId': '1'}) == \
+        (True, {'Contact': 'new'})
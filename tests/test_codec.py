@@ -0,0 +1,158 @@
+" Tests for codec.py "
+import json
+import re
+import pytest
+import responses
+from lacrm.api import Lacrm
+from lacrm.codec import JsonCodec, OrjsonCodec, default_codec, iter_json_array
+from lacrm.utils import BaseLacrmError, LacrmArgumentError
+
+
+def chunked(text, size):
+    data = text.encode('utf-8')
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_json_codec_round_trip():
+    codec = JsonCodec()
+    assert codec.loads(codec.dumps({'a': [1, 'b']}).encode('utf-8')) == \
+        {'a': [1, 'b']}
+
+
+def test_orjson_codec_round_trip():
+    pytest.importorskip('orjson')
+    codec = OrjsonCodec()
+    assert isinstance(codec.dumps({'a': 1}), str)
+    assert codec.loads(b'{"a": 1}') == {'a': 1}
+    assert default_codec().name == 'orjson'
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, 64, 100000])
+def test_iter_json_array_chunks(size):
+    records = [{'ContactId': str(i), 'Name': u'Née %d' % i,
+                'Tags': [1, 2.5, None, True]} for i in range(20)] + [123, 45]
+    text = json.dumps({'Success': True, 'Meta': {'Result': [0]},
+                       'Result': records, 'Trailing': 'x'})
+    assert list(iter_json_array(chunked(text, size))) == records
+
+
+def test_iter_json_array_empty_and_missing():
+    assert list(iter_json_array([b'{"Result": []}'])) == []
+    assert list(iter_json_array([b'{}'])) == []
+    assert list(iter_json_array([b'{"Success": false}'])) == []
+
+
+def test_iter_json_array_truncated():
+    with pytest.raises(ValueError):
+        list(iter_json_array(chunked('{"Result": [{"a": 1}, {"b"', 4)))
+
+
+class CountingCodec(JsonCodec):
+
+    def __init__(self):
+        self.calls = 0
+
+    def loads(self, data):
+        self.calls += 1
+        return JsonCodec.loads(self, data)
+
+
+@responses.activate
+def test_custom_codec_is_used():
+    responses.add(
+        responses.POST,
+        re.compile('^https://api.lessannoyingcrm.com.*$'),
+        body='{"Contact": "x"}'
+    )
+
+    codec = CountingCodec()
+    conn = Lacrm(user_code="1234", api_token="abcdef", codec=codec)
+    assert conn.get_contact('1') == 'x'
+    assert codec.calls == 1
+
+
+@responses.activate
+def test_streamed_contacts():
+    rng = list(range(1000))
+    url = re.compile('^https://api.lessannoyingcrm.com.*$')
+    responses.add(responses.POST, url,
+                  json={'Success': True, 'Result': rng[:500]})
+    responses.add(responses.POST, url,
+                  json={'Success': True, 'Result': rng[500:]})
+    responses.add(responses.POST, url, json={'Success': True, 'Result': []})
+
+    conn = Lacrm(user_code="1234", api_token="abcdef")
+    assert list(conn.iter_contacts(stream=True)) == rng
+    assert len(responses.calls) == 3
+
+    with pytest.raises(LacrmArgumentError):
+        list(conn.iter_contacts(stream=True, concurrency=4))
+
+
+@responses.activate
+def test_streamed_pipeline_report():
+    responses.add(
+        responses.POST,
+        re.compile('^https://api.lessannoyingcrm.com.*$'),
+        json={'Result': [{'PipelineItemId': '1'}], 'Success': True}
+    )
+
+    conn = Lacrm(user_code="1234", api_token="abcdef")
+    assert list(conn.iter_pipeline_report('p', 'all', stream=True)) == \
+        [{'PipelineItemId': '1'}]
+
+
+@pytest.mark.parametrize('size', [1, 5, 1000])
+def test_iter_json_array_raw(size):
+    records = [{'ContactId': str(i), 'Name': u'Zoë'} for i in range(10)]
+    text = json.dumps({'Result': records})
+    raw = list(iter_json_array(chunked(text, size), raw=True))
+    assert [json.loads(item) for item in raw] == records
+
+
+def test_iter_json_array_numbers_split_across_chunks():
+    numbers = [1.5, 1e-07, -12.25e+3, 10, 0.5, -3]
+    text = json.dumps({'Result': numbers})
+    assert list(iter_json_array(chunked(text, 1))) == numbers
+    assert list(iter_json_array([b'{"Result": [1.', b'5, 1e', b'-07]}'])) \
+        == [1.5, 1e-07]
+
+
+def test_failed_streamed_responses_are_closed():
+    from lacrm.ratelimit import RetryPolicy
+
+    class Response(object):
+        closed = False
+
+        def __init__(self, status_code, body=b''):
+            self.status_code = status_code
+            self.headers = {'Retry-After': '0'}
+            self.body = body
+
+        def iter_content(self, size):
+            return [self.body]
+
+        def close(self):
+            self.closed = True
+
+    class Session(object):
+        def __init__(self, statuses):
+            self.responses = [Response(status, b'{"Result": [1, 2]}')
+                              for status in statuses]
+            self.sent = []
+
+        def post(self, url, data=None, timeout=None, stream=False):
+            self.sent.append(self.responses[len(self.sent)])
+            return self.sent[-1]
+
+    session = Session([503, 502, 200])
+    conn = Lacrm(user_code="1234", api_token="abcdef", session=session,
+                 retry=RetryPolicy(backoff=0))
+    assert list(conn._stream_results('search_contacts', ('x',))) == [1, 2]
+    assert all(response.closed for response in session.sent)
+
+    session = Session([404])
+    conn = Lacrm(user_code="1234", api_token="abcdef", session=session)
+    with pytest.raises(BaseLacrmError):
+        list(conn._stream_results('search_contacts', ('x',)))
+    assert session.sent[0].closed
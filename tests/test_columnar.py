@@ -0,0 +1,83 @@
+" Tests for columnar.py "
+import json
+import re
+import pytest
+import responses
+from lacrm.api import Lacrm
+from lacrm.utils import LacrmArgumentError
+
+np = pytest.importorskip('numpy')
+
+from lacrm.columnar import ColumnarListing, Categorical  # noqa: E402
+
+ITEMS = [
+    {'PipelineItemId': '1', 'Status': 'Won', 'Priority': 'High',
+     'UserId': 'u1', 'LastUpdate': '2020-01-01 00:00:00'},
+    {'PipelineItemId': '2', 'Status': 'Lost', 'Priority': 'Low',
+     'UserId': 'u2', 'LastUpdate': '2020-01-03 00:00:00'},
+    {'PipelineItemId': '3', 'Status': 'Won', 'Priority': 'High',
+     'UserId': 'u1', 'LastUpdate': None},
+    {'PipelineItemId': '4', 'Status': 'Won', 'UserId': 'u2',
+     'LastUpdate': '2020-01-05 00:00:00', 'Note': {'Text': 'late field'}},
+]
+
+# 2020-01-11 00:00:00 UTC
+NOW = 1578700800
+
+
+def test_columns_are_typed():
+    listing = ColumnarListing.from_records(ITEMS)
+
+    assert len(listing) == 4
+    assert listing.fields == ['PipelineItemId', 'Status', 'Priority',
+                              'UserId', 'LastUpdate', 'Note']
+    assert isinstance(listing.column('Status'), Categorical)
+    assert listing.column('Status').codes.dtype == np.int32
+    assert list(listing['Priority']) == ['High', 'Low', 'High', None]
+    assert listing['LastUpdate'].dtype == np.dtype('datetime64[s]')
+    assert list(listing['Note']) == [None, None, None, {'Text': 'late field'}]
+
+
+def test_aggregations():
+    listing = ColumnarListing.from_records(ITEMS)
+
+    assert listing.counts_by_status() == {'Won': 3, 'Lost': 1}
+    assert list(listing.counts_by_status()) == ['Won', 'Lost']
+    assert listing.priority_histogram() == {'High': 2, 'Low': 1}
+
+    counts, statuses, users = listing.crosstab('Status', 'UserId')
+    assert list(statuses) == ['Won', 'Lost']
+    assert list(users) == ['u1', 'u2']
+    assert counts.tolist() == [[2, 1], [0, 1]]
+
+    age = listing.age_days(now=NOW)
+    assert age[[0, 1, 3]].tolist() == [10.0, 8.0, 6.0]
+    assert np.isnan(age[2])
+    assert listing.mean_age_by('UserId', now=NOW) == {'u1': 10.0, 'u2': 7.0}
+
+    with pytest.raises(TypeError):
+        listing.count_by('PipelineItemId')
+
+
+def test_to_pandas():
+    pytest.importorskip('pandas')
+    frame = ColumnarListing.from_records(ITEMS).to_pandas()
+
+    assert str(frame['Status'].dtype) == 'category'
+    assert frame['Status'].value_counts()['Won'] == 3
+    assert frame['Priority'].isna().tolist() == [False, False, False, True]
+
+
+@responses.activate
+def test_get_all_pipeline_report_columnar():
+    responses.add(
+        responses.POST, re.compile('^https://api.lessannoyingcrm.com.*$'),
+        body=json.dumps({'Result': ITEMS}))
+    lacrm = Lacrm(user_code='1234', api_token='abcdef')
+
+    listing = lacrm.get_all_pipeline_report('pipeline', 'all',
+                                            columnar='numpy')
+    assert listing.counts_by_status() == {'Won': 3, 'Lost': 1}
+
+    with pytest.raises(LacrmArgumentError):
+        lacrm.get_all_pipeline_report('pipeline', 'all', columnar='arrow')
@@ -0,0 +1,95 @@
+" Tests for credentials.py "
+import os
+import pytest
+from lacrm import Lacrm
+from lacrm.credentials import CredentialStore
+from lacrm.utils import LacrmArgumentError
+
+ACCOUNTS = """
+[acme]
+user_code = ACME1
+api_token = acme-token
+rate_limit = 5
+
+[globex]
+user_code = GLOBEX1
+api_token = globex-token
+"""
+
+
+@pytest.fixture
+def home(tmpdir, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmpdir))
+    return tmpdir
+
+
+def test_dotfile_is_parsed_once(home, monkeypatch):
+    home.join('.lacrm').write('# comment\nABC12:token\n')
+    store = CredentialStore(environ={})
+    assert store.dotfile() == ('ABC12', 'token')
+
+    monkeypatch.setattr('lacrm.credentials.parse_dotfile',
+                        lambda path: pytest.fail('parsed twice'))
+    assert store.default() == ('ABC12', 'token')
+
+
+def test_changed_dotfile_is_reread(home):
+    dotfile = home.join('.lacrm')
+    dotfile.write('ABC12:token\n')
+    store = CredentialStore(environ={})
+    store.dotfile()
+
+    dotfile.write('XYZ99:other\n')
+    os.utime(str(dotfile), (1, 1))
+    assert store.dotfile() == ('XYZ99', 'other')
+
+
+def test_environment_wins_over_dotfile(home):
+    home.join('.lacrm').write('ABC12:token\n')
+    store = CredentialStore(environ={'LACRM_USER_CODE': 'ENV1',
+                                     'LACRM_API_TOKEN': 'env-token'})
+    assert store.default() == ('ENV1', 'env-token')
+    assert CredentialStore(environ={}).default() == ('ABC12', 'token')
+
+
+def test_accounts_file(home, tmpdir):
+    path = tmpdir.join('accounts.ini')
+    path.write(ACCOUNTS)
+    store = CredentialStore(environ={'LACRM_ACCOUNTS_FILE': str(path)})
+
+    acme = store.account('acme')
+    assert (acme.user_code, acme.api_token, acme.rate_limit) == \
+        ('ACME1', 'acme-token', 5.0)
+    assert store.account('globex').rate_limit is None
+    with pytest.raises(LacrmArgumentError):
+        store.account('initech')
+
+
+def test_accounts_file_tokens_may_contain_percent(tmpdir):
+    from lacrm.credentials import parse_accounts_file
+    path = tmpdir.join('accounts.ini')
+    path.write('[acme]\nuser_code = ACME1\napi_token = 50%off%(x)s\n')
+
+    assert parse_accounts_file(str(path))['acme'].api_token == '50%off%(x)s'
+
+
+def test_explicit_credentials_skip_the_dotfile(monkeypatch):
+    monkeypatch.setattr(Lacrm, '_parse_creds',
+                        lambda self: pytest.fail('dotfile read'))
+    conn = Lacrm(user_code='1234', api_token='abcdef')
+    assert conn.payload == {'UserCode': '1234', 'APIToken': 'abcdef'}
+
+
+def test_malformed_dotfile_raises_until_fixed(home):
+    dotfile = home.join('.lacrm')
+    dotfile.write('\nABC12:token\n')
+    store = CredentialStore(environ={})
+
+    with pytest.raises(LacrmArgumentError):
+        store.dotfile()
+    with pytest.raises(LacrmArgumentError):
+        store.dotfile()
+
+    dotfile.write('ABC12:token\n')
+    os.utime(str(dotfile), (1, 1))
+    assert store.dotfile() == ('ABC12', 'token')
@@ -0,0 +1,124 @@
+" Tests for diff.py "
+import json
+import re
+import responses
+from lacrm.api import Lacrm
+from lacrm.diff import SnapshotStore, diff_write
+from lacrm.metrics import Metrics
+
+try:
+    from urllib.parse import parse_qs
+except ImportError:
+    from urlparse import parse_qs
+
+CONTACT = {'ContactId': '7', 'FirstName': 'Ann', 'NumEmployees': '5',
+           'Title': None,
+           'CustomFields': [{'Name': 'Tier', 'Value': 'gold'},
+                            {'Name': 'Score', 'Value': '3'}]}
+
+
+def test_diff_write():
+    assert diff_write('EditContact', {'ContactId': '7', 'FirstName': 'Ann',
+                                      'NumEmployees': 5, 'Title': ''},
+                      CONTACT) is None
+
+    assert diff_write('EditContact', {'ContactId': '7', 'FirstName': 'Ann',
+                                      'LastName': 'Lee',
+                                      'CustomFields': {'Tier': 'gold',
+                                                       'Score': '4'}},
+                      CONTACT) == {'ContactId': '7', 'LastName': 'Lee',
+                                   'CustomFields': {'Score': '4'}}
+
+    # Notes are actions, so they are always sent
+    assert diff_write('UpdatePipelineItem',
+                      {'PipelineItemId': '9', 'Priority': '1',
+                       'Note': 'Called'},
+                      {'PipelineItemId': '9', 'Priority': '1'}) == {
+                          'PipelineItemId': '9', 'Note': 'Called'}
+
+
+def test_store_merges_writes_and_persists(tmpdir):
+    path = str(tmpdir.join('snapshots.json'))
+    store = SnapshotStore(path)
+    store.update('GetContact', {'ContactId': '7'}, {'Contact': CONTACT})
+    store.update('EditContact', {'ContactId': '7', 'FirstName': 'Bo',
+                                 'CustomFields': {'Score': '4'}}, {})
+    store.save()
+
+    restored = SnapshotStore(path).get('ContactId', '7')
+    assert restored['FirstName'] == 'Bo'
+    assert restored['CustomFields'] == {'Tier': 'gold', 'Score': '4'}
+
+    store.update('DeleteContact', {'ContactId': '7'}, {})
+    assert store.get('ContactId', '7') is None
+
+
+def test_store_without_path_saves_nothing(tmpdir):
+    store = SnapshotStore()
+    store.update('GetContact', {'ContactId': '7'}, {'Contact': CONTACT})
+    with tmpdir.as_cwd():
+        store.save()
+        assert tmpdir.listdir() == []
+
+
+class FakeApi(object):
+
+    def __init__(self):
+        self.sent = []
+
+    def __call__(self, request):
+        body = parse_qs(request.body)
+        function = body['Function'][0]
+        parameters = json.loads(body['Parameters'][0])
+        self.sent.append((function, parameters))
+        if function == 'GetContact':
+            return (200, {}, json.dumps({'Contact': CONTACT}))
+        return (200, {}, json.dumps({'Success': True}))
+
+
+@responses.activate
+def test_edits_send_only_changes():
+    api = FakeApi()
+    responses.add_callback(
+        responses.POST, re.compile('^https://api.lessannoyingcrm.com.*$'),
+        callback=api)
+    store = SnapshotStore()
+    metrics = Metrics()
+    lacrm = Lacrm(user_code='1234', api_token='abcdef', snapshots=store,
+                  metrics=metrics)
+
+    # Nothing known yet: the whole write goes out and becomes the snapshot
+    lacrm.edit_contact('8', {'FirstName': 'Cy', 'Title': 'CEO'})
+    assert lacrm.edit_contact('8', {'FirstName': 'Cy', 'Title': 'CEO'},
+                              raw_response=True) == {'Success': True,
+                                                     'Skipped': True}
+
+    lacrm.get_contact('7')
+    lacrm.edit_contact('7', {'FirstName': 'Ann',
+                             'CustomFields': {'Tier': 'silver'}})
+    lacrm.edit_contact('7', {'CustomFields': {'Tier': 'silver'}})
+
+    assert [sent for sent in api.sent if sent[0] == 'EditContact'] == [
+        ('EditContact', {'ContactId': '8', 'FirstName': 'Cy',
+                         'Title': 'CEO'}),
+        ('EditContact', {'ContactId': '7',
+                         'CustomFields': {'Tier': 'silver'}})]
+    assert store.stats() == {'records': 2, 'sent': 2, 'skipped': 2}
+    assert lacrm.stats()['EditContact']['skipped_writes'] == 2
+
+
+@responses.activate
+def test_supplied_snapshot():
+    api = FakeApi()
+    responses.add_callback(
+        responses.POST, re.compile('^https://api.lessannoyingcrm.com.*$'),
+        callback=api)
+    lacrm = Lacrm(user_code='1234', api_token='abcdef')
+
+    lacrm.update_pipeline('9', {'Priority': 2},
+                          snapshot={'PipelineItemId': '9', 'Priority': '2'})
+    lacrm.update_pipeline('9', {'Priority': 3},
+                          snapshot={'PipelineItemId': '9', 'Priority': '2'})
+
+    assert api.sent == [('UpdatePipelineItem', {'PipelineItemId': '9',
+                                                'Priority': 3})]
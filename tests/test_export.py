@@ -0,0 +1,172 @@
+" Tests for export.py "
+import csv
+import json
+import pytest
+from lacrm.export import export_contacts, export_pipeline, guess_format, main
+from lacrm.pagination import PagePlan, fetch_pages, note_request_time
+from lacrm.utils import LacrmArgumentError
+
+
+class FakeLacrm(object):
+    """ Serves pages from memory, optionally failing at a record offset
+
+    Requests at an offset in ``slow_at`` report a 10s request time.
+    """
+
+    def __init__(self, contacts, fail_at=None, page_size=3, slow_at=()):
+        self.contacts = list(contacts)
+        self.fail_at = fail_at
+        self.page_size = page_size
+        self.slow_at = set(slow_at)
+        self.requested = []
+
+    def _pages(self, concurrency, plan):
+        def fetch_page(page):
+            start = (page - 1) * plan.page_size
+            if start == self.fail_at:
+                raise IOError('connection reset')
+            self.requested.append(page)
+            note_request_time(10.0 if start in self.slow_at else 0.0)
+            return self.contacts[start:start + plan.page_size]
+
+        return fetch_pages(fetch_page, self.page_size, concurrency, plan=plan)
+
+    def iter_contacts(self, params=None, concurrency=1, pages=False,
+                      plan=None):
+        return self._pages(concurrency, plan)
+
+    def iter_pipeline_report(self, pipeline_id, status=None, concurrency=1,
+                             pages=False, plan=None):
+        return self._pages(concurrency, plan)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def contact(i, **fields):
+    record = {'ContactId': str(i), 'FirstName': 'First%d' % i,
+              'Email': [{'Text': 'user%d@example.com' % i}]}
+    record.update(fields)
+    return record
+
+
+def read_ndjson(path):
+    with open(str(path)) as lines:
+        return [json.loads(line) for line in lines]
+
+
+def test_guess_format():
+    assert guess_format('out.jsonl') == 'ndjson'
+    assert guess_format('OUT.CSV') == 'csv'
+    assert guess_format('dump.parquet') == 'parquet'
+    with pytest.raises(LacrmArgumentError):
+        guess_format('contacts.txt')
+
+
+def test_export_contacts_ndjson(tmpdir):
+    contacts = [contact(i) for i in range(8)]
+    path = tmpdir.join('contacts.ndjson')
+
+    summary = export_contacts(FakeLacrm(contacts), str(path))
+
+    assert summary['records'] == 8
+    assert read_ndjson(path) == contacts
+
+
+def test_interrupted_export_resumes_after_last_page(tmpdir):
+    contacts = [contact(i) for i in range(10)]
+    path = tmpdir.join('contacts.ndjson')
+    checkpoint = str(tmpdir.join('contacts.ckpt'))
+
+    with pytest.raises(IOError):
+        export_contacts(FakeLacrm(contacts, fail_at=6), str(path),
+                        checkpoint=checkpoint)
+    assert len(read_ndjson(path)) == 6
+    # A partly written page beyond the checkpoint is discarded on resume
+    with open(str(path), 'a') as output:
+        output.write('{"ContactId": "torn')
+
+    client = FakeLacrm(contacts)
+    summary = export_contacts(client, str(path), checkpoint=checkpoint)
+
+    assert client.requested == [3, 4]
+    assert summary['resumed_after'] == 6
+    assert summary['records'] == 10
+    assert read_ndjson(path) == contacts
+
+    # A finished checkpoint does not stop the next export
+    client = FakeLacrm(contacts[:4])
+    summary = export_contacts(client, str(path), checkpoint=checkpoint)
+    assert client.requested == [1, 2]
+    assert summary == dict(summary, resumed_after=0, records=4)
+    assert read_ndjson(path) == contacts[:4]
+
+
+def test_resume_after_pages_shrank(tmpdir, monkeypatch):
+    monkeypatch.setattr('lacrm.export.PagePlan', lambda **kwargs: PagePlan(
+        target_latency=1.0, min_page_size=5, **kwargs))
+    contacts = [contact(i) for i in range(100)]
+    path = tmpdir.join('contacts.ndjson')
+    checkpoint = str(tmpdir.join('contacts.ckpt'))
+
+    # The first page is slow, so pages drop to 10 records, then grow back
+    # to 20 once aligned; the export fails at record 60
+    with pytest.raises(IOError):
+        export_contacts(FakeLacrm(contacts, fail_at=60, page_size=20,
+                                  slow_at=[0]), str(path),
+                        checkpoint=checkpoint)
+    assert len(read_ndjson(path)) == 60
+
+    client = FakeLacrm(contacts, page_size=20)
+    summary = export_contacts(client, str(path), checkpoint=checkpoint)
+
+    assert client.requested[0] == 4
+    assert summary['records'] == 100
+    assert read_ndjson(path) == contacts
+
+
+def test_checkpoint_for_another_export_is_rejected(tmpdir):
+    checkpoint = str(tmpdir.join('ckpt'))
+    with pytest.raises(IOError):
+        export_contacts(FakeLacrm([contact(i) for i in range(5)], fail_at=3),
+                        str(tmpdir.join('a.ndjson')), checkpoint=checkpoint)
+
+    with pytest.raises(LacrmArgumentError):
+        export_pipeline(FakeLacrm([]), '3848', str(tmpdir.join('b.ndjson')),
+                        checkpoint=checkpoint)
+
+
+def test_export_pipeline_csv_resumes(tmpdir):
+    items = [{'PipelineItemId': str(i), 'Status': 'Open',
+              'CustomFields': {'Tier': i}} for i in range(7)]
+    items[5]['Late'] = 'yes'
+    path = tmpdir.join('pipeline.csv')
+    checkpoint = str(tmpdir.join('pipeline.ckpt'))
+
+    with pytest.raises(IOError):
+        export_pipeline(FakeLacrm(items, fail_at=3), '3848', str(path),
+                        checkpoint=checkpoint)
+    export_pipeline(FakeLacrm(items), '3848', str(path), checkpoint=checkpoint)
+
+    with open(str(path)) as rows:
+        rows = list(csv.DictReader(rows))
+    assert [row['PipelineItemId'] for row in rows] == [str(i) for i in range(7)]
+    assert json.loads(rows[2]['CustomFields']) == {'Tier': 2}
+    assert json.loads(rows[5]['_extra']) == {'Late': 'yes'}
+    assert rows[0]['_extra'] == ''
+
+
+def test_main_exports_contacts(tmpdir, monkeypatch, capsys):
+    contacts = [contact(i) for i in range(4)]
+    monkeypatch.setattr('lacrm.export.client_from_args',
+                        lambda args: FakeLacrm(contacts))
+    path = str(tmpdir.join('contacts.ndjson'))
+
+    main(['contacts', path])
+
+    assert read_ndjson(path) == contacts
+    assert json.load(open(path + '.checkpoint'))['done'] is True
+    assert 'Exported 4 records' in capsys.readouterr().out
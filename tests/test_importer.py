@@ -0,0 +1,158 @@
+" Tests for importer.py "
+import json
+import threading
+import pytest
+from lacrm import Lacrm
+from lacrm.importer import import_contacts, main, row_to_contact
+from lacrm.utils import LacrmArgumentError
+
+
+class RecordingLacrm(Lacrm):
+    """ Validates like Lacrm but creates contacts in memory """
+
+    def __init__(self, fail_names=(), no_id_names=()):
+        Lacrm.__init__(self, user_code='ABC', api_token='123')
+        self.fail_names = fail_names
+        self.no_id_names = no_id_names
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def _call_api(self, api_method, parameters, raw_response=False,
+                  **kwargs):
+        assert raw_response
+        if parameters.get('FirstName') in self.fail_names:
+            raise IOError('connection reset')
+        if parameters.get('FirstName') in self.no_id_names:
+            return {'Success': False}
+        with self._lock:
+            self.sent.append(parameters)
+            return {'Success': True, 'ContactId': str(1000 + len(self.sent))}
+
+
+def write_csv(tmpdir, lines):
+    path = tmpdir.join('contacts.csv')
+    path.write('\n'.join(lines) + '\n')
+    return str(path)
+
+
+def read_results(path):
+    with open(path) as lines:
+        return [json.loads(line) for line in lines]
+
+
+def test_row_to_contact():
+    row = {'FirstName': 'Ada', 'E-mail': 'ada@example.com', 'Phone': '',
+           'CustomFields.Tier': 'gold', 'Plan': 'pro'}
+
+    data = row_to_contact(row, {'E-mail': 'Email',
+                                'Plan': 'CustomFields.Plan'})
+
+    assert data == {'FirstName': 'Ada',
+                    'Email': [{'Text': 'ada@example.com', 'Type': 'Work'}],
+                    'CustomFields': {'Tier': 'gold', 'Plan': 'pro'}}
+
+
+def test_import_creates_contacts_and_logs_ids(tmpdir):
+    path = write_csv(tmpdir, ['FirstName,LastName,CustomFields.Tier']
+                     + ['First{0},Last{0},gold'.format(i) for i in range(20)])
+    results = str(tmpdir.join('results'))
+    lacrm = RecordingLacrm()
+
+    summary = import_contacts(lacrm, path, results, concurrency=4)
+
+    assert summary == {'total': 20, 'created': 20, 'skipped': 0,
+                       'failed': 0, 'invalid': 0}
+    assert len(lacrm.sent) == 20
+    assert lacrm.sent[0]['CustomFields'] == {'Tier': 'gold'}
+    logged = read_results(results)
+    assert sorted(entry['row'] for entry in logged) == list(range(1, 21))
+    assert all(entry['ContactId'] for entry in logged)
+
+
+def test_invalid_rows_stop_import_before_sending(tmpdir):
+    path = write_csv(tmpdir, ['FirstName,Colour', 'Ada,', 'Bob,blue'])
+    lacrm = RecordingLacrm()
+
+    with pytest.raises(LacrmArgumentError) as error:
+        import_contacts(lacrm, path, str(tmpdir.join('results')))
+
+    assert 'row 2' in str(error.value)
+    assert lacrm.sent == []
+
+    summary = import_contacts(lacrm, path, str(tmpdir.join('results')),
+                              skip_invalid=True)
+    assert summary['created'] == 1
+    assert summary['invalid'] == 1
+    assert [data['FirstName'] for data in lacrm.sent] == ['Ada']
+
+
+def test_rerun_skips_rows_already_created(tmpdir):
+    path = tmpdir.join('contacts.ndjson')
+    path.write('\n'.join(json.dumps({'FirstName': name})
+                         for name in ['Ada', 'Bob', 'Cy']) + '\n')
+    results = str(tmpdir.join('results'))
+
+    summary = import_contacts(RecordingLacrm(fail_names=['Bob']), str(path),
+                              results)
+    assert (summary['created'], summary['failed']) == (2, 1)
+
+    lacrm = RecordingLacrm()
+    summary = import_contacts(lacrm, str(path), results)
+
+    assert [data['FirstName'] for data in lacrm.sent] == ['Bob']
+    assert (summary['created'], summary['skipped']) == (1, 2)
+
+
+def test_main_reports_invalid_rows(tmpdir, monkeypatch, capsys):
+    path = write_csv(tmpdir, ['Colour', 'blue'])
+    monkeypatch.setattr('lacrm.importer.client_from_args',
+                        lambda args: RecordingLacrm())
+
+    with pytest.raises(SystemExit):
+        main([path])
+
+    assert 'Colour' in capsys.readouterr().err
+
+
+def test_a_response_without_a_contact_id_is_an_error(tmpdir):
+    path = write_csv(tmpdir, ['FirstName', 'Ada', 'Bob'])
+    results = str(tmpdir.join('results'))
+
+    summary = import_contacts(RecordingLacrm(no_id_names=['Bob']), path,
+                              results)
+
+    assert (summary['created'], summary['failed']) == (1, 1)
+    logged = sorted(read_results(results), key=lambda entry: entry['row'])
+    assert logged[0] == {'row': 1, 'ContactId': '1001'}
+    assert logged[1]['row'] == 2 and 'ContactId' in logged[1]['error']
+
+
+def test_malformed_rows_are_invalid(tmpdir):
+    path = tmpdir.join('contacts.ndjson')
+    path.write('{"FirstName": "Ada"}\n{"FirstName": \n[1, 2]\n'
+               '{"FirstName": "Cy"}\n')
+    results = str(tmpdir.join('results'))
+
+    with pytest.raises(LacrmArgumentError) as error:
+        import_contacts(RecordingLacrm(), str(path), results)
+    assert 'row 2' in str(error.value) and 'row 3' in str(error.value)
+
+    summary = import_contacts(RecordingLacrm(), str(path), results,
+                              skip_invalid=True)
+    assert (summary['created'], summary['invalid']) == (2, 2)
+    errors = dict((entry['row'], entry['error'])
+                  for entry in read_results(results) if 'error' in entry)
+    assert sorted(errors) == [2, 3]
+    assert 'not a JSON object' in errors[3]
+
+
+def test_csv_rows_with_extra_cells_are_invalid(tmpdir):
+    path = write_csv(tmpdir, ['FirstName,LastName', 'Ada,Lovelace',
+                              'Bob,Smith,oops'])
+    results = str(tmpdir.join('results'))
+
+    summary = import_contacts(RecordingLacrm(), path, results,
+                              skip_invalid=True)
+
+    assert (summary['created'], summary['invalid']) == (1, 1)
+    assert 'more cells' in read_results(results)[0]['error']
@@ -0,0 +1,114 @@
+" Tests for index.py "
+import json
+import re
+import pytest
+import responses
+from lacrm.api import Lacrm
+from lacrm.index import ContactIndex
+from lacrm.utils import LacrmArgumentError
+
+try:
+    from urllib.parse import parse_qs
+except ImportError:
+    from urlparse import parse_qs
+
+CONTACTS = [
+    {'ContactId': '1', 'Email': [{'Text': 'Ann@Example.com', 'Type': 'Work'}],
+     'Phone': [{'Text': '(555) 010-2000', 'Type': 'Work'}],
+     'CompanyName': 'Acme  Corp'},
+    {'ContactId': '2', 'Email': 'bob@example.com'},
+]
+
+
+def test_find_normalizes():
+    index = ContactIndex()
+    index.add_contacts(CONTACTS)
+
+    assert index.find({'Email': ' ann@example.COM'}) == '1'
+    assert index.find({'Phone': '555.010.2000'}, ('Phone',)) == '1'
+    assert index.find({'CompanyName': 'acme corp'}, ('CompanyName',)) == '1'
+    assert index.find({'Email': 'nobody@example.com',
+                       'Phone': '5550102000'}, ('Email', 'Phone')) == '1'
+    assert index.find({'Email': 'bob@example.com'}, ('Phone',)) is None
+
+    with pytest.raises(LacrmArgumentError):
+        index.find({}, ('FirstName',))
+
+
+def test_writes_update_index():
+    index = ContactIndex()
+    index.add_contacts(CONTACTS)
+
+    index.update('EditContact', {'ContactId': '2', 'Email': 'rob@example.com',
+                                 'FirstName': 'Rob'}, {})
+    assert index.find({'Email': 'bob@example.com'}) is None
+    assert index.find({'Email': 'rob@example.com'}) == '2'
+
+    index.update('CreateContact', {'Email': 'cy@example.com'},
+                 {'ContactId': '3', 'Success': True})
+    assert index.find({'Email': 'cy@example.com'}) == '3'
+
+    index.update('DeleteContact', {'ContactId': '1'}, {})
+    assert '1' not in index
+    assert index.find({'Phone': '5550102000'}, ('Phone',)) is None
+
+
+class FakeApi(object):
+    """ Serves a contact listing and records every request """
+
+    def __init__(self):
+        self.functions = []
+        self.next_id = 100
+
+    def __call__(self, request):
+        body = parse_qs(request.body)
+        function = body['Function'][0]
+        self.functions.append(function)
+        if function == 'SearchContacts':
+            return (200, {}, json.dumps({'Result': CONTACTS}))
+        if function == 'CreateContact':
+            self.next_id += 1
+            return (200, {}, json.dumps({'ContactId': str(self.next_id),
+                                         'Success': True}))
+        return (200, {}, json.dumps({'Success': True}))
+
+
+@responses.activate
+def test_upsert_contact():
+    api = FakeApi()
+    responses.add_callback(
+        responses.POST, re.compile('^https://api.lessannoyingcrm.com.*$'),
+        callback=api)
+    lacrm = Lacrm(user_code='1234', api_token='abcdef', index=ContactIndex())
+
+    assert lacrm.upsert_contact({'Email': 'ANN@example.com',
+                                 'FirstName': 'Ann'}) == ('1', False)
+    assert lacrm.upsert_contact({'Email': 'new@example.com'}) == ('101', True)
+    assert lacrm.upsert_contact({'Email': 'new@example.com',
+                                 'LastName': 'Lee'}) == ('101', False)
+    assert api.functions == ['SearchContacts', 'EditContact',
+                             'CreateContact', 'EditContact']
+
+    with pytest.raises(LacrmArgumentError):
+        Lacrm(user_code='1234', api_token='abcdef').upsert_contact({})
+
+
+@responses.activate
+def test_upsert_contacts_creates_each_new_contact_once():
+    api = FakeApi()
+    responses.add_callback(
+        responses.POST, re.compile('^https://api.lessannoyingcrm.com.*$'),
+        callback=api)
+    lacrm = Lacrm(user_code='1234', api_token='abcdef', index=ContactIndex())
+
+    report = lacrm.upsert_contacts([{'Email': 'new@example.com'},
+                                    {'Email': 'bob@example.com'},
+                                    {'Email': 'New@example.com'},
+                                    {'NotAField': 'x'}], concurrency=4)
+
+    assert report.summary() == {'total': 4, 'succeeded': 3, 'failed': 1}
+    assert [result.operation[0] for result in report] == [
+        'create_contact', 'edit_contact', 'edit_contact', 'upsert']
+    assert report.results[2].operation[1] == '101'
+    assert sorted(api.functions) == ['CreateContact', 'EditContact',
+                                     'EditContact', 'SearchContacts']
@@ -0,0 +1,77 @@
+" Tests for metrics.py "
+import re
+import pytest
+import requests
+import responses
+from lacrm.api import Lacrm
+from lacrm.cache import ResponseCache
+from lacrm.metrics import Hooks, Metrics
+from lacrm.ratelimit import RetryPolicy
+
+
+def test_unknown_event_rejected():
+    with pytest.raises(ValueError):
+        Hooks().add('whenever', lambda *args: None)
+
+
+def test_hooks_emit_and_remove():
+    hooks = Hooks()
+    seen = []
+    hooks.add('cache_hit', seen.append)
+    assert hooks
+    hooks.emit('cache_hit', 'GetContact')
+    hooks.remove('cache_hit', seen.append)
+    hooks.emit('cache_hit', 'GetContact')
+    assert seen == ['GetContact']
+    assert not hooks
+
+
+@responses.activate
+def test_metrics_per_function():
+    url = re.compile('^https://api.lessannoyingcrm.com.*$')
+    responses.add(responses.POST, url, status=503)
+    responses.add(responses.POST, url, json={'Contact': 'x'})
+    responses.add(responses.POST, url, json={'NoteId': '1'})
+    responses.add(responses.POST, url, body=requests.ConnectionError())
+
+    conn = Lacrm(user_code="1234", api_token="abcdef", metrics=Metrics(),
+                 cache=ResponseCache(), retry=RetryPolicy(backoff=0,
+                                                          max_retries=1))
+    conn.get_contact('1')
+    conn.get_contact('1')
+    conn.create_note('1', 'hi')
+    with pytest.raises(requests.ConnectionError):
+        conn.create_note('1', 'hi')
+
+    stats = conn.stats()
+    get_contact = stats['GetContact']
+    assert get_contact['calls'] == 2
+    assert get_contact['errors'] == 1
+    assert get_contact['retries'] == 1
+    assert get_contact['cache_hits'] == 1
+    assert get_contact['status_codes'] == {503: 1, 200: 1}
+    assert get_contact['request_bytes'] > 0
+    assert get_contact['response_bytes'] == len('{"Contact": "x"}')
+    assert get_contact['latency']['count'] == 2
+    assert stats['CreateNote']['calls'] == 2
+    assert stats['CreateNote']['errors'] == 1
+
+
+@responses.activate
+def test_custom_hooks():
+    responses.add(
+        responses.POST,
+        re.compile('^https://api.lessannoyingcrm.com.*$'),
+        json={'Contact': 'x'}
+    )
+
+    conn = Lacrm(user_code="1234", api_token="abcdef")
+    before = []
+    after = []
+    conn.add_hook('before_request', lambda method, payload: before.append(
+        payload['Function']))
+    conn.add_hook('after_response', after.append)
+    conn.get_contact('1')
+    assert before == ['GetContact']
+    assert after[0].status_code == 200
+    assert conn.stats() == {}
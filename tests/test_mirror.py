@@ -0,0 +1,138 @@
+" Tests for mirror.py "
+import pytest
+from lacrm.mirror import ContactMirror
+
+
+class FakeLacrm(object):
+    """ Serves contacts and pipeline items from memory """
+
+    def __init__(self, contacts, items=()):
+        self.contacts = list(contacts)
+        self.items = list(items)
+        self.first_pages = []
+
+    def iter_contacts(self, params=None, concurrency=1, pages=False):
+        page = params['Page']
+        self.first_pages.append(page)
+        while True:
+            chunk = self.contacts[(page - 1) * 500:page * 500]
+            yield chunk
+            if len(chunk) < 500:
+                return
+            page += 1
+
+    def iter_pipeline_report(self, pipeline_id, status=None, concurrency=1,
+                             pages=False):
+        for item in self.items:
+            yield item
+
+
+def contact(i, **fields):
+    record = {'ContactId': str(i), 'FirstName': 'First%d' % i,
+              'CompanyName': 'Co%d' % (i % 3),
+              'Email': [{'Text': 'User%d@Example.com' % i, 'Type': 'Work'}],
+              'Phone': [{'Text': '555-%04d' % i, 'Type': 'Work'}],
+              'CustomFields': {'Tier': 'gold' if i % 2 else 'silver'}}
+    record.update(fields)
+    return record
+
+
+@pytest.fixture
+def mirror():
+    lacrm = FakeLacrm([contact(i) for i in range(1200)])
+    mirror = ContactMirror(lacrm)
+    mirror.sync_contacts()
+    yield mirror
+    mirror.close()
+
+
+def test_full_load(mirror):
+    assert mirror.count_contacts() == 1200
+    assert mirror.get_contact('7')['FirstName'] == 'First7'
+
+
+def test_lookups(mirror):
+    assert [c['ContactId'] for c in
+            mirror.find_by_email('user42@example.com')] == ['42']
+    assert [c['ContactId'] for c in mirror.find_by_phone('555-0042')] == ['42']
+    assert len(mirror.find_by_company('Co1')) == 400
+    assert len(mirror.find_by_custom_field('Tier', 'gold')) == 600
+
+
+def test_phones_match_by_digits(mirror):
+    assert [c['ContactId'] for c in mirror.find_by_phone('(555) 0042')] == \
+        ['42']
+    assert mirror.find_by_phone('ext.') == []
+
+
+def test_custom_field_values_are_text_in_both_forms():
+    lacrm = FakeLacrm([
+        contact(1, CustomFields={'Seats': 5}),
+        contact(2, CustomFields=[{'Name': 'Seats', 'Value': 5}])])
+    mirror = ContactMirror(lacrm)
+    mirror.sync_contacts()
+
+    assert [c['ContactId'] for c in
+            mirror.find_by_custom_field('Seats', '5')] == ['1', '2']
+    assert len(mirror.find_by_custom_field('Seats', 5)) == 2
+    mirror.close()
+
+
+def test_phones_stored_unnormalized_are_migrated(tmpdir):
+    path = str(tmpdir.join('mirror.db'))
+    mirror = ContactMirror(FakeLacrm([contact(1)]), path)
+    mirror.sync_contacts()
+    mirror._conn.execute("UPDATE contact_phones SET phone = '555-0001'")
+    mirror._conn.commit()
+    mirror.close()
+
+    mirror = ContactMirror(FakeLacrm([]), path)
+    assert [c['ContactId'] for c in mirror.find_by_phone('5550001')] == ['1']
+    mirror.close()
+
+
+def test_incremental_sync_fetches_tail(mirror):
+    lacrm = mirror.lacrm
+    lacrm.contacts.extend(contact(i) for i in range(1200, 1250))
+    assert mirror.sync_contacts() < 1250
+    assert lacrm.first_pages[-1] == 2
+    assert mirror.count_contacts() == 1250
+
+
+def test_scheduled_full_sync_picks_up_edits_and_deletions():
+    clock = [1000.0]
+    lacrm = FakeLacrm([contact(i) for i in range(1200)])
+    mirror = ContactMirror(lacrm, full_sync_every=600,
+                           clock=lambda: clock[0])
+    mirror.sync_contacts()
+
+    lacrm.contacts[7] = contact(7, FirstName='Edited')
+    del lacrm.contacts[42]
+    clock[0] += 300
+    mirror.sync_contacts()
+    assert lacrm.first_pages[-1] == 2
+    assert mirror.get_contact('7')['FirstName'] == 'First7'
+
+    clock[0] += 300
+    mirror.sync_contacts()
+    assert lacrm.first_pages[-1] == 1
+    assert mirror.get_contact('7')['FirstName'] == 'Edited'
+    assert mirror.get_contact('42') is None
+    assert mirror.count_contacts() == 1199
+    mirror.close()
+
+
+def test_full_sync_removes_deleted(mirror):
+    mirror.lacrm.contacts = mirror.lacrm.contacts[:10]
+    mirror.sync_contacts(full=True)
+    assert mirror.count_contacts() == 10
+    assert mirror.find_by_email('user42@example.com') == []
+
+
+def test_pipeline_items():
+    items = [{'PipelineItemId': str(i), 'ContactId': str(i % 5),
+              'Status': 'Open' if i % 2 else 'Won'} for i in range(20)]
+    mirror = ContactMirror(FakeLacrm([], items))
+    assert mirror.sync_pipeline('p1') == 20
+    assert len(mirror.pipeline_items('p1', status='Won')) == 10
+    assert len(mirror.pipeline_items(contact_id='3')) == 4
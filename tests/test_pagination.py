@@ -0,0 +1,194 @@
+" Tests for pagination.py "
+import threading
+import pytest
+from lacrm.pagination import PagePlan, fetch_pages, note_request_time
+
+
+def make_fetcher(total, page_size):
+    requested = []
+    lock = threading.Lock()
+
+    def fetch_page(page):
+        with lock:
+            requested.append(page)
+        start = (page - 1) * page_size
+        return list(range(total))[start:start + page_size]
+
+    return fetch_page, requested
+
+
+@pytest.mark.parametrize('concurrency', [1, 2, 8])
+def test_pages_in_order(concurrency):
+    fetch_page, _ = make_fetcher(23, 5)
+    pages = list(fetch_pages(fetch_page, 5, concurrency))
+    assert [r for page in pages for r in page] == list(range(23))
+    assert len(pages) == 5
+
+
+def test_exact_multiple_ends_on_empty_page():
+    fetch_page, requested = make_fetcher(10, 5)
+    pages = list(fetch_pages(fetch_page, 5))
+    assert pages[-1] == []
+    assert requested == [1, 2, 3]
+
+
+def test_speculative_pages_are_dropped():
+    fetch_page, requested = make_fetcher(7, 5)
+    pages = list(fetch_pages(fetch_page, 5, concurrency=4))
+    assert len(pages) == 2
+    assert len(requested) >= 2
+
+
+def test_errors_propagate():
+    def fetch_page(page):
+        if page == 2:
+            raise ValueError(page)
+        return [page] * 5
+
+    with pytest.raises(ValueError):
+        list(fetch_pages(fetch_page, 5, concurrency=3))
+
+
+def test_deadline_cancels_prefetches():
+    import time
+    from lacrm.utils import Deadline, LacrmTimeoutError
+    requested = []
+
+    def fetch_page(page):
+        requested.append(page)
+        time.sleep(0.05 * page)
+        return [page] * 5
+
+    with pytest.raises(LacrmTimeoutError):
+        list(fetch_pages(fetch_page, 5, concurrency=2,
+                         deadline=Deadline(0.12)))
+    assert len(requested) < 5
+
+
+def test_deadline_sequential():
+    from lacrm.utils import Deadline, LacrmTimeoutError
+    with pytest.raises(LacrmTimeoutError):
+        list(fetch_pages(lambda page: [page] * 5, 5, deadline=Deadline(0)))
+
+
+def sized_fetcher(total, plan, latency=None):
+    """ Serves ``plan.page_size`` records per page, with a fake clock """
+
+    requested = []
+    clock = [0.0]
+
+    def fetch_page(page):
+        size = plan.page_size
+        requested.append((page, size))
+        if latency is not None:
+            clock[0] += latency(size)
+        start = (page - 1) * size
+        return list(range(total))[start:start + size]
+
+    plan._clock = lambda: clock[0]
+    return fetch_page, requested
+
+
+def test_known_total_skips_the_empty_page():
+    plan = PagePlan(total=10)
+    fetch_page, requested = sized_fetcher(10, plan)
+    pages = list(fetch_pages(fetch_page, 5, plan=plan))
+
+    assert [r for page in pages for r in page] == list(range(10))
+    assert [page for page, _ in requested] == [1, 2]
+    assert plan.progress()['done'] and plan.fraction == 1.0
+
+
+def test_known_total_limits_prefetching():
+    plan = PagePlan(total=12)
+    fetch_page, requested = sized_fetcher(12, plan)
+    plan.observe_total({'Result': [], 'TotalCount': 12})
+    pages = list(fetch_pages(fetch_page, 5, concurrency=8, plan=plan))
+
+    assert [r for page in pages for r in page] == list(range(12))
+    assert sorted(page for page, _ in requested) == [1, 2, 3]
+
+
+def test_slow_pages_shrink_and_recover(monkeypatch):
+    import lacrm.pagination
+    slow = [True]
+    plan = PagePlan(adaptive=True, target_latency=1.0, min_page_size=25)
+    fetch_page, requested = sized_fetcher(
+        2000, plan, latency=lambda size: size * (0.004 if slow[0] else 0.0005))
+    monkeypatch.setattr(lacrm.pagination, '_clock', plan._clock)
+
+    records = []
+    for page in fetch_pages(fetch_page, 500, plan=plan):
+        records.extend(page)
+        if len(records) >= 750:
+            slow[0] = False
+
+    assert records == list(range(2000))
+    sizes = [size for _, size in requested]
+    assert sizes[:3] == [500, 250, 250]
+    assert max(sizes[3:]) == 500
+
+
+def test_eta_from_progress():
+    clock = [0.0]
+    plan = PagePlan(adaptive=False, total=1000, clock=lambda: clock[0])
+    plan.start(100)
+    assert plan.eta is None
+    clock[0] = 2.0
+    plan.record(100)
+    assert plan.records_per_second == 50
+    assert plan.eta == 18
+
+
+def test_page_sizes_are_fixed_by_default():
+    plan = PagePlan()
+    fetch_page, requested = sized_fetcher(1200, plan, latency=lambda size: 60)
+    pages = list(fetch_pages(fetch_page, 500, plan=plan))
+
+    assert [r for page in pages for r in page] == list(range(1200))
+    assert [size for _, size in requested] == [500, 500, 500]
+
+
+def test_waits_outside_the_request_do_not_shrink_pages(monkeypatch):
+    import lacrm.pagination
+    plan = PagePlan(adaptive=True, target_latency=1.0)
+    fetch_page, requested = sized_fetcher(1200, plan, latency=lambda size: 30)
+    monkeypatch.setattr(lacrm.pagination, '_clock', plan._clock)
+
+    def rate_limited_page(page):
+        records = fetch_page(page)
+        note_request_time(0.2)
+        return records
+
+    list(fetch_pages(rate_limited_page, 500, plan=plan))
+    assert [size for _, size in requested] == [500, 500, 500]
+
+
+def test_only_an_explicit_total_ends_a_listing():
+    plan = PagePlan().start(500)
+    plan.observe_total({'Result': [], 'Count': 500, 'Total': 500})
+    assert plan.total is None
+    plan.observe_total({'Result': [], 'TotalCount': 1200})
+    assert plan.total == 1200
+
+
+def test_restarting_a_plan_resets_progress():
+    plan = PagePlan()
+    fetch_page, _ = sized_fetcher(30, plan)
+    list(fetch_pages(fetch_page, 25, plan=plan))
+    assert plan.done and plan.records == 30
+
+    plan.start(25)
+    assert (plan.pages, plan.records, plan.offset) == (0, 0, 0)
+    assert not plan.done
+
+
+@pytest.mark.parametrize('concurrency', [1, 3])
+def test_offset_resumes_on_an_aligned_page_size(concurrency):
+    plan = PagePlan(offset=625)
+    fetch_page, requested = sized_fetcher(1200, plan)
+    pages = list(fetch_pages(fetch_page, 500, concurrency, plan=plan))
+
+    assert [r for page in pages for r in page] == list(range(625, 1200))
+    assert min(requested) == (6, 125)
+    assert plan.records == 575
@@ -0,0 +1,139 @@
+" Tests for pool.py "
+import threading
+import time
+import pytest
+from lacrm import LacrmPool
+from lacrm.credentials import CredentialStore
+
+
+class FakeResponse(object):
+    status_code = 200
+    headers = {}
+    content = b'{"Contact": {"ContactId": "1"}}'
+
+
+class FakeSession(object):
+    """ Records the credentials and concurrency of every post """
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.posted = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def post(self, url, data=None, timeout=None, stream=False):
+        with self._lock:
+            self.posted.append(data['UserCode'])
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return FakeResponse()
+
+    def close(self):
+        pass
+
+
+def make_pool(tmpdir, **kwargs):
+    path = tmpdir.join('accounts.ini')
+    path.write('[acme]\nuser_code = ACME1\napi_token = t1\nrate_limit = 7\n'
+               '[globex]\nuser_code = GLOBEX1\napi_token = t2\n')
+    return LacrmPool(accounts_file=str(path),
+                     credentials=CredentialStore(environ={}), **kwargs)
+
+
+def test_clients_are_per_account_and_reused(tmpdir):
+    session = FakeSession()
+    pool = make_pool(tmpdir, session=session, rate_limit=20)
+
+    acme = pool['acme']
+    assert pool.client('acme') is acme
+    assert pool['globex'] is not acme
+    assert pool.accounts() == ['acme', 'globex']
+
+    acme.get_contact('1')
+    pool['globex'].get_contact('1')
+    assert session.posted == ['ACME1', 'GLOBEX1']
+    assert acme.rate_limiter.rate == 7
+    assert pool['globex'].rate_limiter.rate == 20
+
+
+def test_registered_accounts(tmpdir):
+    pool = make_pool(tmpdir, session=FakeSession())
+    pool.register('initech', 'INIT1', 't3')
+
+    assert pool['initech'].payload['UserCode'] == 'INIT1'
+    assert 'initech' in pool.accounts()
+
+
+def test_global_concurrency_cap(tmpdir):
+    session = FakeSession(delay=0.05)
+    pool = make_pool(tmpdir, session=session, max_concurrency=2)
+    for index in range(6):
+        pool.register(str(index), 'USER%d' % index, 'token')
+
+    threads = [threading.Thread(target=pool[str(index)].get_contact,
+                                args=('1',)) for index in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(session.posted) == 6
+    assert session.peak == 2
+
+
+def test_client_options_are_passed_to_every_client(tmpdir):
+    from lacrm.ratelimit import RetryPolicy
+    retry = RetryPolicy()
+    pool = make_pool(tmpdir, session=FakeSession(), retry=retry,
+                     timeout=(1, 2))
+
+    assert pool['acme'].retry is retry
+    assert pool['globex'].timeout == (1, 2)
+
+
+def test_per_account_options_are_refused(tmpdir):
+    from lacrm.index import ContactIndex
+    with pytest.raises(TypeError):
+        make_pool(tmpdir, index=ContactIndex())
+    with pytest.raises(TypeError):
+        make_pool(tmpdir, colaesce=False)
+
+
+def test_a_shared_cache_is_kept_per_account(tmpdir):
+    from lacrm.cache import ResponseCache
+    session = FakeSession()
+    pool = make_pool(tmpdir, session=session, cache=ResponseCache())
+
+    pool['acme'].get_contact('1')
+    pool['globex'].get_contact('1')
+    pool['acme'].get_contact('1')
+    assert session.posted == ['ACME1', 'GLOBEX1']
+
+
+def test_rate_limit_factory_builds_one_limiter_per_account(tmpdir):
+    from lacrm.ratelimit import TokenBucket
+    pool = make_pool(tmpdir, session=FakeSession(),
+                     rate_limit=lambda: TokenBucket(3))
+    pool.register('initech', 'INIT1', 't3')
+
+    assert pool['globex'].rate_limiter.rate == 3
+    assert pool['globex'].rate_limiter is not pool['initech'].rate_limiter
+    assert pool['acme'].rate_limiter.rate == 7
+
+    with pytest.raises(TypeError):
+        make_pool(tmpdir, rate_limit=TokenBucket(3))
+
+
+def test_close_closes_every_client(tmpdir):
+    pool = make_pool(tmpdir, session=FakeSession())
+    closed = []
+    for name in ('acme', 'globex'):
+        pool[name].close = lambda name=name: closed.append(name)
+
+    pool.close()
+    assert sorted(closed) == ['acme', 'globex']
+    assert len(pool) == 0
@@ -0,0 +1,213 @@
+" Tests for ratelimit.py "
+import re
+import pytest
+import requests
+import responses
+from lacrm.api import Lacrm
+from lacrm.ratelimit import (TokenBucket, RetryPolicy, HedgePolicy,
+                             CircuitBreaker)
+from lacrm.utils import BaseLacrmError, LacrmCircuitOpenError
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def test_bucket_allows_burst_then_waits():
+    clock = FakeClock()
+    bucket = TokenBucket(10, burst=2, clock=clock, sleep=clock.sleep)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1)
+    clock.now = 1.0
+    assert bucket.reserve() == 0
+
+
+def test_bucket_adapts_to_throttling():
+    bucket = TokenBucket(10)
+    bucket.throttled()
+    assert bucket.rate == 5
+    bucket.throttled()
+    bucket.throttled()
+    bucket.throttled()
+    bucket.throttled()
+    assert bucket.rate == bucket.min_rate
+    for _ in range(40):
+        bucket.succeeded()
+    assert bucket.rate == 10
+
+
+def test_retry_policy():
+    policy = RetryPolicy(max_retries=2)
+    assert policy.should_retry(0, True, 500)
+    assert policy.should_retry(0, True, None)
+    assert not policy.should_retry(2, True, 500)
+    assert not policy.should_retry(0, True, 404)
+    assert not policy.should_retry(0, False, 500)
+    assert policy.should_retry(0, False, 429)
+    assert policy.delay(0, retry_after='3') == 3
+    assert 0 <= policy.delay(3) <= 4
+
+
+@pytest.mark.parametrize('retry_after', ['-5', 'nan', 'inf', '-inf', 'soon'])
+def test_unusable_retry_after_is_not_trusted(retry_after):
+    policy = RetryPolicy(backoff=0.5, max_backoff=30)
+    delay = policy.delay(1, retry_after=retry_after)
+    if retry_after == '-5':
+        assert delay == 0
+    else:
+        assert 0 <= delay <= 1
+
+
+@pytest.fixture
+def retrying_conn():
+    return Lacrm(user_code="1234", api_token="abcdef",
+                 retry=RetryPolicy(max_retries=2, backoff=0), rate_limit=1000)
+
+
+@responses.activate
+def test_read_retries_until_success(retrying_conn):
+    url = re.compile('^https://api.lessannoyingcrm.com.*$')
+    responses.add(responses.POST, url, status=502)
+    responses.add(responses.POST, url, body=requests.ConnectionError())
+    responses.add(responses.POST, url, json={'Contact': 'ok'})
+
+    assert retrying_conn.get_contact('1') == 'ok'
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_retries_are_bounded(retrying_conn):
+    url = re.compile('^https://api.lessannoyingcrm.com.*$')
+    responses.add(responses.POST, url, status=500)
+
+    with pytest.raises(BaseLacrmError):
+        retrying_conn.get_contact('1')
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_writes_only_retry_throttling(retrying_conn):
+    url = re.compile('^https://api.lessannoyingcrm.com.*$')
+    responses.add(responses.POST, url, status=500)
+
+    with pytest.raises(BaseLacrmError):
+        retrying_conn.create_note('1', 'note')
+    assert len(responses.calls) == 1
+
+    responses.replace(responses.POST, url, status=429)
+    with pytest.raises(BaseLacrmError):
+        retrying_conn.create_note('1', 'note')
+    assert len(responses.calls) == 4
+    assert retrying_conn.rate_limiter.rate < 1000
+
+
+def test_hedge_delay_follows_percentile():
+    policy = HedgePolicy(percentile=0.9, min_delay=0.01, max_delay=1.0,
+                         min_samples=10)
+    assert policy.delay('GetContact') == 1.0
+    for index in range(100):
+        policy.observe('GetContact', index / 1000.0)
+    assert policy.delay('GetContact') == pytest.approx(0.09)
+    assert policy.delay('SearchContacts') == 1.0
+
+
+def test_breaker_opens_and_recovers():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=10, clock=clock)
+    for status in (500, 200, 503, None, 502):
+        assert breaker.allow()
+        breaker.record(status, error=status is None)
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+    assert breaker.retry_after() == 10
+
+    clock.now = 10
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record(500)
+    assert breaker.state == 'open'
+
+    clock.now = 20
+    assert breaker.allow()
+    breaker.record(200)
+    assert breaker.stats() == {'state': 'closed', 'consecutive_failures': 0,
+                               'times_opened': 2, 'rejected': 2}
+
+
+@responses.activate
+def test_open_breaker_fails_fast():
+    responses.add(responses.POST,
+                  re.compile('^https://api.lessannoyingcrm.com.*$'),
+                  status=503)
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+    conn = Lacrm(user_code='1234', api_token='abcdef', breaker=breaker,
+                 retry=RetryPolicy(backoff=0))
+
+    with pytest.raises(LacrmCircuitOpenError):
+        conn.get_contact('1')
+    with pytest.raises(LacrmCircuitOpenError):
+        conn.create_note('1', 'hi')
+    assert len(responses.calls) == 2
+    assert breaker.state == 'open'
+
+
+def half_open_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10, clock=clock)
+    breaker.allow()
+    breaker.record(None, error=True)
+    clock.now += 10
+    assert breaker.state == 'half_open'
+    return breaker
+
+
+@responses.activate
+@pytest.mark.parametrize('failure', ['hook', 'request', 'deadline'])
+def test_trial_is_released_when_an_attempt_raises(failure):
+    from lacrm.utils import Deadline, LacrmTimeoutError
+    responses.add(responses.POST,
+                  re.compile('^https://api.lessannoyingcrm.com.*$'),
+                  body=requests.exceptions.InvalidHeader('bad header'))
+    breaker = half_open_breaker()
+    conn = Lacrm(user_code='1234', api_token='abcdef', breaker=breaker,
+                 retry=RetryPolicy(max_retries=0))
+    kwargs = {}
+    if failure == 'hook':
+        def fail(*args):
+            raise RuntimeError('hook failed')
+        conn.add_hook('before_request', fail)
+    elif failure == 'deadline':
+        kwargs['deadline'] = Deadline(0)
+
+    with pytest.raises((RuntimeError, requests.RequestException,
+                        LacrmTimeoutError)):
+        conn._send('getContact', {}, **kwargs)
+    # The failed trial re-opened the breaker rather than wedging it
+    assert breaker.state == 'open'
+    assert breaker.stats()['consecutive_failures'] == 2
+
+
+def test_async_trial_is_released_when_a_hook_raises():
+    from tests.test_aio import async_conn, run
+    breaker = half_open_breaker()
+    conn = async_conn(['"ok"'], breaker=breaker)
+
+    def fail(*args):
+        raise RuntimeError('hook failed')
+    conn.add_hook('before_request', fail)
+
+    with pytest.raises(RuntimeError):
+        run(conn._send('getContact', {}))
+    assert breaker.state == 'open'
@@ -0,0 +1,96 @@
+" Tests for records.py "
+import json
+import pickle
+import re
+import tracemalloc
+import responses
+from lacrm.api import Lacrm
+from lacrm.codec import iter_json_array
+from lacrm.records import Contact, PipelineItem, to_records
+
+
+def contact(i):
+    return {'ContactId': str(i), 'FirstName': 'First%d' % i,
+            'Email': [{'Text': 'user%d@example.com' % i, 'Type': 'Work'}],
+            'Phone': [{'Text': '555-%04d' % i, 'Type': 'Mobile'}],
+            'Address': [{'Street': '%d Main St' % i, 'City': 'Springfield',
+                         'Zip': '62701', 'Type': 'Work'}],
+            'CustomFields': {'Tier': 'gold', 'Score': str(i)}}
+
+
+def test_dict_style_access_is_lazy():
+    record = Contact.from_dict(contact(1))
+    assert not record.is_decoded
+    assert record['FirstName'] == 'First1'
+    assert record.is_decoded
+    assert record.get('Missing') is None
+    assert 'Email' in record
+    assert record == contact(1)
+    assert contact(1) == record
+    assert record.to_dict() == contact(1)
+    assert record._raw is None
+    assert json.loads(record.raw) == contact(1)
+
+
+def test_typed_accessors():
+    record = Contact.from_dict(contact(2))
+    assert record.contact_id == '2'
+    assert record.emails == ['user2@example.com']
+    assert record.phones == ['555-0002']
+    assert record.custom_fields == {'Tier': 'gold', 'Score': '2'}
+
+    item = PipelineItem.from_dict({'PipelineItemId': '9', 'ContactId': '2',
+                                   'Status': 'Won', 'Priority': 'High'})
+    assert (item.pipeline_item_id, item.contact_id, item.status,
+            item.priority) == ('9', '2', 'Won', 'High')
+
+
+def test_pickle_round_trip():
+    record = Contact.from_dict(contact(3))
+    record['ContactId']
+    restored = pickle.loads(pickle.dumps(record))
+    assert not restored.is_decoded
+    assert restored == record
+
+
+def test_to_records():
+    assert to_records('SearchContacts', [contact(1)])[0].contact_id == '1'
+    assert isinstance(to_records('GetContact', contact(1)), Contact)
+    assert to_records('CreateNote', 'abc') == 'abc'
+
+
+def test_records_are_smaller_than_dicts():
+    payload = json.dumps([contact(i) for i in range(2000)])
+
+    tracemalloc.start()
+    dicts = json.loads(payload)
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    raw_items = list(iter_json_array([('{"Result": %s}' % payload).encode()],
+                                     raw=True))
+    tracemalloc.start()
+    records = [Contact(raw) for raw in raw_items]
+    record_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    assert records == dicts
+    assert record_bytes * 2 < dict_bytes
+
+
+@responses.activate
+def test_listing_records():
+    url = re.compile('^https://api.lessannoyingcrm.com.*$')
+    responses.add(responses.POST, url,
+                  json={'Result': [contact(i) for i in range(3)]})
+
+    conn = Lacrm(user_code="1234", api_token="abcdef")
+    contacts = conn.get_all_contacts(records=True)
+    assert [c.contact_id for c in contacts] == ['0', '1', '2']
+    assert all(isinstance(c, Contact) for c in contacts)
+
+    streamed = list(conn.iter_contacts(stream=True, records=True))
+    assert streamed == [contact(i) for i in range(3)]
+    assert isinstance(streamed[0], Contact)
+
+    assert isinstance(conn.search_contacts('x', records=True)[0], Contact)
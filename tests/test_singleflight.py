@@ -0,0 +1,102 @@
+" Tests for singleflight.py "
+import threading
+import pytest
+from lacrm.singleflight import SingleFlight
+from lacrm.utils import Deadline, LacrmTimeoutError
+
+
+def run_concurrently(flight, key, func, callers):
+    results = [None] * callers
+    started = threading.Barrier(callers)
+
+    def call(index):
+        started.wait()
+        try:
+            results[index] = flight.do(key, func)
+        except Exception as error:  # pylint: disable=broad-except
+            results[index] = error
+
+    threads = [threading.Thread(target=call, args=(i,))
+               for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_key_ignores_parameter_order():
+    assert SingleFlight.key('GetContact', {'a': 1, 'b': 2}) == \
+        SingleFlight.key('GetContact', {'b': 2, 'a': 1})
+    assert SingleFlight.key('GetContact', {'a': 1}) != \
+        SingleFlight.key('SearchContacts', {'a': 1})
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def func():
+        calls.append(1)
+        release.wait(5)
+        return {'Contact': 'x'}
+
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    results = run_concurrently(flight, ('GetContact', '1'), func, 4)
+
+    assert calls == [1]
+    assert results == [{'Contact': 'x'}] * 4
+    assert len(set(id(result) for result in results)) == 4
+    assert flight.stats() == {'saved': 3, 'in_flight': 0}
+
+
+def test_errors_are_shared_and_not_remembered():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def func():
+        release.wait(5)
+        raise IOError('connection reset')
+
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    results = run_concurrently(flight, ('GetContact', '1'), func, 3)
+
+    assert all(isinstance(result, IOError) for result in results)
+    assert flight.do(('GetContact', '1'), lambda: 'fresh') == 'fresh'
+
+
+def test_waiter_gives_up_at_its_deadline():
+    flight = SingleFlight()
+    key = ('GetContact', '1')
+    call, leader = flight.join(key)
+    assert leader
+
+    with pytest.raises(LacrmTimeoutError):
+        flight.do(key, lambda: 'unused', deadline=Deadline(0.05))
+
+    flight.finish(key, call, 'late')
+    call.done.set()
+    assert flight.in_flight() == 0
+
+
+def test_invalidate_starts_a_new_call():
+    flight = SingleFlight()
+    key = ('GetContact', '1')
+    stale, leader = flight.join(key)
+    assert leader
+
+    flight.invalidate()
+    fresh, leader = flight.join(key)
+    assert leader and fresh is not stale
+    assert flight.join(key) == (fresh, False)
+
+    # The stale leader finishing does not release the fresh call
+    flight.finish(key, stale, 'old')
+    stale.done.set()
+    assert flight.in_flight() == 1
+    flight.finish(key, fresh, 'new')
+    fresh.done.set()
+    assert flight.in_flight() == 0
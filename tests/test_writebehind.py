@@ -0,0 +1,140 @@
+" Tests for writebehind.py "
+import json
+import threading
+import time
+import pytest
+from lacrm import Lacrm
+from lacrm.utils import LacrmArgumentError
+from lacrm.writebehind import WriteBehind
+
+
+class RecordingLacrm(Lacrm):
+    """ Validates like Lacrm but records calls instead of sending them """
+
+    def __init__(self, delay=0, gate=None):
+        Lacrm.__init__(self, user_code='ABC', api_token='123')
+        self.delay = delay
+        self.gate = gate
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def _call_api(self, api_method, parameters, **kwargs):
+        if self.gate is not None:
+            self.gate.wait(5)
+        time.sleep(self.delay)
+        if parameters.get('Note') == 'fail':
+            raise IOError('connection reset')
+        with self._lock:
+            self.sent.append((api_method, parameters))
+            return str(len(self.sent))
+
+
+def test_submit_returns_futures():
+    lacrm = RecordingLacrm()
+    with WriteBehind(lacrm, workers=2) as writer:
+        ok = writer.submit('create_note', '1', 'hello')
+        bad = writer.submit('create_note', '1', 'fail')
+        assert writer.flush(timeout=5)
+
+    assert ok.result() in ('1', '2')
+    assert isinstance(bad.exception(), IOError)
+    assert writer.stats() == {'pending': 0, 'completed': 1, 'failed': 1}
+
+
+def test_invalid_operations_raise_on_submit():
+    with WriteBehind(RecordingLacrm()) as writer:
+        with pytest.raises(LacrmArgumentError):
+            writer.submit('create_contact', {'NotAField': 'x'})
+
+
+def test_same_contact_runs_in_order():
+    lacrm = RecordingLacrm(delay=0.001)
+    with WriteBehind(lacrm, workers=4) as writer:
+        for index in range(20):
+            writer.submit('create_note', str(index % 3), 'note %d' % index)
+
+    for contact_id in '012':
+        notes = [parameters['Note'] for _, parameters in lacrm.sent
+                 if parameters['ContactId'] == contact_id]
+        assert notes == sorted(notes, key=lambda note: int(note.split()[1]))
+        assert len(notes) == len(range(int(contact_id), 20, 3))
+
+
+def test_pending_operations_survive_a_restart(tmpdir):
+    spool = str(tmpdir.join('writes.spool'))
+    gate = threading.Event()
+    writer = WriteBehind(RecordingLacrm(gate=gate), spool=spool, workers=1)
+    writer.submit('create_note', '1', 'first')
+    writer.submit('edit_contact', '1', {'FirstName': 'Ada'})
+    writer.close(drain=False, timeout=0.1)
+
+    with open(spool) as lines:
+        assert len([json.loads(line) for line in lines]) == 2
+    gate.set()
+
+    lacrm = RecordingLacrm()
+    with WriteBehind(lacrm, spool=spool) as writer:
+        assert [future.result(5) for future in writer.recovered] == ['1', '2']
+
+    assert [api_method for api_method, _ in lacrm.sent] == \
+        ['CreateNote', 'EditContact']
+    with open(spool) as lines:
+        assert lines.read() == ''
+
+
+def test_replay_keeps_unsent_operations_spooled(tmpdir, monkeypatch):
+    spool = str(tmpdir.join('writes.spool'))
+    writer = WriteBehind(RecordingLacrm(gate=threading.Event()), spool=spool,
+                         workers=1)
+    for index in range(3):
+        writer.submit('create_note', str(index), 'note %d' % index)
+    writer.close(drain=False, timeout=0.1)
+
+    gate = threading.Event()
+
+    class FirstOnlyLacrm(RecordingLacrm):
+        def _call_api(self, api_method, parameters, **kwargs):
+            if parameters['Note'] != 'note 0':
+                gate.wait(5)
+            return RecordingLacrm._call_api(self, api_method, parameters)
+
+    enqueue = WriteBehind._enqueue
+
+    def slow_enqueue(self, *args):
+        # Lets each replayed operation finish before the next is queued
+        future = enqueue(self, *args)
+        time.sleep(0.05)
+        return future
+
+    monkeypatch.setattr(WriteBehind, '_enqueue', slow_enqueue)
+    writer = WriteBehind(FirstOnlyLacrm(), spool=spool, workers=3)
+    assert writer.recovered[0].result(5) == '1'
+
+    with open(spool) as lines:
+        ids = [json.loads(line)['id'] for line in lines
+               if 'method' in json.loads(line)]
+    assert ids == [0, 1, 2]
+    gate.set()
+    writer.close()
+
+
+def test_closed_writer_rejects_work():
+    writer = WriteBehind(RecordingLacrm())
+    writer.close()
+    with pytest.raises(Exception):
+        writer.submit('create_note', '1', 'late')
+
+
+def test_spool_is_emptied_when_idle_without_flush(tmpdir):
+    import os
+    spool = str(tmpdir.join('writes.spool'))
+    writer = WriteBehind(RecordingLacrm(), spool=spool, workers=2)
+    futures = [writer.submit('create_note', str(i), 'hi') for i in range(10)]
+    for future in futures:
+        future.result(5)
+
+    deadline = time.time() + 5
+    while os.path.getsize(spool) and time.time() < deadline:
+        time.sleep(0.01)
+    assert os.path.getsize(spool) == 0
+    writer.close()